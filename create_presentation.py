@@ -158,7 +158,7 @@ add_content_slide(
         "🐍 Python Flask – RAG API server",
         "🧠 Groq API – High-speed inference (Llama 3.3 70b)",
         "🤖 Google Generative AI – Language models",
-        "📄 PyPDF2 – PDF parsing",
+        "📄 pypdf – PDF parsing",
         "📰 GNews API – Real-time news"
     ]
 )
@@ -1,6 +1,6 @@
 // check-ingest-pdfs.js - Check and run PDF ingestion if needed
 import { spawn } from 'child_process';
-import { existsSync, readdirSync, statSync } from 'fs';
+import { existsSync, readdirSync, readFileSync, statSync } from 'fs';
 import { join, dirname } from 'path';
 import { fileURLToPath } from 'url';
 
@@ -32,37 +32,38 @@ console.log(`📄 Found ${pdfFiles.length} PDF file(s):`);
 pdfFiles.forEach(pdf => console.log(`   - ${pdf}`));
 console.log('');
 
-// Check if ChromaDB exists and has data
+// Compare the PDFs on disk with the ingestion manifest written by ingest_pdfs.py.
+// Ingestion is incremental, so it only needs to run when something changed.
+const manifestPath = join(chromaDbFolder, 'ingest_manifest.json');
 let needsIngestion = false;
 
-if (!existsSync(chromaDbFolder)) {
+if (!existsSync(manifestPath)) {
   needsIngestion = true;
-  console.log('📚 ChromaDB not found. PDFs need to be ingested...');
+  console.log('📚 No ingestion manifest found. PDFs need to be ingested...');
 } else {
-  // Check if ChromaDB has files
   try {
-    const hasFiles = (dir) => {
-      const files = readdirSync(dir);
-      for (const file of files) {
-        const fullPath = join(dir, file);
-        const stat = statSync(fullPath);
-        if (stat.isFile()) return true;
-        if (stat.isDirectory() && hasFiles(fullPath)) return true;
-      }
-      return false;
-    };
-    
-    if (!hasFiles(chromaDbFolder)) {
-      needsIngestion = true;
-      console.log('📚 ChromaDB is empty. PDFs need to be ingested...');
-    } else {
+    const manifest = JSON.parse(readFileSync(manifestPath, 'utf8'));
+    const indexed = manifest.documents || {};
+    const changed = pdfFiles.filter(file => {
+      const entry = indexed[file];
+      if (!entry) return true;
+      const stat = statSync(join(pdfFolder, file), { bigint: true });
+      // mtime_ns exceeds JS number precision, so compare in milliseconds
+      const mtimeMs = Number(stat.mtimeNs / 1000000n);
+      return entry.size !== Number(stat.size) || Math.abs(entry.mtime_ns / 1e6 - mtimeMs) > 1;
+    });
+    const removed = Object.keys(indexed).filter(file => !pdfFiles.includes(file));
+
+    if (changed.length === 0 && removed.length === 0) {
       console.log('✅ PDFs already indexed in ChromaDB');
       console.log('✅ Skipping ingestion\n');
       process.exit(0);
     }
+    needsIngestion = true;
+    console.log(`📚 ${changed.length} new/changed and ${removed.length} deleted PDF(s) need indexing...`);
   } catch (error) {
     needsIngestion = true;
-    console.log('⚠️  Error checking ChromaDB. Will re-ingest...');
+    console.log('⚠️  Error reading ingestion manifest. Will re-check all PDFs...');
   }
 }
 
@@ -70,7 +71,7 @@ if (needsIngestion) {
   console.log('\n========================================');
   console.log('  🚀 Running PDF Ingestion');
   console.log('========================================\n');
-  console.log('⏱️  This may take a few minutes...\n');
+  console.log('⏱️  Only new or changed PDFs are processed...\n');
 
   // Run Python ingestion script
   const pythonProcess = spawn('python', ['ingest_pdfs.py'], {
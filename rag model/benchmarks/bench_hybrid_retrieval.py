@@ -0,0 +1,104 @@
+"""
+Benchmark: retrieval quality and latency of hybrid (BM25 + vector, RRF) vs vector-only.
+
+Runs against an ingested document in chroma_db with the real embedding model.
+Queries come from the document itself: for each sampled chunk, its most
+distinctive terms (highest tf-idf) form a keyword query, mimicking exam-style
+lookups such as "TCP three-way handshake". The chunk a query was taken from
+counts as the relevant result. A JSON file of hand-written queries can be
+added with --queries: [{"query": "...", "expected": "substring of the right chunk"}].
+
+Reports hit rate@k, MRR@k and p50/p95 latency for both modes.
+
+Usage:
+    python benchmarks/bench_hybrid_retrieval.py --pdf hrm.pdf --samples 200
+"""
+
+import os
+import sys
+import json
+import math
+import random
+import argparse
+import statistics
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import retrieve
+import lexical_index
+
+def keyword_queries(texts, samples, terms_per_query, rng):
+    """(query, relevant chunk text) pairs built from each chunk's highest tf-idf terms"""
+    tokenized = [Counter(lexical_index.tokenize(text)) for text in texts]
+    df = Counter(term for counts in tokenized for term in counts)
+    count = len(texts)
+    picked = rng.sample(range(count), min(samples, count))
+    queries = []
+    for i in picked:
+        counts = tokenized[i]
+        ranked = sorted(counts, key=lambda t: counts[t] * math.log(count / df[t]), reverse=True)
+        terms = [t for t in ranked if not t.isdigit()][:terms_per_query]
+        if len(terms) == terms_per_query:
+            queries.append((" ".join(terms), texts[i]))
+    return queries
+
+def evaluate(queries, pdf_name, k, hybrid):
+    hits, reciprocal_ranks, latencies = 0, [], []
+    for query, is_relevant in queries:
+        started = time.perf_counter()
+        results = retrieve.get_relevant_context(query, subject_filter=pdf_name, k=k, hybrid=hybrid)
+        latencies.append((time.perf_counter() - started) * 1000)
+        rank = next((r for r, doc in enumerate(results, 1) if is_relevant(doc.page_content)), None)
+        if rank is not None:
+            hits += 1
+            reciprocal_ranks.append(1 / rank)
+        else:
+            reciprocal_ranks.append(0.0)
+    latencies.sort()
+    return {
+        "hit_rate": round(hits / len(queries), 3),
+        "mrr": round(statistics.mean(reciprocal_ranks), 3),
+        "p50_ms": round(latencies[len(latencies) // 2], 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", required=True, help="ingested PDF name")
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--terms", type=int, default=3, help="terms per generated query")
+    parser.add_argument("--queries", help="JSON file of hand-written queries")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    name = retrieve.collection_name_for(args.pdf)
+    if lexical_index.load_index(name) is None:
+        sys.exit(f"{args.pdf} has no lexical index; run ingest_pdfs.py first")
+    collection = retrieve.get_chroma_client().get_collection(retrieve.document_collection(args.pdf))
+    texts = collection.get(include=["documents"])["documents"]
+
+    rng = random.Random(args.seed)
+    queries = [(query, lambda content, expected=text: content == expected)
+               for query, text in keyword_queries(texts, args.samples, args.terms, rng)]
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            for item in json.load(f):
+                expected = item["expected"].lower()
+                queries.append((item["query"], lambda content, expected=expected: expected in content.lower()))
+
+    retrieve.warm_up()
+    # Warm the embedding cache so both modes pay the same (cached) query-embedding cost
+    for query, _ in queries:
+        retrieve.get_relevant_context(query, subject_filter=args.pdf, k=args.k, hybrid=False)
+
+    print(f"{len(queries)} queries over {len(texts)} chunks of {args.pdf}, k={args.k}")
+    print(f"{'mode':<10}{'hit@k':>8}{'MRR':>8}{'p50 ms':>10}{'p95 ms':>10}")
+    for label, hybrid in (("vector", False), ("hybrid", True)):
+        row = evaluate(queries, args.pdf, args.k, hybrid)
+        print(f"{label:<10}{row['hit_rate']:>8}{row['mrr']:>8}{row['p50_ms']:>10}{row['p95_ms']:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark: query latency vs corpus size, with and without per-document scoping.
+
+Builds synthetic corpora of random 384-dim unit vectors (the size of
+all-MiniLM-L6-v2 embeddings) split across documents, then times a k=5 query
+for one document using the three paths retrieve.get_relevant_context can take:
+
+  unscoped      one shared collection, over-fetch and post-filter by source
+  where-filter  one shared collection, filter pushed down to Chroma
+  per-document  the document's own collection (what ingest_pdfs.py writes)
+
+Usage:
+    python benchmarks/bench_scoped_retrieval.py --sizes 2000 10000 50000
+"""
+
+import argparse
+import shutil
+import statistics
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+
+DIM = 384
+K = 5
+FETCH_MULTIPLIER = 8
+ADD_BATCH = 5000
+
+
+def random_unit_vectors(rng, count):
+    vectors = rng.standard_normal((count, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def add_in_batches(collection, ids, vectors, metadatas):
+    for start in range(0, len(ids), ADD_BATCH):
+        end = start + ADD_BATCH
+        collection.add(
+            ids=ids[start:end],
+            embeddings=vectors[start:end].tolist(),
+            metadatas=metadatas[start:end],
+        )
+
+
+def time_queries(run_query, queries):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        run_query(query)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), max(timings)
+
+
+def bench_size(corpus_size, chunks_per_doc, query_count, rng):
+    doc_count = max(1, corpus_size // chunks_per_doc)
+    target = "doc_0.pdf"
+    vectors = random_unit_vectors(rng, corpus_size)
+    sources = [f"doc_{i % doc_count}.pdf" for i in range(corpus_size)]
+    ids = [f"chunk_{i}" for i in range(corpus_size)]
+    metadatas = [{"source": source} for source in sources]
+    queries = random_unit_vectors(rng, query_count).tolist()
+
+    db_dir = tempfile.mkdtemp(prefix="rag_bench_")
+    try:
+        client = chromadb.PersistentClient(path=db_dir)
+        shared = client.create_collection("shared")
+        add_in_batches(shared, ids, vectors, metadatas)
+
+        target_rows = [i for i, source in enumerate(sources) if source == target]
+        scoped = client.create_collection("doc_0")
+        add_in_batches(
+            scoped,
+            [ids[i] for i in target_rows],
+            vectors[target_rows],
+            [metadatas[i] for i in target_rows],
+        )
+
+        def unscoped(query):
+            result = shared.query(query_embeddings=[query], n_results=K * FETCH_MULTIPLIER)
+            return [m for m in result["metadatas"][0] if m["source"] == target][:K]
+
+        def where_filter(query):
+            return shared.query(query_embeddings=[query], n_results=K, where={"source": target})
+
+        def per_document(query):
+            return scoped.query(query_embeddings=[query], n_results=K)
+
+        row = {"corpus": corpus_size, "docs": doc_count, "doc_chunks": len(target_rows)}
+        for name, fn in (("unscoped", unscoped), ("where-filter", where_filter), ("per-document", per_document)):
+            fn(queries[0])  # load the index before timing
+            row[name] = time_queries(fn, queries)
+        return row
+    finally:
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2000, 10000, 50000],
+                        help="total chunks in the corpus")
+    parser.add_argument("--chunks-per-doc", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'corpus':>8} {'docs':>6} {'doc chunks':>10} | "
+          f"{'unscoped p50/max ms':>20} {'where p50/max ms':>18} {'per-doc p50/max ms':>19}")
+    for size in args.sizes:
+        row = bench_size(size, args.chunks_per_doc, args.queries, rng)
+        cells = [f"{row[name][0]:7.2f}/{row[name][1]:7.2f}" for name in ("unscoped", "where-filter", "per-document")]
+        print(f"{row['corpus']:>8} {row['docs']:>6} {row['doc_chunks']:>10} | "
+              f"{cells[0]:>20} {cells[1]:>18} {cells[2]:>19}")
+
+
+if __name__ == "__main__":
+    main()
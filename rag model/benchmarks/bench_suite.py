@@ -0,0 +1,398 @@
+"""
+Reproducible benchmark suite: ingestion, retrieval and end-to-end RAG latency.
+
+Runs offline on a CPU-only box against a scratch copy of the service, so
+pdfs/, chroma_db/ and the caches of the real install are never touched:
+
+1. the RAG modules are copied into a temp directory and a synthetic corpus
+   (benchmarks/synthetic_corpus.py) is generated into its pdfs/
+2. micro-benchmarks, in a fresh process: PDF parsing, chunking, embedding,
+   full ingestion (ingest_pdfs.py) and retrieval (hybrid, vector-only and
+   batched), with hit rate@k against the topic each query was built from
+3. end-to-end: serve.py on that copy, pointed at the deterministic Groq stub,
+   loaded with benchmarks/load_test.py across generate-answer, quick-answer
+   and generate-quiz (distinct topics, so the response cache never hits),
+   plus the server's own mean stage times from /api/rag/metrics and its
+   time from process start to the first served query
+
+Results are written as JSON: "metrics" are compared against a baseline,
+"counts" describe the run. With --baseline, every metric is checked against
+the stored value and the run exits with status 1 if any regressed by more
+than its threshold (--threshold, or per-metric/prefix overrides in the
+baseline's "thresholds", e.g. {"e2e.": 0.35}). Metrics ending in _per_s,
+rps or hit_rate regress when they drop, errors when they rise at all, and
+everything else (latencies) when it grows.
+
+The embedding model has to be in the Hugging Face cache already: the suite
+sets HF_HUB_OFFLINE=1 unless the environment says otherwise. Baselines are
+only comparable on the same machine with the same options; a config
+mismatch is reported.
+
+Usage:
+    python benchmarks/bench_suite.py --json results.json
+    python benchmarks/bench_suite.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_suite.py --baseline benchmarks/baseline.json   # exit 1 on regressions
+    python benchmarks/bench_suite.py --documents 20 --pages 60 --skip-e2e
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import http.client
+from datetime import datetime, timezone
+
+RAG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+SUITE_VERSION = 1
+DEFAULT_THRESHOLD = 0.20
+# Options that change what the numbers mean; a baseline recorded with others isn't comparable
+CONFIG_KEYS = ("documents", "pages", "pages_per_topic", "words_per_page", "seed", "queries", "k",
+               "embed_sample", "workers", "concurrency", "duration", "stub_latency_ms", "server_workers")
+
+def percentile_ms(values, fraction):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))] * 1000, 3)
+
+def suite_env(workdir, server_workers=None):
+    """Environment for the scratch service: offline, no state shared with the real install"""
+    env = {
+        "ANONYMIZED_TELEMETRY": "False",
+        "PYTHONHASHSEED": "0",
+        "RAG_EMBEDDING_CACHE_DIR": os.path.join(workdir, "embedding_cache"),
+        "RAG_PREGENERATED": "false",
+        "RAG_TRACE_LOG": "false",
+        "RAG_METRICS": "true",
+        "HF_HUB_OFFLINE": os.environ.get("HF_HUB_OFFLINE", "1"),
+        "TRANSFORMERS_OFFLINE": os.environ.get("TRANSFORMERS_OFFLINE", "1"),
+        "PYTHONPATH": os.pathsep.join(filter(None, [workdir, os.environ.get("PYTHONPATH")])),
+    }
+    if server_workers:
+        env["RAG_API_WORKERS"] = str(server_workers)
+    return env
+
+def prepare_workdir(workdir, args):
+    """Copy the service's modules and generate the corpus into its pdfs/"""
+    from synthetic_corpus import generate_corpus
+    for name in os.listdir(RAG_DIR):
+        if name.endswith(".py"):
+            shutil.copy2(os.path.join(RAG_DIR, name), workdir)
+    return generate_corpus(os.path.join(workdir, "pdfs"), args.documents, args.pages, args.pages_per_topic,
+                           args.words_per_page, args.seed)
+
+def topic_queries(corpus, count, seed):
+    """(pdf name, query, relevant pages) for a seeded sample of the corpus' topics"""
+    pairs = [(doc["name"], topic) for doc in corpus["documents"] for topic in doc["topics"]]
+    rng = random.Random(seed)
+    sample = rng.sample(pairs, min(count, len(pairs)))
+    return [(name, f"{topic['topic']} - {topic['terms'][2]} {topic['terms'][3]}", set(topic["pages"]))
+            for name, topic in sample]
+
+# -- micro-benchmarks (run inside the scratch copy, in their own process) -----
+
+def run_micro(workdir, config):
+    os.chdir(workdir)
+    sys.path.insert(0, workdir)
+    import page_text_store
+    import ingest_pdfs
+    import retrieve
+
+    with open(os.path.join(workdir, "pdfs", "corpus.json")) as f:
+        corpus = json.load(f)
+    paths = [os.path.join(workdir, "pdfs", doc["name"]) for doc in corpus["documents"]]
+    metrics, counts = {}, {}
+
+    started = time.perf_counter()
+    parsed = [page_text_store.extract_pages(path) for path in paths]
+    elapsed = time.perf_counter() - started
+    counts["pages"] = sum(len(texts) for texts, _ in parsed)
+    metrics["parse.pages_per_s"] = round(counts["pages"] / elapsed, 2)
+
+    splitter = ingest_pdfs.get_text_splitter()
+    started = time.perf_counter()
+    chunks = [doc for texts, metadatas in parsed for doc in splitter.create_documents(texts, metadatas)]
+    elapsed = time.perf_counter() - started
+    counts["chunks"] = len(chunks)
+    metrics["chunk.chunks_per_s"] = round(len(chunks) / elapsed, 2)
+
+    started = time.perf_counter()
+    embedding_function = retrieve.get_embedding_function()
+    metrics["embed.model_load_s"] = round(time.perf_counter() - started, 3)
+    # The model itself, not the embedding cache in front of it
+    model = getattr(embedding_function, "base", embedding_function)
+    sample = [doc.page_content for doc in chunks[:config["embed_sample"]]]
+    model.embed_documents(sample[:8])
+    started = time.perf_counter()
+    model.embed_documents(sample)
+    metrics["embed.chunks_per_s"] = round(len(sample) / (time.perf_counter() - started), 2)
+    started = time.perf_counter()
+    for text in sample[:50]:
+        model.embed_query(text[:200])
+    metrics["embed.query_ms"] = round((time.perf_counter() - started) / min(50, len(sample)) * 1000, 3)
+
+    started = time.perf_counter()
+    summary = ingest_pdfs.ingest_pdfs(workers=config["workers"])
+    elapsed = time.perf_counter() - started
+    if summary["failed"]:
+        raise RuntimeError(f"Ingestion failed for {summary['failed']}")
+    metrics["ingest.total_s"] = round(elapsed, 3)
+    metrics["ingest.pages_per_s"] = round(counts["pages"] / elapsed, 2)
+    counts["indexed_chunks"] = summary["chunks"]
+
+    retrieve.warm_up()
+    queries = topic_queries(corpus, config["queries"], config["seed"])
+    counts["queries"] = len(queries)
+    k = config["k"]
+    for mode, hybrid in (("hybrid", True), ("vector", False)):
+        retrieve.get_relevant_context(queries[0][1], subject_filter=queries[0][0], k=k, hybrid=hybrid)
+        latencies, hits = [], 0
+        for pdf_name, query, pages in queries:
+            started = time.perf_counter()
+            results = retrieve.get_relevant_context(query, subject_filter=pdf_name, k=k, hybrid=hybrid)
+            latencies.append(time.perf_counter() - started)
+            hits += any(doc.metadata.get("page") in pages for doc in results)
+        metrics[f"search.{mode}.p50_ms"] = percentile_ms(latencies, 0.50)
+        metrics[f"search.{mode}.p95_ms"] = percentile_ms(latencies, 0.95)
+        metrics[f"search.{mode}.hit_rate"] = round(hits / len(queries), 4)
+
+    by_pdf = {}
+    for pdf_name, query, _ in queries:
+        by_pdf.setdefault(pdf_name, []).append(query)
+    started = time.perf_counter()
+    for pdf_name, batch in by_pdf.items():
+        retrieve.get_relevant_contexts(batch, subject_filter=pdf_name, k=k)
+    metrics["search.batch.per_query_ms"] = round((time.perf_counter() - started) / len(queries) * 1000, 3)
+    return {"metrics": metrics, "counts": counts}
+
+def micro_benchmarks(workdir, config):
+    output = os.path.join(workdir, "micro.json")
+    log_path = os.path.join(workdir, "micro.log")
+    env = dict(os.environ, **suite_env(workdir))
+    with open(log_path, "w") as log:
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "--micro-worker", workdir,
+                                 "--micro-config", json.dumps(config), "--micro-output", output],
+                                cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    if result.returncode != 0:
+        with open(log_path) as log:
+            sys.exit(f"Micro-benchmarks failed:\n{log.read()[-4000:]}")
+    with open(output) as f:
+        return json.load(f)
+
+def ingest_only(workdir):
+    """Index the corpus for the end-to-end run when micro-benchmarks are skipped"""
+    env = dict(os.environ, **suite_env(workdir))
+    result = subprocess.run([sys.executable, "ingest_pdfs.py"], cwd=workdir, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    if result.returncode != 0:
+        sys.exit(f"Ingestion failed:\n{result.stdout[-4000:]}")
+
+# -- end-to-end load test ---------------------------------------------------------
+
+def server_stage_means(base_url):
+    """Mean seconds per (endpoint, stage) from the server's /api/rag/metrics (one worker's view)"""
+    host, port = base_url.rsplit("//", 1)[1].split(":")
+    conn = http.client.HTTPConnection(host, int(port), timeout=10)
+    conn.request("GET", "/api/rag/metrics")
+    sums, counts = {}, {}
+    for line in conn.getresponse().read().decode().splitlines():
+        if not line.startswith("rag_stage_duration_seconds_"):
+            continue
+        series, value = line.rsplit(" ", 1)
+        kind, _, labels = series[len("rag_stage_duration_seconds_"):].partition("{")
+        fields = dict(part.split("=", 1) for part in labels.rstrip("}").split(","))
+        key = (fields["endpoint"].strip('"'), fields.get("stage", "").strip('"'))
+        if kind == "sum":
+            sums[key] = float(value)
+        elif kind == "count":
+            counts[key] = float(value)
+    return {key: sums[key] / counts[key] for key in sums if counts.get(key)}
+
+def server_startup(base_url):
+    """Seconds from process start to each startup milestone, from /api/rag/health (one worker's view)"""
+    host, port = base_url.rsplit("//", 1)[1].split(":")
+    conn = http.client.HTTPConnection(host, int(port), timeout=10)
+    conn.request("GET", "/api/rag/health")
+    return json.loads(conn.getresponse().read()).get("startup", {})
+
+def end_to_end(workdir, corpus, args):
+    import load_test
+    document = corpus["documents"][0]
+    topics = [topic["topic"] for topic in document["topics"]]
+    _, stub_state, server = load_test.launch_server(args.port, 0, args.stub_latency_ms, no_cache=False,
+                                                    rag_dir=workdir, env=suite_env(workdir, args.server_workers))
+    base_url = f"http://127.0.0.1:{args.port}"
+    metrics, counts = {}, {}
+    try:
+        started = time.perf_counter()
+        if not load_test.wait_until_ready(base_url, timeout=300):
+            sys.exit(f"Server at {base_url} did not become ready")
+        metrics["e2e.startup_s"] = round(time.perf_counter() - started, 3)
+        report = load_test.run_load(base_url, list(load_test.ENDPOINTS), document["name"], args.concurrency,
+                                    args.duration, unique=True, topics=topics)
+        load_test.print_report(report)
+        for endpoint, row in report["endpoints"].items():
+            for field in ("p50_ms", "p95_ms", "rps", "errors"):
+                metrics[f"e2e.{endpoint}.{field}"] = row[field]
+            counts[f"e2e.{endpoint}.requests"] = row["requests"]
+        startup = server_startup(base_url)
+        if "first_query" in startup:
+            metrics["e2e.first_query_s"] = startup["first_query"]
+        for (endpoint, stage), seconds in sorted(server_stage_means(base_url).items()):
+            if endpoint != "background":
+                metrics[f"e2e.server.{endpoint}.{stage}_mean_ms"] = round(seconds * 1000, 3)
+        counts["groq_stub_requests"] = stub_state.requests
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+    return {"metrics": metrics, "counts": counts}
+
+# -- baseline comparison ------------------------------------------------------------
+
+def higher_is_better(name):
+    return name.endswith(("_per_s", ".rps", "hit_rate"))
+
+def threshold_for(name, overrides, default):
+    """Exact override, else the longest matching prefix, else default"""
+    if name in overrides:
+        return overrides[name]
+    prefixes = [prefix for prefix in overrides if name.startswith(prefix)]
+    return overrides[max(prefixes, key=len)] if prefixes else default
+
+def compare(results, baseline, default_threshold):
+    """Rows of (metric, baseline, current, change, threshold, regressed) for metrics in both"""
+    overrides = baseline.get("thresholds", {})
+    rows = []
+    for name, base in sorted(baseline.get("metrics", {}).items()):
+        current = results["metrics"].get(name)
+        if current is None or base is None:
+            continue
+        limit = threshold_for(name, overrides, default_threshold)
+        if name.endswith(".errors"):
+            rows.append((name, base, current, None, 0, current > base))
+            continue
+        change = (current - base) / base if base else 0.0
+        regressed = change < -limit if higher_is_better(name) else change > limit
+        rows.append((name, base, current, change, limit, regressed))
+    return rows
+
+def print_comparison(rows):
+    print(f"\n{'metric':<52}{'baseline':>12}{'current':>12}{'change':>9}{'limit':>7}")
+    for name, base, current, change, limit, regressed in rows:
+        change_text = f"{change:+.1%}" if change is not None else "-"
+        flag = "  REGRESSED" if regressed else ""
+        print(f"{name:<52}{base:>12}{current:>12}{change_text:>9}{limit:>7.0%}{flag}")
+
+# -- main -----------------------------------------------------------------------------
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAG_DIR, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "git_commit": commit, "rag_env": {k: v for k, v in os.environ.items() if k.startswith("RAG_")}}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=30, help="pages per document")
+    parser.add_argument("--pages-per-topic", type=int, default=2)
+    parser.add_argument("--words-per-page", type=int, default=350)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--queries", type=int, default=100, help="retrieval queries in the micro-benchmarks")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--embed-sample", type=int, default=512, help="chunks embedded for embed.chunks_per_s")
+    parser.add_argument("--workers", type=int, default=1, help="ingest_pdfs.py parse workers")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20, help="seconds of end-to-end load")
+    parser.add_argument("--stub-latency-ms", type=float, default=50)
+    parser.add_argument("--server-workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=5057)
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--skip-e2e", action="store_true")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against this results file; exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed relative regression when the baseline sets none (default 0.2)")
+    parser.add_argument("--save-baseline", help="write the results as a baseline (keeps its thresholds)")
+    parser.add_argument("--keep-workdir", action="store_true")
+    parser.add_argument("--micro-worker", help=argparse.SUPPRESS)
+    parser.add_argument("--micro-config", help=argparse.SUPPRESS)
+    parser.add_argument("--micro-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.micro_worker:
+        result = run_micro(args.micro_worker, json.loads(args.micro_config))
+        with open(args.micro_output, "w") as f:
+            json.dump(result, f)
+        return
+
+    config = {key: getattr(args, key) for key in CONFIG_KEYS}
+    results = {"suite_version": SUITE_VERSION, "created_at": datetime.now(timezone.utc).isoformat(),
+               "config": config, "environment": environment(), "metrics": {}, "counts": {}}
+    workdir = tempfile.mkdtemp(prefix="rag_bench_suite_")
+    try:
+        corpus = prepare_workdir(workdir, args)
+        print(f"[BENCH] Corpus: {args.documents} documents x {args.pages} pages in {workdir}")
+        if not args.skip_micro:
+            print("[BENCH] Micro-benchmarks: parse, chunk, embed, ingest, search")
+            part = micro_benchmarks(workdir, config)
+            results["metrics"].update(part["metrics"])
+            results["counts"].update(part["counts"])
+        if not args.skip_e2e:
+            if args.skip_micro:
+                ingest_only(workdir)
+            print(f"[BENCH] End-to-end: {args.concurrency} clients for {args.duration:g}s against the Groq stub")
+            part = end_to_end(workdir, corpus, args)
+            results["metrics"].update(part["metrics"])
+            results["counts"].update(part["counts"])
+    finally:
+        if args.keep_workdir:
+            print(f"[BENCH] Scratch copy kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    for name, value in sorted(results["metrics"].items()):
+        print(f"{name:<52}{value:>12}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        mismatched = {key: (baseline.get("config", {}).get(key), value) for key, value in config.items()
+                      if baseline.get("config", {}).get(key) != value}
+        if mismatched:
+            print(f"\n[BENCH] Warning: baseline was recorded with other options (baseline, now): {mismatched}")
+        rows = compare(results, baseline, args.threshold)
+        print_comparison(rows)
+        regressed = [row[0] for row in rows if row[5]]
+        if regressed:
+            print(f"\n[BENCH] {len(regressed)} regression(s): {', '.join(regressed)}")
+            exit_code = 1
+        else:
+            print(f"\n[BENCH] No regressions in {len(rows)} metrics")
+    if args.save_baseline:
+        thresholds = {}
+        if os.path.exists(args.save_baseline):
+            with open(args.save_baseline) as f:
+                thresholds = json.load(f).get("thresholds", {})
+        with open(args.save_baseline, "w") as f:
+            json.dump(dict(results, thresholds=thresholds), f, indent=2)
+        print(f"[BENCH] Baseline written to {args.save_baseline}")
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Benchmark: recall@k, query latency and memory of the vector backends.
+
+Builds one synthetic document of clustered 384-dim unit vectors (the size
+of all-MiniLM-L6-v2 embeddings) with ~1KB of text per chunk, then searches
+it with:
+
+  chroma-ef<N>    a Chroma collection (HNSW), what ingest_pdfs.py writes,
+                  searched with hnsw:search_ef=N (--chroma-ef; Chroma's
+                  default, what the service uses today, is 10)
+  mmap-float32    vector_index, float32, exact NumPy scan
+  mmap-int8       vector_index, int8 + per-vector scale, exact NumPy scan
+  mmap-int8-ivf<N> vector_index, int8, IVF partitions (the N nearest scanned, --probes)
+
+Recall@k is measured against exact float32 search. HNSW and IVF trade
+recall for latency, so compare rows at similar latency, not only recall:
+Chroma at its default ef=10 is an untuned baseline. Every backend is loaded
+and queried in a fresh process, which reports its memory growth split into
+private (anonymous) memory and file-backed pages: the mmap pages are shared
+through the OS page cache by every worker, private memory is paid per worker.
+
+Defaults (--queries 200, k=5), one run on a 4-core container:
+
+     size backend        recall@5  p50 ms  private MB
+     5000 chroma-ef10        0.46    2.44        25.4
+     5000 chroma-ef200       1.00    3.31        25.4
+     5000 mmap-int8          0.98    1.24         7.3
+     5000 mmap-int8-ivf16    0.66    1.18         0.6
+     5000 mmap-int8-ivf32    0.82    2.04         0.6
+    50000 chroma-ef10        0.17    2.57       115.5
+    50000 chroma-ef50        0.42    1.87       115.5
+    50000 chroma-ef200       0.77    2.42       115.5
+    50000 mmap-int8          0.97   11.20        11.9
+    50000 mmap-int8-ivf16    0.87    1.78         1.6
+    50000 mmap-int8-ivf32    0.97    2.62         1.6
+
+(the 5000 rows used --queries 50). HNSW recall varies between builds, by
+about +-0.05 at ef=10. Small documents have few, small IVF partitions, so
+IVF needs more probes there; below RAG_VECTOR_IVF_MIN chunks the service
+scans exactly.
+
+Usage:
+    python benchmarks/bench_vector_backend.py --sizes 5000 50000 --queries 200
+    python benchmarks/bench_vector_backend.py --sizes 50000 --chroma-ef 10 50 200 --probes 8 16 32
+    python benchmarks/bench_vector_backend.py --sizes 100000 --probes 8 16 32 --skip-chroma
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import time
+import multiprocessing
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import vector_index
+
+DIM = 384
+ADD_BATCH = 5000
+
+def clustered_unit_vectors(rng, count, clusters=200, spread=0.6):
+    """Vectors around random topic centres, closer to real embeddings than isotropic noise"""
+    centres = rng.standard_normal((clusters, DIM)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, count)] + spread * rng.standard_normal((count, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def memory_kb():
+    """(private, file-backed) resident KB of this process"""
+    fields = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name.startswith("Rss"):
+                    fields[name] = int(value.split()[0])
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, 0
+    return fields.get("RssAnon", 0), fields.get("RssFile", 0)
+
+def run_backend(config, queries, k):
+    """Runs in a fresh process: load the backend, run every query, report timings and memory growth"""
+    if config["backend"] == "chroma":
+        import chromadb
+        before = memory_kb()
+        started = time.perf_counter()
+        collection = chromadb.PersistentClient(path=config["path"]).get_collection(config["name"])
+        search = lambda query: collection.query(query_embeddings=[query.tolist()], n_results=k,
+                                                include=["documents", "metadatas", "distances"])["ids"][0]
+    else:
+        vector_index.VECTOR_DIR = config["path"]
+        vector_index.IVF_PROBES = config.get("probes", vector_index.IVF_PROBES)
+        before = memory_kb()
+        started = time.perf_counter()
+        index = vector_index.load_index(config["name"])
+        search = lambda query: index.query([query], k)["ids"][0]
+    results = [search(queries[0])]
+    load_ms = (time.perf_counter() - started) * 1000
+    latencies = []
+    for query in queries[1:]:
+        started = time.perf_counter()
+        results.append(search(query))
+        latencies.append((time.perf_counter() - started) * 1000)
+    after = memory_kb()
+    latencies.sort()
+    return {
+        "ids": results,
+        "load_ms": round(load_ms, 1),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)], 3),
+        "private_mb": round((after[0] - before[0]) / 1024, 1),
+        "shared_mb": round((after[1] - before[1]) / 1024, 1),
+    }
+
+def dir_mb(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return round(total / (1024 * 1024), 1)
+
+def bench_size(size, args, rng, pool):
+    vectors = clustered_unit_vectors(rng, size)
+    queries = clustered_unit_vectors(rng, args.queries + 1)
+    ids = [f"{i:08d}" for i in range(size)]
+    texts = [f"chunk {i} " + "lorem ipsum dolor sit amet " * 36 for i in range(size)]
+    metadatas = [{"source": "bench.pdf", "page": i // 3} for i in range(size)]
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :args.k]
+    expected = [{ids[i] for i in row} for row in exact]
+
+    root = tempfile.mkdtemp(prefix="rag_vector_bench_")
+    configs = []
+    try:
+        for ef in ([] if args.skip_chroma else args.chroma_ef):
+            import chromadb
+            # Chroma copies HNSW settings into the index segment when the collection is
+            # created (modify() doesn't reach it), so every ef gets a collection of its own
+            path = os.path.join(root, f"chroma-ef{ef}")
+            started = time.perf_counter()
+            collection = chromadb.PersistentClient(path=path).create_collection(
+                "bench", metadata={"hnsw:search_ef": ef})
+            for start in range(0, size, ADD_BATCH):
+                end = start + ADD_BATCH
+                collection.add(ids=ids[start:end], embeddings=vectors[start:end].tolist(),
+                               documents=texts[start:end], metadatas=metadatas[start:end])
+            configs.append(({"backend": "chroma", "path": path, "name": "bench"}, f"chroma-ef{ef}",
+                            time.perf_counter() - started, dir_mb(path)))
+
+        vector_dir = os.path.join(root, "vectors")
+        variants = [("mmap-float32", "float32", None), ("mmap-int8", "int8", None)]
+        variants += [(f"mmap-int8-ivf{probes}", "int8", probes) for probes in args.probes]
+        built = {}
+        for label, dtype, probes in variants:
+            name = f"{dtype}-{'ivf' if probes else 'flat'}"
+            if name not in built:
+                vector_index.VECTOR_DIR = vector_dir
+                vector_index.IVF_MIN_VECTORS = 2 if probes else size + 1
+                started = time.perf_counter()
+                vector_index.save_index(name, ids, vectors, texts, metadatas, dtype=dtype)
+                built[name] = (time.perf_counter() - started,
+                               round(vector_index.disk_bytes(name) / (1024 * 1024), 1))
+            config = {"backend": "mmap", "path": vector_dir, "name": name}
+            if probes:
+                config["probes"] = probes
+            configs.append((config, label) + built[name])
+
+        rows = []
+        for config, label, build_seconds, disk in configs:
+            result = pool.apply(run_backend, (config, queries, args.k))
+            recall = statistics.mean(len(set(found) & want) / args.k for found, want in zip(result.pop("ids"), expected))
+            rows.append(dict(result, backend=label, size=size, recall=round(recall, 4),
+                             build_s=round(build_seconds, 2), disk_mb=disk))
+        return rows
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 50000], help="chunks in the document")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--probes", type=int, nargs="+", default=[8, vector_index.IVF_PROBES, 32],
+                        help="IVF partitions scanned per query (one row per value)")
+    parser.add_argument("--chroma-ef", type=int, nargs="+", default=[10, 50, 200],
+                        help="Chroma hnsw:search_ef values (one row per value; 10 is Chroma's default)")
+    parser.add_argument("--skip-chroma", action="store_true")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="also write the rows to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    rows = []
+    header = (f"{'size':>7} {'backend':<16} {'recall@' + str(args.k):>9} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'load ms':>8} {'private MB':>10} {'shared MB':>9} {'disk MB':>8} {'build s':>8}")
+    print(header)
+    # One fresh process per measurement so memory numbers don't include earlier backends
+    context = multiprocessing.get_context("spawn")
+    for size in args.sizes:
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            for row in bench_size(size, args, rng, pool):
+                rows.append(row)
+                print(f"{row['size']:>7} {row['backend']:<16} {row['recall']:>9.3f} {row['p50_ms']:>8.2f} "
+                      f"{row['p95_ms']:>8.2f} {row['load_ms']:>8.1f} {row['private_mb']:>10.1f} "
+                      f"{row['shared_mb']:>9.1f} {row['disk_mb']:>8.1f} {row['build_s']:>8.2f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+if __name__ == "__main__":
+    main()
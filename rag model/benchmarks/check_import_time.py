@@ -0,0 +1,86 @@
+"""
+Import-time budget check for rag_api.py.
+
+rag_api must import fast and without the heavy stack: the embedding model,
+Chroma and LangChain load in the background warm-up thread, never at import.
+This imports rag_api in fresh interpreters (--runs times), takes the median
+and exits with status 1 if it is over budget or if any heavy module was
+imported on the way. Run it in CI or before a release:
+
+    python benchmarks/check_import_time.py
+    python benchmarks/check_import_time.py --budget-ms 400 --runs 7 --verbose
+
+--verbose prints the slowest imports (python -X importtime) of the last run.
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+RAG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGET_MS = float(os.getenv("RAG_IMPORT_BUDGET_MS", "600"))
+# Must only load lazily (warm-up, first search or ingestion)
+HEAVY_MODULES = ("numpy", "torch", "sentence_transformers", "transformers", "chromadb",
+                 "langchain_core", "langchain_community", "langchain_huggingface",
+                 "langchain_text_splitters", "pypdf", "groq")
+
+PROBE = """
+import sys, json, time
+started = time.perf_counter()
+import rag_api
+elapsed = time.perf_counter() - started
+print(json.dumps({"ms": elapsed * 1000, "heavy": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+def measure(verbose=False):
+    """Import rag_api once in a fresh interpreter; returns ({"ms", "heavy"}, importtime stderr)"""
+    command = [sys.executable] + (["-X", "importtime"] if verbose else []) + ["-c", PROBE]
+    env = dict(os.environ, RAG_WARMUP="false")
+    result = subprocess.run(command, cwd=RAG_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f"Importing rag_api failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+def slowest_imports(importtime_log, count=15):
+    rows = []
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.rstrip()))
+    return sorted(rows, reverse=True)[:count]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="median import time allowed (default RAG_IMPORT_BUDGET_MS or 600)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    # The first run also warms the OS file cache and __pycache__, like a second container start
+    measure()
+    runs = [measure(args.verbose and run == args.runs - 1) for run in range(args.runs)]
+    median_ms = statistics.median(result["ms"] for result, _ in runs)
+    heavy = sorted({module for result, _ in runs for module in result["heavy"]})
+    print(f"rag_api import: median {median_ms:.1f}ms over {args.runs} runs (budget {args.budget_ms:g}ms)")
+    if args.verbose:
+        for cumulative, name in slowest_imports(runs[-1][1]):
+            print(f"  {cumulative / 1000:8.1f}ms {name}")
+
+    failed = False
+    if median_ms > args.budget_ms:
+        print(f"FAIL: over budget by {median_ms - args.budget_ms:.1f}ms")
+        failed = True
+    if heavy:
+        print(f"FAIL: imported at module load: {', '.join(heavy)}")
+        failed = True
+    if not failed:
+        print("OK")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
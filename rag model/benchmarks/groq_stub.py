@@ -0,0 +1,182 @@
+"""
+Local stand-in for the Groq chat completions API, for load tests and benchmarks.
+
+Serves POST /openai/v1/chat/completions (the path the groq SDK calls), so the
+RAG API can be pointed at it with GROQ_BASE_URL=http://127.0.0.1:<port>.
+Responses are deterministic for a given prompt:
+- prompts asking for multiple choice questions get a valid JSON array with the
+  requested number of questions
+- everything else gets a markdown answer
+Latency is simulated as --latency-ms plus --ms-per-token for each generated
+token, and "stream": true is answered with SSE chunks like the real API.
+--rate-limit-every N answers every Nth request with a 429, and --error-every N
+every Nth with a 500.
+
+    python benchmarks/groq_stub.py --port 8765 --latency-ms 300
+"""
+
+import re
+import json
+import time
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def _question_count(prompt):
+    match = re.search(r"exactly (\d+) multiple choice", prompt) or re.search(r"Create exactly (\d+)", prompt)
+    return int(match.group(1)) if match else 5
+
+def fake_completion(messages):
+    """Deterministic completion text for a chat request"""
+    prompt = messages[-1]["content"] if messages else ""
+    seed = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+    if "multiple choice" in prompt.lower() or "mcq" in prompt.lower():
+        questions = [{
+            "text": f"Stub question {i + 1} ({seed})?",
+            "options": ["A) First", "B) Second", "C) Third", "D) Fourth"],
+            "correctAnswer": "B) Second",
+            "subtopic": f"Subtopic {i % 3 + 1}",
+        } for i in range(_question_count(prompt))]
+        return json.dumps(questions, indent=2)
+    paragraphs = [f"### Section {i + 1}\n**Key point {i + 1}** for request {seed}: " + "lorem ipsum dolor sit amet " * 12
+                  for i in range(8)]
+    return "\n\n".join(paragraphs)
+
+class StubState:
+    def __init__(self, latency_ms, ms_per_token, rate_limit_every, error_every=0):
+        self.latency = latency_ms / 1000
+        self.per_token = ms_per_token / 1000
+        self.rate_limit_every = rate_limit_every
+        self.error_every = error_every
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.rate_limited = 0
+        self.errors = 0
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            with state.lock:
+                stats = {"requests": state.requests, "max_in_flight": state.max_in_flight,
+                         "rate_limited": state.rate_limited, "errors": state.errors}
+            self._send_json(200, stats)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            with state.lock:
+                state.requests += 1
+                number = state.requests
+                limited = state.rate_limit_every and number % state.rate_limit_every == 0
+                failed = not limited and state.error_every and number % state.error_every == 0
+                if limited:
+                    state.rate_limited += 1
+                elif failed:
+                    state.errors += 1
+                else:
+                    state.in_flight += 1
+                    state.max_in_flight = max(state.max_in_flight, state.in_flight)
+            if limited:
+                self._send_json(429, {"error": {"message": "Rate limit reached (stub)", "type": "rate_limit"}},
+                                {"retry-after": "0.2"})
+                return
+            if failed:
+                self._send_json(500, {"error": {"message": "Internal server error (stub)", "type": "internal_server_error"}})
+                return
+            try:
+                self._complete(body)
+            except (BrokenPipeError, ConnectionResetError):
+                # Client stopped reading a stream early (e.g. a quiz that already has enough questions)
+                self.close_connection = True
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+
+        def _complete(self, body):
+            content = fake_completion(body.get("messages", []))
+            tokens = [content[i:i + 16] for i in range(0, len(content), 16)]
+            prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+            model = body.get("model", "stub")
+            time.sleep(state.latency)
+
+            if not body.get("stream"):
+                time.sleep(state.per_token * len(tokens))
+                self._send_json(200, {
+                    "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                              "total_tokens": prompt_tokens + len(tokens)},
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def write_event(data):
+                payload = f"data: {data}\n\n".encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(payload), payload))
+                self.wfile.flush()
+
+            for token in tokens:
+                time.sleep(state.per_token)
+                write_event(json.dumps({
+                    "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": model, "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                }))
+            # Groq reports usage on the last chunk of a stream
+            write_event(json.dumps({
+                "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "x_groq": {"id": "req-stub", "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                                                       "total_tokens": prompt_tokens + len(tokens)}},
+            }))
+            write_event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+def start_stub(port=0, latency_ms=300, ms_per_token=0.0, rate_limit_every=0, error_every=0):
+    """Start the stub in a background thread; returns (server, state). port=0 picks a free port."""
+    state = StubState(latency_ms, ms_per_token, rate_limit_every, error_every)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="groq-stub", daemon=True).start()
+    return server, state
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--ms-per-token", type=float, default=0.0)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    parser.add_argument("--error-every", type=int, default=0)
+    args = parser.parse_args()
+    server, _ = start_stub(args.port, args.latency_ms, args.ms_per_token, args.rate_limit_every, args.error_every)
+    print(f"[GROQ STUB] Listening on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Load test for the RAG API's LLM-backed endpoints.
+
+Runs N concurrent clients against generate-answer, quick-answer and
+generate-quiz for a fixed duration and reports throughput plus p50/p95/p99
+latency per endpoint. Either point it at a running server:
+
+    python benchmarks/load_test.py --base-url http://127.0.0.1:5000 --pdf hrm.pdf
+
+or let it start the Groq stub (benchmarks/groq_stub.py) and serve.py itself,
+so the numbers measure the server and not the Groq API:
+
+    python benchmarks/load_test.py --launch --pdf hrm.pdf --concurrency 64
+
+--unique-topics gives every request a distinct topic so the response cache
+never hits (otherwise repeated requests mostly measure the cache).
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit
+
+RAG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = ("generate-answer", "quick-answer", "generate-quiz")
+TOPICS = ["Recruitment", "Training", "Performance appraisal", "Compensation", "Job analysis"]
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def build_payload(endpoint, pdf_name, number, unique, topics=TOPICS):
+    topic = topics[number % len(topics)]
+    if unique:
+        topic = f"{topic} #{number}"
+    if endpoint == "quick-answer":
+        return {"query": f"What is {topic}?", "pdf_name": pdf_name}
+    payload = {"topic": topic, "subtopic": "Overview", "pdf_name": pdf_name}
+    if endpoint == "generate-quiz":
+        payload.update(question_count=5, difficulty="medium")
+    return payload
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.errors = {name: 0 for name in ENDPOINTS}
+
+    def record(self, endpoint, seconds, ok):
+        with self.lock:
+            if ok:
+                self.latencies[endpoint].append(seconds)
+            else:
+                self.errors[endpoint] += 1
+
+def client_loop(base_url, endpoints, pdf_name, unique, deadline, counter, recorder, timeout, topics=TOPICS):
+    parts = urlsplit(base_url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+    while time.perf_counter() < deadline:
+        number = next(counter)
+        endpoint = endpoints[number % len(endpoints)]
+        body = json.dumps(build_payload(endpoint, pdf_name, number, unique, topics))
+        start = time.perf_counter()
+        try:
+            conn.request("POST", f"/api/rag/{endpoint}", body=body, headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            payload = response.read()
+            ok = response.status == 200 and json.loads(payload).get("success", False)
+        except Exception:
+            ok = False
+            conn.close()
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+        recorder.record(endpoint, time.perf_counter() - start, ok)
+    conn.close()
+
+def run_load(base_url, endpoints, pdf_name, concurrency, duration, unique, timeout=120, topics=TOPICS):
+    recorder = Recorder()
+    counter = itertools.count()
+    started = time.perf_counter()
+    deadline = started + duration
+    threads = [threading.Thread(target=client_loop,
+                                args=(base_url, endpoints, pdf_name, unique, deadline, counter, recorder, timeout, topics),
+                                daemon=True)
+               for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for endpoint in endpoints:
+        values = sorted(recorder.latencies[endpoint])
+        results[endpoint] = {
+            "requests": len(values),
+            "errors": recorder.errors[endpoint],
+            "rps": round(len(values) / elapsed, 2),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 1) if values else None,
+            "p95_ms": round(percentile(values, 0.95) * 1000, 1) if values else None,
+            "p99_ms": round(percentile(values, 0.99) * 1000, 1) if values else None,
+        }
+    return {"concurrency": concurrency, "duration_s": round(elapsed, 2), "endpoints": results}
+
+def wait_until_ready(base_url, timeout):
+    parts = urlsplit(base_url)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=5)
+            conn.request("GET", "/api/rag/health?ready=1")
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.5)
+    return False
+
+def launch_server(port, stub_port, latency_ms, no_cache, rate_limit_every=0, rag_dir=RAG_DIR, env=None):
+    """
+    Start groq_stub in-process and serve.py as a subprocess pointed at it.
+    rag_dir runs another copy of the service (bench_suite.py's scratch copy); env adds variables.
+    """
+    from groq_stub import start_stub
+    stub, stub_state = start_stub(stub_port, latency_ms, rate_limit_every=rate_limit_every)
+    env = dict(os.environ, **(env or {}),
+               GROQ_API_KEY=os.getenv("GROQ_API_KEY") or "stub",
+               GROQ_BASE_URL=f"http://127.0.0.1:{stub.server_address[1]}",
+               RAG_API_PORT=str(port))
+    if no_cache:
+        env["RAG_RESPONSE_CACHE"] = "false"
+    server = subprocess.Popen([sys.executable, "serve.py"], cwd=rag_dir, env=env)
+    return stub, stub_state, server
+
+def print_report(report):
+    print(f"\nConcurrency {report['concurrency']}, {report['duration_s']}s")
+    print(f"{'endpoint':<18}{'requests':>10}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, row in report["endpoints"].items():
+        print(f"{endpoint:<18}{row['requests']:>10}{row['errors']:>8}{row['rps']:>9}"
+              f"{str(row['p50_ms']):>10}{str(row['p95_ms']):>10}{str(row['p99_ms']):>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--launch", action="store_true", help="start the Groq stub and serve.py")
+    parser.add_argument("--port", type=int, default=5055, help="port for the launched server")
+    parser.add_argument("--stub-port", type=int, default=0)
+    parser.add_argument("--stub-latency-ms", type=float, default=300)
+    parser.add_argument("--stub-rate-limit-every", type=int, default=0,
+                        help="answer every Nth Groq call with a 429 (exercises the LLM gateway)")
+    parser.add_argument("--no-cache", action="store_true", help="disable the response cache in the launched server")
+    parser.add_argument("--pdf", required=True, help="PDF name already ingested on the server")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--unique-topics", action="store_true")
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip() in ENDPOINTS]
+    server = stub_state = None
+    base_url = args.base_url
+    if args.launch:
+        _, stub_state, server = launch_server(args.port, args.stub_port, args.stub_latency_ms, args.no_cache,
+                                                   args.stub_rate_limit_every)
+        base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        if not wait_until_ready(base_url, timeout=300):
+            sys.exit(f"Server at {base_url} did not become ready")
+        report = run_load(base_url, endpoints, args.pdf, args.concurrency, args.duration, args.unique_topics)
+        if stub_state is not None:
+            report["groq_stub"] = {"requests": stub_state.requests, "max_in_flight": stub_state.max_in_flight,
+                                  "rate_limited": stub_state.rate_limited}
+        print_report(report)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=60)
+
+if __name__ == "__main__":
+    main()
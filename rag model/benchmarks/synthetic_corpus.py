@@ -0,0 +1,141 @@
+"""
+Synthetic PDF corpus for benchmarks: deterministic, offline, no PDF library needed.
+
+Every document is a textbook-like PDF of --pages pages. Each page is one
+section on a topic (a topic spans --pages-per-topic consecutive pages) made
+of sentences drawn from a fixed academic vocabulary plus a handful of terms
+unique to the topic, so topic queries have a right answer to retrieve.
+The same --seed always gives byte-identical files.
+
+Next to the PDFs, corpus.json lists every document with its topics, their
+key terms and the pages they cover, for retrieval hit-rate checks and load
+test payloads.
+
+Usage:
+    python benchmarks/synthetic_corpus.py --out /tmp/corpus --documents 10 --pages 40
+"""
+
+import os
+import json
+import random
+import argparse
+import textwrap
+
+WORDS = """
+analysis approach assessment behaviour capacity concept condition context control cost data decision
+design development distribution effect element environment evaluation evidence factor feature framework
+function goal growth impact implementation income individual information input institution interaction
+investment issue knowledge level management method model network objective operation organisation
+outcome output performance period policy practice principle priority procedure process production
+program project property quality range rate ratio reaction region relationship requirement research
+resource response result risk role sector security selection sequence service significance source
+stage standard strategy structure subject supply survey system task technique technology theory
+tradition transfer trend value variable version volume welfare
+accurate adequate annual apparent appropriate available central common complex consistent critical
+current direct distinct dynamic economic effective efficient essential external financial formal
+general global internal major minimal multiple negative normal obvious overall physical positive
+potential primary principal relevant significant similar specific stable standard sufficient typical
+affects allows applies assumes builds changes combines compares defines depends describes determines
+develops enables ensures establishes explains extends identifies improves includes increases indicates
+influences involves maintains measures minimises produces provides reduces reflects represents requires
+shows supports transforms uses varies
+""".split()
+CONNECTORS = ["In practice,", "As a result,", "For example,", "In contrast,", "Typically,", "However,",
+              "In most cases,", "Historically,", "By definition,", "More generally,"]
+SYLLABLES = ["ka", "lo", "mer", "vin", "tra", "sol", "dex", "qua", "rin", "bel", "cor", "nu", "pha", "zen",
+             "tor", "lum", "gra", "fi", "oss", "ter"]
+LINE_CHARS = 95
+LINES_PER_PAGE = 64
+
+def _term(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+def _sentence(rng, terms):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(10, 20))]
+    # Roughly one word in five is a topic term, like a textbook section's vocabulary
+    for _ in range(rng.randint(1, 4)):
+        words[rng.randrange(len(words))] = rng.choice(terms)
+    return f"{rng.choice(CONNECTORS)} {' '.join(words)}."
+
+def page_lines(rng, heading, terms, words_per_page):
+    """Wrapped lines of one page: a heading and paragraphs of about words_per_page words"""
+    lines = [heading, ""]
+    words = 0
+    while words < words_per_page:
+        paragraph = " ".join(_sentence(rng, terms) for _ in range(rng.randint(3, 6)))
+        words += len(paragraph.split())
+        lines.extend(textwrap.wrap(paragraph, LINE_CHARS))
+        lines.append("")
+    return lines[:LINES_PER_PAGE]
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def pdf_bytes(pages):
+    """A minimal PDF 1.4 file, one page per list of text lines (Helvetica, A4)"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    kids = []
+    for lines in pages:
+        body = "BT /F1 10 Tf 12 TL 50 800 Td\n" + "".join(f"({_escape(line)}) '\n" for line in lines) + "ET"
+        stream = body.encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_ref = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref)
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+def generate_corpus(directory, documents=5, pages=20, pages_per_topic=2, words_per_page=350, seed=7):
+    """Write documents PDFs and corpus.json into directory; returns the corpus description"""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    corpus = {"seed": seed, "pages": pages, "pages_per_topic": pages_per_topic,
+              "words_per_page": words_per_page, "documents": []}
+    for number in range(documents):
+        name = f"synthetic_{number:03d}.pdf"
+        topics = []
+        pdf_pages = []
+        for first in range(0, pages, pages_per_topic):
+            terms = [_term(rng) for _ in range(6)]
+            title = f"{terms[0].capitalize()} {terms[1]}"
+            covered = list(range(first, min(first + pages_per_topic, pages)))
+            topics.append({"topic": title, "terms": terms, "pages": covered})
+            for page in covered:
+                heading = f"Chapter {len(topics)}: {title} ({page - first + 1}/{len(covered)})"
+                pdf_pages.append(page_lines(rng, heading, terms, words_per_page))
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(pdf_bytes(pdf_pages))
+        corpus["documents"].append({"name": name, "pages": len(pdf_pages), "topics": topics})
+    with open(os.path.join(directory, "corpus.json"), "w") as f:
+        json.dump(corpus, f, indent=2)
+    return corpus
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True, help="directory for the PDFs and corpus.json")
+    parser.add_argument("--documents", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=20, help="pages per document")
+    parser.add_argument("--pages-per-topic", type=int, default=2)
+    parser.add_argument("--words-per-page", type=int, default=350)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    corpus = generate_corpus(args.out, args.documents, args.pages, args.pages_per_topic,
+                             args.words_per_page, args.seed)
+    total_pages = sum(doc["pages"] for doc in corpus["documents"])
+    print(f"Wrote {len(corpus['documents'])} PDFs ({total_pages} pages) to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Token-budgeted packing of retrieved chunks into prompt context.
+
+ingest_pdfs splits pages with CHUNK_OVERLAP characters of overlap and
+retrieval often returns neighbouring chunks of a page together, so joining
+chunks verbatim sends every overlap twice. Near-identical chunks (repeated
+headers, the same paragraph on two pages, one chunk from both the legacy
+and the per-document collection) all get sent too. pack_context():
+1. merges chunks from the same page whose text overlaps (the end of one is
+   the start of the other) into one passage
+2. drops passages whose word 3-grams are mostly contained in a passage
+   already kept (RAG_CONTEXT_DUPLICATE_THRESHOLD)
+3. fills the token budget in relevance order, skipping passages that no
+   longer fit; the most relevant passage is cut to fit rather than dropped
+A merged passage takes the rank of its most relevant chunk, so the context
+stays in relevance order.
+"""
+
+import os
+import re
+
+PACKING = os.getenv("RAG_CONTEXT_PACKING", "true").lower() != "false"
+# Context tokens per generate-answer prompt, and per quiz shard prompt
+TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "2000"))
+QUIZ_TOKEN_BUDGET = int(os.getenv("RAG_QUIZ_CONTEXT_TOKEN_BUDGET", "1500"))
+DUPLICATE_THRESHOLD = float(os.getenv("RAG_CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+# Shortest shared text treated as splitter overlap rather than coincidence,
+# and the longest searched for (comfortably above ingest_pdfs.CHUNK_OVERLAP)
+MIN_OVERLAP = 30
+MAX_OVERLAP = 400
+SHINGLE_WORDS = 3
+
+def estimate_tokens(text):
+    """Same rule of thumb as llm_gateway.estimate_request_tokens"""
+    return len(text) // 4
+
+def _clean(text):
+    return text.replace("\n", " ").strip()
+
+def _page_key(doc):
+    metadata = doc.metadata or {}
+    return metadata.get("source"), metadata.get("page")
+
+def _overlap(first, second):
+    """Length of the longest suffix of first that starts second, or 0"""
+    probe = second[:MIN_OVERLAP]
+    if len(probe) < MIN_OVERLAP:
+        return 0
+    index = first.find(probe, max(0, len(first) - MAX_OVERLAP))
+    while index != -1:
+        if second.startswith(first[index:]):
+            return len(first) - index
+        index = first.find(probe, index + 1)
+    return 0
+
+def _shingles(text):
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return frozenset([" ".join(words)]) if words else frozenset()
+    return frozenset(" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1))
+
+def _merge_overlapping(docs):
+    """[rank, page_key, text, chunk_count] passages, same-page overlapping chunks joined"""
+    passages = [[rank, _page_key(doc), doc.page_content, 1] for rank, doc in enumerate(docs)]
+    merged = True
+    while merged:
+        merged = False
+        for first in passages:
+            for second in passages:
+                if first is second or first[1] != second[1]:
+                    continue
+                size = _overlap(first[2], second[2])
+                if size:
+                    first[0] = min(first[0], second[0])
+                    first[2] += second[2][size:]
+                    first[3] += second[3]
+                    passages.remove(second)
+                    merged = True
+                    break
+            if merged:
+                break
+    return sorted(passages, key=lambda passage: passage[0])
+
+def pack_context(docs, token_budget=None):
+    """
+    Context text for a prompt from retrieved Documents (most relevant first).
+    Returns (text, stats); stats reports chunks merged and dropped and the
+    estimated prompt tokens saved against joining every chunk verbatim.
+    """
+    token_budget = TOKEN_BUDGET if token_budget is None else token_budget
+    verbatim = "\n\n".join(_clean(doc.page_content) for doc in docs)
+    tokens_before = estimate_tokens(verbatim)
+    if not PACKING or not docs:
+        return verbatim, {"chunks": len(docs), "passages": len(docs), "merged_chunks": 0,
+                          "duplicates_dropped": 0, "over_budget_dropped": 0,
+                          "tokens_before": tokens_before, "tokens": tokens_before, "tokens_saved": 0}
+
+    passages = _merge_overlapping(docs)
+    merged_chunks = len(docs) - len(passages)
+
+    kept, kept_shingles, duplicates = [], [], 0
+    for passage in passages:
+        shingles = _shingles(passage[2])
+        if shingles and any(len(shingles & other) / len(shingles) >= DUPLICATE_THRESHOLD for other in kept_shingles):
+            duplicates += 1
+            continue
+        kept.append(_clean(passage[2]))
+        kept_shingles.append(shingles)
+
+    packed, used, over_budget = [], 0, 0
+    for text in kept:
+        tokens = estimate_tokens(text) + (1 if packed else 0)  # the joining blank line
+        if used + tokens > token_budget:
+            if packed:
+                over_budget += 1
+                continue
+            text = text[:token_budget * 4].rsplit(" ", 1)[0]
+            tokens = estimate_tokens(text)
+        packed.append(text)
+        used += tokens
+
+    text = "\n\n".join(packed)
+    tokens = estimate_tokens(text)
+    return text, {
+        "chunks": len(docs),
+        "passages": len(packed),
+        "merged_chunks": merged_chunks,
+        "duplicates_dropped": duplicates,
+        "over_budget_dropped": over_budget,
+        "tokens_before": tokens_before,
+        "tokens": tokens,
+        "tokens_saved": tokens_before - tokens,
+    }
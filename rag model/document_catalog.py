@@ -0,0 +1,282 @@
+"""
+Persistent catalog of uploaded documents behind /api/rag/list-pdfs.
+
+One record per file in pdfs/: size, content hash, page and chunk counts,
+ingest status and time, and the embedding model it was indexed with.
+Upload, ingestion (ingest_pdfs, in this process or from the command line)
+and delete update it. Statuses:
+- queued / indexing / indexed / failed: a PDF's way through ingestion
+- uploaded: a PDF on disk that isn't indexed (e.g. RAG_AUTO_INGEST=false)
+- stored: other document types, which are kept but not indexed
+
+Records live in memory and are written to catalog/documents.json. Every read
+checks three stat() signatures: the catalog file (another process wrote it),
+the pdfs/ directory (files added or removed outside the API) and the ingest
+manifest (ingested elsewhere). Only a change triggers a reload or reconcile.
+Filtered, sorted views are cached until the next change, so paging through
+thousands of documents costs O(page).
+"""
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+import page_text_store
+
+CATALOG_PATH = os.path.join(os.path.dirname(__file__), 'catalog', 'documents.json')
+DOCUMENT_DIR = os.path.join(os.path.dirname(__file__), 'pdfs')
+# Kept in sync with ingest_pdfs.MANIFEST_PATH without importing the ingest stack
+MANIFEST_PATH = os.path.join(os.path.dirname(__file__), 'chroma_db', 'ingest_manifest.json')
+DOCUMENT_EXTENSIONS = {'pdf', 'doc', 'docx', 'txt'}
+STATUSES = ("queued", "indexing", "indexed", "failed", "uploaded", "stored")
+SORT_FIELDS = ("name", "size", "updated_at", "ingested_at", "pages", "chunks")
+# Filtered views kept between changes
+MAX_VIEWS = 32
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except FileNotFoundError:
+        return None
+
+def _extension(name):
+    return name.rsplit('.', 1)[1].lower() if '.' in name else ''
+
+def _ingest_fields(entry):
+    """Catalog fields from an ingest manifest entry"""
+    return {
+        "status": "indexed",
+        "sha256": entry.get("sha256"),
+        "size": entry.get("size"),
+        "mtime_ns": entry.get("mtime_ns"),
+        "pages": entry.get("pages"),
+        "chunks": entry.get("chunks"),
+        "embedding_model": entry.get("embedding_model"),
+        "ingested_at": entry.get("ingested_at"),
+        "error": None,
+    }
+
+def public_record(record):
+    """A record as list-pdfs returns it"""
+    result = {k: v for k, v in record.items() if k != "mtime_ns"}
+    size = record.get("size") or 0
+    result["size_mb"] = round(size / (1024 * 1024), 2)
+    return result
+
+class DocumentCatalog:
+    def __init__(self, path=CATALOG_PATH, folder=DOCUMENT_DIR, manifest_path=MANIFEST_PATH):
+        self.path = path
+        self.folder = folder
+        self.manifest_path = manifest_path
+        self._lock = threading.RLock()
+        self._records = {}
+        self._signatures = {"catalog": False, "folder": False, "manifest": False}
+        self._views = OrderedDict()
+
+    # -- persistence --------------------------------------------------------
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._records = {record["name"]: record for record in data.get("documents", [])}
+        except FileNotFoundError:
+            self._records = {}
+        except (OSError, ValueError) as e:
+            print(f"[CATALOG] Could not read {self.path} ({e}), rebuilding from disk")
+            self._records = {}
+            self._signatures["folder"] = False
+        self._signatures["catalog"] = _signature(self.path)
+
+    def _save(self):
+        """Atomic write; a failure keeps the in-memory state and is retried on the next change"""
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"version": 1, "documents": sorted(self._records.values(), key=lambda r: r["name"])}, f)
+            os.replace(tmp_path, self.path)
+            self._signatures["catalog"] = _signature(self.path)
+        except OSError as e:
+            print(f"[CATALOG] Could not save {self.path}: {e}")
+
+    def _changed(self):
+        self._views.clear()
+        self._save()
+
+    # -- reconciliation with disk and the ingest manifest ---------------------
+
+    def _manifest_documents(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get("documents", {})
+        except (OSError, ValueError):
+            return {}
+
+    def _reconcile(self):
+        """Bring records in line with pdfs/ and the manifest; returns whether anything changed"""
+        manifest = self._manifest_documents()
+        on_disk = {}
+        if os.path.isdir(self.folder):
+            for entry in os.scandir(self.folder):
+                if entry.is_file() and _extension(entry.name) in DOCUMENT_EXTENSIONS:
+                    on_disk[entry.name] = entry.stat()
+        changed = False
+        for name in [name for name in self._records if name not in on_disk]:
+            del self._records[name]
+            changed = True
+        for name, stat in on_disk.items():
+            record = self._records.get(name)
+            indexed = manifest.get(name)
+            if record is None or record.get("size") != stat.st_size or record.get("mtime_ns") != stat.st_mtime_ns:
+                # New file, or replaced outside the API
+                record = {"name": name, "type": _extension(name), "size": stat.st_size,
+                          "mtime_ns": stat.st_mtime_ns, "sha256": None, "pages": None, "chunks": None,
+                          "embedding_model": None, "ingested_at": None, "error": None,
+                          "status": "uploaded" if _extension(name) == "pdf" else "stored",
+                          "uploaded_at": datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat(),
+                          "updated_at": _now()}
+                if indexed and indexed.get("size") == stat.st_size and indexed.get("mtime_ns") == stat.st_mtime_ns:
+                    record.update(_ingest_fields(indexed))
+                else:
+                    try:
+                        record["sha256"] = page_text_store.content_hash_for(os.path.join(self.folder, name))
+                    except OSError:
+                        pass
+                self._records[name] = record
+                changed = True
+            elif indexed and indexed.get("sha256") == record.get("sha256") and (
+                    record["status"] not in ("indexed", "queued", "indexing")
+                    or record.get("ingested_at") != indexed.get("ingested_at")):
+                record.update(_ingest_fields(indexed), updated_at=_now())
+                changed = True
+            elif not indexed and record["status"] == "indexed":
+                record.update(status="uploaded", chunks=None, ingested_at=None, updated_at=_now())
+                changed = True
+        return changed
+
+    def _refresh(self):
+        """Reload or reconcile only if the catalog file, the folder or the manifest changed"""
+        catalog = _signature(self.path)
+        if catalog != self._signatures["catalog"]:
+            self._load()
+            self._views.clear()
+        folder = _signature(self.folder)
+        manifest = _signature(self.manifest_path)
+        if folder != self._signatures["folder"] or manifest != self._signatures["manifest"]:
+            self._signatures["folder"], self._signatures["manifest"] = folder, manifest
+            if self._reconcile():
+                self._changed()
+
+    # -- updates --------------------------------------------------------------
+
+    def _update(self, name, fields):
+        record = self._records.get(name)
+        if record is None:
+            record = {"name": name, "type": _extension(name), "size": None, "mtime_ns": None, "sha256": None,
+                      "pages": None, "chunks": None, "embedding_model": None, "ingested_at": None,
+                      "error": None, "status": "uploaded", "uploaded_at": _now()}
+            self._records[name] = record
+        elif all(record.get(k) == v for k, v in fields.items()):
+            return
+        record.update(fields, updated_at=_now())
+        self._changed()
+
+    def record_upload(self, name, path, status):
+        """A file was saved by the upload endpoint (new or replacing an older version)"""
+        stat = os.stat(path)
+        fields = {"type": _extension(name), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                  "sha256": page_text_store.content_hash_for(path), "status": status, "error": None,
+                  "uploaded_at": _now()}
+        with self._lock:
+            self._refresh()
+            previous = self._records.get(name)
+            if previous and previous.get("sha256") != fields["sha256"]:
+                fields.update(pages=None, chunks=None, embedding_model=None, ingested_at=None)
+            self._update(name, fields)
+
+    def set_status(self, name, status, **fields):
+        with self._lock:
+            self._refresh()
+            self._update(name, dict(fields, status=status))
+
+    def record_ingested(self, name, entry):
+        """Ingestion finished (or found the file unchanged); entry is its ingest manifest entry"""
+        with self._lock:
+            self._refresh()
+            self._update(name, _ingest_fields(entry))
+
+    def remove(self, name):
+        with self._lock:
+            self._refresh()
+            if self._records.pop(name, None) is not None:
+                self._changed()
+
+    # -- reads --------------------------------------------------------------------
+
+    def get(self, name):
+        with self._lock:
+            self._refresh()
+            record = self._records.get(name)
+            return public_record(record) if record else None
+
+    def find_by_hash(self, sha256):
+        """Name of a stored document with this content hash, or None (upload de-duplication)"""
+        with self._lock:
+            self._refresh()
+            matches = sorted(name for name, record in self._records.items() if record.get("sha256") == sha256)
+            return matches[0] if matches else None
+
+    def list(self, status=None, query=None, extension=None, sort="name", descending=False, offset=0, limit=100):
+        """(total matching, records offset..offset+limit)"""
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_FIELDS)}")
+        key = (status, (query or "").lower(), (extension or "").lower(), sort, descending)
+        with self._lock:
+            self._refresh()
+            view = self._views.get(key)
+            if view is None:
+                records = self._records.values()
+                if status:
+                    records = [r for r in records if r["status"] == status]
+                if key[1]:
+                    records = [r for r in records if key[1] in r["name"].lower()]
+                if key[2]:
+                    records = [r for r in records if r["type"] == key[2]]
+                # None sorts first ascending; name breaks ties so pages are stable
+                view = sorted(records, key=lambda r: r["name"])
+                if sort != "name":
+                    view.sort(key=lambda r: (r.get(sort) is not None, r.get(sort) or 0))
+                if descending:
+                    view.reverse()
+                self._views[key] = view
+                while len(self._views) > MAX_VIEWS:
+                    self._views.popitem(last=False)
+            else:
+                self._views.move_to_end(key)
+            return len(view), [public_record(r) for r in view[offset:offset + limit]]
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            counts = {}
+            for record in self._records.values():
+                counts[record["status"]] = counts.get(record["status"], 0) + 1
+            return {"documents": len(self._records), "by_status": counts}
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+def get_document_catalog():
+    """Process-wide catalog, loaded on first use"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = DocumentCatalog()
+        return _catalog
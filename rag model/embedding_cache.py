@@ -0,0 +1,259 @@
+"""
+Persistent embedding cache and batched embedding stage for the RAG system.
+
+Embeddings are keyed by (model name, SHA-1 of the text) and stored in one
+append-only file per model. Each record is the 20-byte text digest followed by
+the float32 vector, so the file is read back as a single memory-mapped NumPy
+structured array. Records are appended with one O_APPEND write per batch, so the
+API process and the ingestion script can share the same cache file.
+
+Only document (chunk) embeddings are persisted: their number is bounded by
+the corpus. Query embeddings would grow the file and every worker's index
+with each distinct question asked, so they live in a per-process LRU of
+RAG_QUERY_EMBEDDING_CACHE_SIZE entries instead.
+
+CachedEmbeddings wraps any LangChain embeddings object, so both ingest_pdfs.py
+and query-time retrieval in retrieve.py go through the same cache.
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+CACHE_DIR = os.getenv(
+    "RAG_EMBEDDING_CACHE_DIR",
+    os.path.join(os.path.dirname(__file__), 'embedding_cache')
+)
+# Rough token budget per model call; chunks are ~1000 chars (~250 tokens)
+BATCH_TOKENS = int(os.getenv("RAG_EMBED_BATCH_TOKENS", "8192"))
+MAX_BATCH_SIZE = int(os.getenv("RAG_EMBED_MAX_BATCH", "256"))
+QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_EMBEDDING_CACHE_SIZE", "4096"))
+DIGEST_SIZE = 20
+
+def text_digest(text, namespace=b"d"):
+    """Cache key for a text. Queries and documents are kept apart in case a model embeds them differently."""
+    return hashlib.sha1(namespace + b"\0" + text.encode("utf-8")).digest()
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English text)"""
+    return len(text) // 4 + 1
+
+def token_batches(texts, batch_tokens=BATCH_TOKENS, max_batch_size=MAX_BATCH_SIZE):
+    """
+    Split text indices into batches holding about batch_tokens tokens each.
+    Texts are grouped by length first so each batch pads to a similar length.
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    batch, batch_tokens_used = [], 0
+    for i in order:
+        tokens = estimate_tokens(texts[i])
+        if batch and (batch_tokens_used + tokens > batch_tokens or len(batch) >= max_batch_size):
+            yield batch
+            batch, batch_tokens_used = [], 0
+        batch.append(i)
+        batch_tokens_used += tokens
+    if batch:
+        yield batch
+
+class EmbeddingCache:
+    """Append-only, memory-mapped float32 embedding store for one model"""
+
+    def __init__(self, model_name, directory=CACHE_DIR):
+        self.model_name = model_name
+        self.directory = directory
+        self._slug = "".join(c if c.isalnum() or c in "-_." else "_" for c in model_name)
+        self._lock = threading.Lock()
+        self._index = {}
+        self._map = None
+        self._rows = 0
+        self.dim = None
+        self.path = None
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        existing = sorted(
+            name for name in os.listdir(directory)
+            if name.startswith(self._slug + "-d") and name.endswith(".f32")
+        )
+        if existing:
+            self._set_dim(int(existing[-1][len(self._slug) + 2:-4]))
+            self._refresh()
+
+    def _set_dim(self, dim):
+        self.dim = dim
+        self.path = os.path.join(self.directory, f"{self._slug}-d{dim}.f32")
+        self._dtype = np.dtype([("key", f"S{DIGEST_SIZE}"), ("vec", "<f4", (dim,))])
+
+    def _refresh(self):
+        """Map any records appended since the last look (by us or another process)"""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        rows = size // self._dtype.itemsize
+        if rows <= self._rows:
+            return
+        self._map = np.memmap(self.path, dtype=self._dtype, mode="r", shape=(rows,))
+        keys = self._map["key"]
+        for row in range(self._rows, rows):
+            self._index.setdefault(bytes(keys[row]), row)
+        self._rows = rows
+
+    def __len__(self):
+        return self._rows
+
+    def get_many(self, digests):
+        """Return a list with a float32 vector or None per digest"""
+        with self._lock:
+            if self.dim is not None and any(d not in self._index for d in digests):
+                self._refresh()
+            found = []
+            for digest in digests:
+                row = self._index.get(digest)
+                found.append(None if row is None else np.array(self._map[row]["vec"]))
+            hit_count = sum(v is not None for v in found)
+            self.hits += hit_count
+            self.misses += len(found) - hit_count
+            return found
+
+    def put_many(self, digests, vectors):
+        """Append new vectors (rows already cached are skipped)"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(digests) == 0:
+            return
+        with self._lock:
+            if self.dim is None:
+                self._set_dim(vectors.shape[1])
+            records = np.zeros(len(digests), dtype=self._dtype)
+            keep = []
+            seen = set()
+            for i, digest in enumerate(digests):
+                if digest in self._index or digest in seen:
+                    continue
+                seen.add(digest)
+                keep.append(i)
+                records[len(keep) - 1]["key"] = digest
+                records[len(keep) - 1]["vec"] = vectors[i]
+            if not keep:
+                return
+            payload = records[:len(keep)].tobytes()
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                # Drop a torn record left by a crash so every record stays aligned
+                end = os.lseek(fd, 0, os.SEEK_END)
+                remainder = end % self._dtype.itemsize
+                if remainder:
+                    os.ftruncate(fd, end - remainder)
+                os.write(fd, payload)
+            finally:
+                os.close(fd)
+            self._refresh()
+
+    def stats(self):
+        return {
+            "model": self.model_name,
+            "entries": self._rows,
+            "dim": self.dim,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes": self._rows * self._dtype.itemsize if self.dim else 0,
+        }
+
+class QueryEmbeddingCache:
+    """In-memory LRU with EmbeddingCache's get_many/put_many, for query embeddings"""
+
+    def __init__(self, max_entries=QUERY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, digests):
+        with self._lock:
+            found = []
+            for digest in digests:
+                vector = self._entries.get(digest)
+                if vector is not None:
+                    self._entries.move_to_end(digest)
+                found.append(vector)
+            hit_count = sum(v is not None for v in found)
+            self.hits += hit_count
+            self.misses += len(found) - hit_count
+            return found
+
+    def put_many(self, digests, vectors):
+        with self._lock:
+            for digest, vector in zip(digests, vectors):
+                self._entries[digest] = np.asarray(vector, dtype=np.float32)
+                self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses}
+
+class CachedEmbeddings(Embeddings):
+    """
+    LangChain embeddings wrapper that serves repeated texts from EmbeddingCache
+    (documents) or QueryEmbeddingCache (queries) and embeds the rest in
+    token-budgeted batches.
+    """
+
+    def __init__(self, base, model_name, cache=None, query_cache=None):
+        self.base = base
+        self.model_name = model_name
+        self.cache = cache if cache is not None else EmbeddingCache(model_name)
+        self.query_cache = query_cache if query_cache is not None else QueryEmbeddingCache()
+        self.embedded = 0
+
+    def stats(self):
+        return dict(self.cache.stats(), query_cache=self.query_cache.stats())
+
+    def _embed(self, texts, namespace, embed_batch):
+        store = self.query_cache if namespace == b"q" else self.cache
+        digests = [text_digest(text, namespace) for text in texts]
+        cached = store.get_many(digests)
+
+        # Embed each distinct missing text once
+        missing = {}
+        for i, vector in enumerate(cached):
+            if vector is None:
+                missing.setdefault(digests[i], texts[i])
+        if missing:
+            missing_digests = list(missing)
+            missing_texts = [missing[d] for d in missing_digests]
+            computed = {}
+            for batch in token_batches(missing_texts):
+                vectors = embed_batch([missing_texts[i] for i in batch])
+                batch_digests = [missing_digests[i] for i in batch]
+                store.put_many(batch_digests, vectors)
+                computed.update(zip(batch_digests, vectors))
+            self.embedded += len(missing_texts)
+            cached = [
+                vector if vector is not None else computed[digests[i]]
+                for i, vector in enumerate(cached)
+            ]
+        return [np.asarray(vector, dtype=np.float32).tolist() for vector in cached]
+
+    def embed_documents(self, texts):
+        return self._embed(list(texts), b"d", self.base.embed_documents)
+
+    def embed_query(self, text):
+        return self._embed([text], b"q", lambda batch: [self.base.embed_query(batch[0])])[0]
+
+    def embed_queries(self, texts):
+        """Query embeddings for many texts, with the misses embedded in batched model calls"""
+        return self._embed(list(texts), b"q", self._embed_query_batch)
+
+    def _embed_query_batch(self, batch):
+        # HuggingFaceEmbeddings encodes queries like documents unless query-specific
+        # encode kwargs are configured; only then does each query need its own call
+        if getattr(self.base, "query_encode_kwargs", None):
+            return [self.base.embed_query(text) for text in batch]
+        return self.base.embed_documents(batch)
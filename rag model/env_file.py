@@ -0,0 +1,29 @@
+"""
+.env loading for the RAG service.
+
+Called before any module reads its RAG_* settings (they are read at import
+time), and imports python-dotenv only when there is a .env file to load, so
+a container configured through its environment skips it entirely.
+"""
+
+import os
+
+def find_env_file(start=os.path.dirname(os.path.abspath(__file__))):
+    """The nearest .env in this directory or a parent, like dotenv's find_dotenv()"""
+    directory = start
+    while True:
+        candidate = os.path.join(directory, ".env")
+        if os.path.isfile(candidate):
+            return candidate
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+def load_env_file():
+    """Load the nearest .env without overriding variables already set; returns its path or None"""
+    path = find_env_file()
+    if path is not None:
+        from dotenv import load_dotenv
+        load_dotenv(path)
+    return path
@@ -0,0 +1,283 @@
+"""
+Prebuilt index snapshot for fast cold starts.
+
+A fresh container has an empty chroma_db: without a snapshot every document
+has to be parsed, chunked and embedded again before it can be searched. A
+snapshot is one file, built offline from an ingested chroma_db and shipped
+with the service, holding for every document:
+- its vector index (vector_index's arrays: vectors, norms, ids, IVF lists)
+- chunk texts and metadata
+- its BM25 lexical index
+- its ingest manifest entry (content hash, page and chunk counts)
+plus the embedding model ID and a format version.
+
+Loading is a single sequential read of the file into memory; the arrays are
+NumPy views into that buffer, so loading costs little more than the read
+(only the BM25 vocabularies are turned into dicts). retrieve.py loads
+it during warm-up, before /api/rag/health?ready=1 turns green, and searches a
+document through it while the local store agrees: the document has no local
+ingest manifest entry and its PDF in pdfs/ has the snapshot's size, or it was
+ingested locally from the same content. A document re-uploaded with other
+content, deleted, or indexed locally from a different file is left to the
+local store. A snapshot built for another embedding model is ignored.
+
+    python index_snapshot.py build                 # from chroma_db, into snapshot/rag_index.snap
+    python index_snapshot.py build --out /tmp/rag_index.snap --dtype float32
+    python index_snapshot.py info
+
+File layout: b"RAGSNAP\\0", the header length (uint64 little-endian), the
+header as JSON, then the array data, every array 64-byte aligned at the
+offset the header gives.
+"""
+
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+import threading
+from datetime import datetime, timezone
+import numpy as np
+import vector_index
+from lexical_index import LexicalIndex
+
+SNAPSHOT_PATH = os.getenv("RAG_INDEX_SNAPSHOT",
+                          os.path.join(os.path.dirname(__file__), 'snapshot', 'rag_index.snap'))
+SNAPSHOT_ENABLED = os.getenv("RAG_USE_INDEX_SNAPSHOT", "true").lower() != "false"
+# Kept in sync with ingest_pdfs.MANIFEST_PATH / PDF_DIR without importing the ingest stack
+MANIFEST_PATH = os.path.join(os.path.dirname(__file__), 'chroma_db', 'ingest_manifest.json')
+PDF_DIR = os.path.join(os.path.dirname(__file__), 'pdfs')
+MAGIC = b"RAGSNAP\0"
+FORMAT_VERSION = 1
+ALIGN = 64
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except FileNotFoundError:
+        return None
+
+class Snapshot:
+    def __init__(self, path, header, buffer, load_seconds):
+        self.path = path
+        self.header = header
+        self.embedding_model = header["embedding_model"]
+        self.load_seconds = load_seconds
+        self.size = len(buffer)
+        body = len(MAGIC) + 8 + header["header_bytes"]
+        view = memoryview(buffer)
+
+        def array(spec):
+            offset, dtype, shape = spec
+            dtype = np.dtype(dtype)
+            count = int(np.prod(shape)) if shape else 1
+            return np.frombuffer(buffer, dtype=dtype, count=count, offset=body + offset).reshape(shape)
+
+        self.documents = header["documents"]
+        self._vectors = {}
+        self._lexical = {}
+        self._by_collection = {}
+        for name, document in self.documents.items():
+            self._by_collection[document["collection"]] = name
+            vectors = document["vector"]
+            start, length = vectors["chunks"]
+            self._vectors[name] = vector_index.VectorIndex(
+                vectors["info"], {key: array(spec) for key, spec in vectors["arrays"].items()},
+                view[body + start:body + start + length])
+            lexical = document.get("lexical")
+            if lexical:
+                start, length = lexical["vocab"]
+                vocab = bytes(view[body + start:body + start + length]).decode("utf-8")
+                arrays = {key: array(spec) for key, spec in lexical["arrays"].items()}
+                self._lexical[name] = LexicalIndex(
+                    vocab.split("\n") if vocab else [], arrays["offsets"], arrays["postings"], arrays["tfs"],
+                    arrays["lengths"], [i.decode("ascii") for i in arrays["ids"]])
+        self._served = None
+        self._served_signature = None
+        self._lock = threading.Lock()
+
+    def _local_manifest(self):
+        try:
+            with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f).get("documents", {})
+        except (OSError, ValueError):
+            return {}
+
+    def served(self):
+        """Names of the documents currently searched through the snapshot"""
+        signature = (_signature(MANIFEST_PATH), _signature(PDF_DIR))
+        if signature == self._served_signature:
+            return self._served
+        with self._lock:
+            if signature != self._served_signature:
+                local = self._local_manifest()
+                served = set()
+                for name, document in self.documents.items():
+                    entry = local.get(name)
+                    if entry is not None:
+                        if entry.get("sha256") == document["manifest"].get("sha256"):
+                            served.add(name)
+                        continue
+                    on_disk = _signature(os.path.join(PDF_DIR, name))
+                    if on_disk is not None and on_disk[1] == document["manifest"].get("size"):
+                        served.add(name)
+                self._served, self._served_signature = served, signature
+        return self._served
+
+    def _document(self, collection):
+        name = self._by_collection.get(collection)
+        return name if name is not None and name in self.served() else None
+
+    def vector_index(self, collection):
+        """The document's VectorIndex if it is served from the snapshot, else None"""
+        name = self._document(collection)
+        return self._vectors[name] if name is not None else None
+
+    def lexical_index(self, collection):
+        name = self._document(collection)
+        return self._lexical.get(name) if name is not None else None
+
+    def status(self):
+        return {"path": self.path, "documents": len(self.documents), "served": len(self.served()),
+                "bytes": self.size, "load_seconds": self.load_seconds,
+                "embedding_model": self.embedding_model, "created_at": self.header.get("created_at")}
+
+def _parse_header(buffer):
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError("not an index snapshot")
+    (length,) = struct.unpack("<Q", buffer[len(MAGIC):len(MAGIC) + 8])
+    start = len(MAGIC) + 8
+    header = json.loads(buffer[start:start + length])
+    if header.get("version") != FORMAT_VERSION:
+        raise ValueError(f"snapshot format {header.get('version')}, expected {FORMAT_VERSION}")
+    header["header_bytes"] = length
+    return header
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    """Read a snapshot in one sequential read; returns a Snapshot"""
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        buffer = f.read()
+    header = _parse_header(buffer)
+    return Snapshot(path, header, buffer, round(time.perf_counter() - started, 3))
+
+def write_snapshot(path, documents, embedding_model, dtype=vector_index.VECTOR_DTYPE):
+    """
+    documents: {pdf name: {"collection", "manifest", "ids", "embeddings", "texts",
+    "metadatas", "lexical" (a LexicalIndex or None)}}. Written atomically.
+    """
+    parts, offset = [], 0
+
+    def place(data):
+        nonlocal offset
+        offset += (-offset) % ALIGN
+        parts.append((offset, data))
+        start = offset
+        offset += len(data)
+        return start
+
+    def place_array(array):
+        array = np.ascontiguousarray(array)
+        return [place(array.tobytes()), array.dtype.str, list(array.shape)]
+
+    header = {"format": "rag-index-snapshot", "version": FORMAT_VERSION, "embedding_model": embedding_model,
+              "created_at": datetime.now(timezone.utc).isoformat(), "documents": {}}
+    for name, document in sorted(documents.items()):
+        info, arrays, chunks = vector_index.VectorIndex.build(
+            document["ids"], document["embeddings"], document["texts"], document["metadatas"], dtype)
+        entry = {"collection": document["collection"], "manifest": document["manifest"],
+                 "vector": {"info": info, "arrays": {key: place_array(array) for key, array in arrays.items()},
+                            "chunks": [place(chunks), len(chunks)]}}
+        lexical = document.get("lexical")
+        if lexical is not None:
+            vocab = "\n".join(sorted(lexical.term_ids, key=lexical.term_ids.get)).encode("utf-8")
+            entry["lexical"] = {
+                "vocab": [place(vocab), len(vocab)],
+                "arrays": {"offsets": place_array(lexical.offsets), "postings": place_array(lexical.postings),
+                           "tfs": place_array(lexical.tfs), "lengths": place_array(lexical.lengths),
+                           "ids": place_array(np.array(lexical.ids, dtype="S"))},
+            }
+        header["documents"][name] = entry
+
+    raw_header = json.dumps(header).encode("utf-8")
+    # Pad the header so the data starts aligned
+    raw_header += b" " * ((-(len(MAGIC) + 8 + len(raw_header))) % ALIGN)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC + struct.pack("<Q", len(raw_header)) + raw_header)
+        position = 0
+        for start, data in parts:
+            f.write(b"\0" * (start - position))
+            f.write(data)
+            position = start + len(data)
+    os.replace(tmp_path, path)
+    return header
+
+def build_from_store(path=SNAPSHOT_PATH, dtype=vector_index.VECTOR_DTYPE):
+    """Snapshot every document of the local ingest manifest from chroma_db"""
+    import lexical_index
+    from retrieve import get_chroma_client, collection_name_for, document_collection, EMBEDDING_MODEL_NAME
+    from ingest_pdfs import load_manifest, _read_collection
+    client = get_chroma_client()
+    documents = {}
+    for name, entry in sorted(load_manifest()["documents"].items()):
+        collection = collection_name_for(name)
+        try:
+            rows = _read_collection(client.get_collection(document_collection(name)),
+                                    ["embeddings", "documents", "metadatas"])
+        except Exception as e:
+            print(f"[SNAPSHOT] Skipping {name}: {e}")
+            continue
+        lexical = lexical_index.load_index(collection) or LexicalIndex.build(rows["ids"], rows["documents"])
+        documents[name] = {"collection": collection, "manifest": entry, "ids": rows["ids"],
+                           "embeddings": rows["embeddings"], "texts": rows["documents"],
+                           "metadatas": rows["metadatas"], "lexical": lexical}
+        print(f"[SNAPSHOT] {name}: {len(rows['ids'])} chunks")
+    return write_snapshot(path, documents, EMBEDDING_MODEL_NAME, dtype)
+
+_snapshot = None
+_snapshot_checked = False
+_snapshot_lock = threading.Lock()
+
+def get_snapshot():
+    """The process-wide snapshot, read on first use; None if there is none or it can't be read"""
+    global _snapshot, _snapshot_checked
+    if _snapshot_checked:
+        return _snapshot
+    with _snapshot_lock:
+        if not _snapshot_checked:
+            if SNAPSHOT_ENABLED and os.path.exists(SNAPSHOT_PATH):
+                try:
+                    _snapshot = load_snapshot(SNAPSHOT_PATH)
+                    print(f"[SNAPSHOT] Loaded {len(_snapshot.documents)} documents "
+                          f"({_snapshot.size / (1024 * 1024):.1f}MB) in {_snapshot.load_seconds}s")
+                except Exception as e:
+                    print(f"[SNAPSHOT] Could not load {SNAPSHOT_PATH}: {e}")
+            _snapshot_checked = True
+    return _snapshot
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the prebuilt index snapshot")
+    parser.add_argument("command", choices=["build", "info"])
+    parser.add_argument("--out", default=SNAPSHOT_PATH, help="snapshot file (build) or file to inspect (info)")
+    parser.add_argument("--dtype", default=vector_index.VECTOR_DTYPE, choices=["int8", "float32"])
+    args = parser.parse_args()
+    if args.command == "build":
+        started = time.perf_counter()
+        header = build_from_store(args.out, args.dtype)
+        print(f"[SNAPSHOT] Wrote {len(header['documents'])} documents to {args.out} "
+              f"({os.path.getsize(args.out) / (1024 * 1024):.1f}MB) in {time.perf_counter() - started:.1f}s")
+    else:
+        if not os.path.exists(args.out):
+            sys.exit(f"No snapshot at {args.out}")
+        snapshot = load_snapshot(args.out)
+        print(json.dumps(dict(snapshot.status(), documents={
+            name: {"chunks": doc["vector"]["info"]["count"], "sha256": doc["manifest"].get("sha256"),
+                   "lexical": bool(doc.get("lexical"))}
+            for name, doc in snapshot.documents.items()}), indent=2))
+
+if __name__ == "__main__":
+    main()
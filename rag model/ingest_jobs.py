@@ -0,0 +1,205 @@
+"""
+In-process background ingestion for the RAG API.
+
+Uploads enqueue an incremental ingest of just the uploaded file; a small pool
+of worker threads runs ingest_pdfs.ingest_pdfs(only=[filename]) so the request
+thread returns immediately with a job ID that /api/rag/ingest-status/<job_id>
+can poll. Jobs for the same file are coalesced: while a job for a file is still
+queued, further uploads of that file return the same job.
+
+The queue lives in the process that accepted the upload, but every job is
+also written to catalog/ingest_jobs/<job_id>.json, so a status poll answered
+by another gunicorn worker still finds it. Job files are removed with the
+finished jobs they belong to, or after JOB_FILE_TTL if their process died.
+"""
+
+import os
+import json
+import uuid
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+INGEST_WORKERS = int(os.getenv("RAG_INGEST_WORKERS", "1"))
+# Finished jobs kept for status lookups
+MAX_FINISHED_JOBS = 500
+JOB_DIR = os.path.join(os.path.dirname(__file__), 'catalog', 'ingest_jobs')
+# Job files left behind by a worker that exited
+JOB_FILE_TTL = 24 * 3600
+
+def _job_path(job_id):
+    if not job_id or not all(c in "0123456789abcdef" for c in job_id):
+        return None
+    return os.path.join(JOB_DIR, f"{job_id}.json")
+
+def _write_job(job):
+    """Publish a job's state for the other worker processes"""
+    try:
+        os.makedirs(JOB_DIR, exist_ok=True)
+        path = _job_path(job["job_id"])
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"[INGEST JOBS] Could not write job {job['job_id']}: {e}")
+
+def _read_job(job_id):
+    path = _job_path(job_id)
+    if path is None:
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _remove_job_file(job_id):
+    try:
+        os.remove(_job_path(job_id))
+    except OSError:
+        pass
+
+class IngestQueue:
+    """Job registry plus worker threads consuming a FIFO of job IDs"""
+
+    def __init__(self, workers=INGEST_WORKERS):
+        self.workers = max(1, workers)
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()
+        self._queued_by_file = {}
+        self._threads = []
+        self._pool = None
+
+    def _start_workers(self):
+        if self._threads:
+            return
+        from work_pool import new_pool
+        # Ingestion is CPU-heavy: it runs on OS threads of its own (also under gevent),
+        # sized by RAG_INGEST_WORKERS and apart from the request pool (RAG_CPU_WORKERS)
+        self._pool = new_pool(self.workers, "rag-ingest")
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"ingest-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def enqueue(self, filename):
+        """Queue an ingest of one file and return its job (an existing queued job is reused)"""
+        with self._lock:
+            job_id = self._queued_by_file.get(filename)
+            if job_id is not None:
+                job = self._jobs[job_id]
+                job["coalesced"] += 1
+                _write_job(job)
+                return dict(job)
+
+            job = {
+                "job_id": uuid.uuid4().hex,
+                "filename": filename,
+                "status": "queued",
+                "stage": "queued",
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "pages": None,
+                "chunks": None,
+                "coalesced": 0,
+                "error": None,
+                "worker_pid": os.getpid(),
+            }
+            self._jobs[job["job_id"]] = job
+            self._queued_by_file[filename] = job["job_id"]
+            _write_job(job)
+            self._trim()
+            self._start_workers()
+        self._queue.put(job["job_id"])
+        return dict(job)
+
+    def _trim(self):
+        finished = [jid for jid, job in self._jobs.items() if job["status"] in ("done", "failed")]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+            _remove_job_file(job_id)
+        try:
+            entries = list(os.scandir(JOB_DIR))
+        except FileNotFoundError:
+            return
+        now = time.time()
+        for entry in entries:
+            try:
+                if now - entry.stat().st_mtime > JOB_FILE_TTL:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def get(self, job_id):
+        """A job from this process, or from the job file another worker wrote"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return dict(job)
+        return _read_job(job_id)
+
+    def depth(self):
+        """Jobs waiting to start"""
+        with self._lock:
+            return len(self._queued_by_file)
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields)
+            _write_job(job)
+
+    def _run(self):
+        from ingest_pdfs import ingest_pdfs
+        from work_pool import run_in
+
+        while True:
+            job_id = self._queue.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    continue
+                filename = job["filename"]
+                # From here on a new upload of the same file gets a new job
+                self._queued_by_file.pop(filename, None)
+                job.update(status="running", stage="hashing", started_at=time.time())
+                _write_job(job)
+
+            def progress(name, stage, **details):
+                if name == filename:
+                    self._update(job_id, stage=stage, **{k: v for k, v in details.items() if k in ("pages", "chunks")})
+
+            try:
+                summary = run_in(self._pool, ingest_pdfs, only=[filename], progress=progress)
+                if filename in summary["failed"]:
+                    raise RuntimeError(f"Ingestion of {filename} failed")
+                if filename in summary["indexed"]:
+                    # Answers generated from the old version of the file are stale
+                    from response_cache import get_response_cache
+                    get_response_cache().invalidate_pdf(filename)
+                self._update(job_id, status="done", stage="done", finished_at=time.time())
+            except Exception as e:
+                print(f"[INGEST JOBS] Job {job_id} for {filename} failed: {e}")
+                self._update(job_id, status="failed", error=str(e), finished_at=time.time())
+                try:
+                    from document_catalog import get_document_catalog
+                    record = get_document_catalog().get(filename)
+                    if record and record["status"] in ("queued", "indexing"):
+                        get_document_catalog().set_status(filename, "failed", error=str(e))
+                except Exception as catalog_error:
+                    print(f"[INGEST JOBS] Could not update document catalog: {catalog_error}")
+
+_ingest_queue = None
+_ingest_queue_lock = threading.Lock()
+
+def get_ingest_queue():
+    """Process-wide ingestion queue, created on first use"""
+    global _ingest_queue
+    with _ingest_queue_lock:
+        if _ingest_queue is None:
+            _ingest_queue = IngestQueue()
+        return _ingest_queue
@@ -1,102 +1,777 @@
 """
 PDF Ingestion Script for RAG System
 This script processes PDFs and stores them in ChromaDB for retrieval
+
+Ingestion is incremental: a manifest in chroma_db records the content hash and
+chunking parameters each PDF was indexed with, so unchanged PDFs are skipped,
+changed PDFs have their old chunks replaced and deleted PDFs have their vectors
+removed. Each document also gets a BM25 index (lexical_index.py) for hybrid
+retrieval and, with RAG_VECTOR_BACKEND=mmap, a memory-mapped vector index
+(vector_index.py) built from the same embeddings. Page text is extracted once
+per content hash into page_text_store, which the preview endpoints read too,
+and every state change is mirrored into the document catalog
+(document_catalog.py) behind /api/rag/list-pdfs.
+
+Run with --force to re-index everything, and --workers N to parse and chunk
+PDFs in N processes.
 """
 
 import os
 import sys
+import json
+import time
+import queue
+import hashlib
+import shutil
+import argparse
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timezone
 from pathlib import Path
-from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
+from retrieve import (
+    DB_DIR, DEFAULT_COLLECTION, EMBEDDING_MODEL_NAME, VECTOR_BACKEND,
+    collection_name_for, document_collection, get_chroma_client, get_embedding_function, local_write,
+    reload_vector_store
+)
+import lexical_index
+import vector_index
+import page_text_store
+from page_text_store import file_sha256
+from document_catalog import get_document_catalog
+
+try:
+    import fcntl
+except ImportError:  # Windows, where serve.py runs a single process
+    fcntl = None
 
 # Configuration
 PDF_DIR = os.path.join(os.path.dirname(__file__), 'pdfs')
-DB_DIR = os.path.join(os.path.dirname(__file__), 'chroma_db')
+MANIFEST_PATH = os.path.join(DB_DIR, 'ingest_manifest.json')
+MANIFEST_LOCK_PATH = MANIFEST_PATH + '.lock'
+MANIFEST_VERSION = 1
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+# Chunks per Chroma upsert (embedding batches are sized by token count in embedding_cache.py)
+WRITE_BATCH_SIZE = 1000
+# Compaction drops collection generations the manifest doesn't point at once they are this old
+STALE_GENERATION_SECONDS = 3600
+
+_manifest_lock = threading.Lock()
+
+def ingest_fingerprint(content_hash):
+    """Everything that changes a document's chunks or vectors"""
+    return f"{content_hash}:{CHUNK_SIZE}:{CHUNK_OVERLAP}:{EMBEDDING_MODEL_NAME}"
+
+def chunk_id(content_hash, index):
+    """Deterministic chunk ID so re-ingesting the same file upserts instead of duplicating"""
+    return hashlib.sha1(f"{content_hash}:{CHUNK_SIZE}:{CHUNK_OVERLAP}:{index}".encode()).hexdigest()
+
+def load_manifest():
+    try:
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+        print("[INGEST] Manifest version changed, re-indexing everything")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"[INGEST] Could not read manifest ({e}), re-indexing everything")
+    return {"version": MANIFEST_VERSION, "documents": {}}
+
+@contextmanager
+def _locked_manifest():
+    """
+    Hold the manifest for a read-modify-write: a thread lock for this
+    process plus an flock on MANIFEST_LOCK_PATH for the others (gunicorn
+    workers ingesting uploads, a command-line run).
+    """
+    with _manifest_lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(DB_DIR, exist_ok=True)
+        with open(MANIFEST_LOCK_PATH, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def update_manifest(name, entry):
+    """
+    Set (or with entry=None, remove) one document's manifest entry.
+    Re-reads the manifest under _locked_manifest() so concurrent ingest runs,
+    in this process or another, don't overwrite each other.
+    """
+    with _locked_manifest():
+        manifest = load_manifest()
+        if entry is None:
+            manifest["documents"].pop(name, None)
+        else:
+            manifest["documents"][name] = entry
+        save_manifest(manifest)
+
+def save_manifest(manifest):
+    """Write the manifest atomically so an interrupted run never leaves it half-written"""
+    os.makedirs(DB_DIR, exist_ok=True)
+    tmp_path = f"{MANIFEST_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+def new_collection_name(pdf_name):
+    """
+    A fresh generation of a document's collection. Writers fill it, point the
+    manifest entry at it ("collection") and only then drop the previous one,
+    so retrieve.document_collection() never resolves to a missing or
+    half-written collection.
+    """
+    return f"{collection_name_for(pdf_name)}_{time.time_ns():x}"
+
+def index_name_of(collection_name):
+    """The collection_name_for() name (BM25 / mmap index name) of a collection generation"""
+    prefix = len(collection_name_for(""))
+    return collection_name[:prefix] if collection_name.startswith("doc_") else collection_name
+
+def _generation_age(collection_name):
+    """Seconds since a collection generation was created (legacy unversioned names count as old)"""
+    stamp = collection_name[len(index_name_of(collection_name)) + 1:]
+    try:
+        return (time.time_ns() - int(stamp, 16)) / 1e9
+    except ValueError:
+        return float("inf")
+
+def _document_collections(client, pdf_name):
+    """Every generation of a document's collection in the store"""
+    prefix = collection_name_for(pdf_name)
+    return [name for name in (getattr(c, "name", c) for c in client.list_collections())
+            if name == prefix or name.startswith(prefix + "_")]
+
+def _drop_document_collections(client, pdf_name, keep=None):
+    """Delete a document's collections other than keep, and its rows in the legacy shared collection"""
+    for name in _document_collections(client, pdf_name):
+        if name != keep:
+            client.delete_collection(name)
+    try:
+        client.get_collection(DEFAULT_COLLECTION).delete(where={"source": pdf_name})
+    except Exception:
+        pass  # no legacy collection
+
+def remove_document_vectors(pdf_name):
+    """Delete every stored chunk of a document, from its own collections and the legacy shared one"""
+    lexical_index.remove_index(collection_name_for(pdf_name))
+    vector_index.remove_index(collection_name_for(pdf_name))
+    with local_write() as client:
+        _drop_document_collections(client, pdf_name)
+
+def rebuild_lexical_index(client, name, collection_name=None):
+    """
+    Build a collection's BM25 index from the chunks stored in it, e.g. for
+    documents ingested before lexical indexing existed. name is the index's
+    name (collection_name_for), collection_name the Chroma collection to read
+    if it differs. Returns the chunk count.
+    """
+    rows = _read_collection(client.get_collection(collection_name or name), ["documents"])
+    lexical_index.save_index(name, rows["ids"], rows["documents"])
+    return len(rows["ids"])
+
+def rebuild_vector_index(client, name, collection_name=None):
+    """Build a collection's memory-mapped vector index from the rows stored in it; returns the chunk count"""
+    rows = _read_collection(client.get_collection(collection_name or name), ["embeddings", "documents", "metadatas"])
+    vector_index.save_index(name, rows["ids"], rows["embeddings"], rows["documents"], rows["metadatas"])
+    return len(rows["ids"])
+
+# Splitter is built once per process (the main process or each pool worker)
+_text_splitter = None
+
+def get_text_splitter():
+    global _text_splitter
+    if _text_splitter is None:
+        _text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+            length_function=len,
+        )
+    return _text_splitter
+
+def parse_pdf(pdf_path, content_hash=None):
+    """
+    Load a PDF and split it into chunks tagged with its filename.
+    Pages come from page_text_store, which extracts them only if this content
+    never has been (e.g. for a preview). Runs inside pool workers, so it
+    returns plain picklable data.
+    """
+    name = os.path.basename(pdf_path)
+    started = time.perf_counter()
+    pages = page_text_store.load_documents(pdf_path, content_hash)
+    loaded = time.perf_counter()
+    chunks = get_text_splitter().split_documents(pages)
+    split_done = time.perf_counter()
+
+    metadatas = []
+    for chunk in chunks:
+        # Add source metadata
+        chunk.metadata['source'] = name
+        chunk.metadata['filename'] = name
+        metadatas.append(chunk.metadata)
+    return {
+        "pages": len(pages),
+        "texts": [chunk.page_content for chunk in chunks],
+        "metadatas": metadatas,
+        "load_seconds": loaded - started,
+        "split_seconds": split_done - loaded,
+    }
+
+def _iter_parsed(jobs, workers):
+    """
+    Yield (job, parsed, error) as files finish parsing.
+    With workers > 1 files are parsed in a process pool, keeping at most
+    2 * workers files in flight so parsed chunks never pile up in memory.
+    """
+    if workers <= 1:
+        for job in jobs:
+            try:
+                yield job, parse_pdf(job["path"], job["sha256"]), None
+            except Exception as e:
+                yield job, None, e
+        return
+
+    # spawn (not fork): the writer thread may already hold the embedding model
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        job_iter = iter(jobs)
+        pending = {}
+
+        def submit_next():
+            job = next(job_iter, None)
+            if job is not None:
+                pending[pool.submit(parse_pdf, job["path"], job["sha256"])] = job
+
+        for _ in range(workers * 2):
+            submit_next()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = pending.pop(future)
+                try:
+                    yield job, future.result(), None
+                except Exception as e:
+                    yield job, None, e
+                submit_next()
+
+def _write_document(job, parsed, entry, embedding_function, stats):
+    """
+    Replace a document's vectors with freshly parsed chunks. They go into a
+    new collection generation; the manifest entry is saved pointing at it
+    once it is complete, then the old generation is dropped. If anything
+    fails first, the document keeps serving its previous chunks.
+    """
+    name = job["path"].name
+    texts, metadatas = parsed["texts"], parsed["metadatas"]
+    ids = [chunk_id(job["sha256"], i) for i in range(len(texts))]
+
+    # Embedding stage: token-budgeted batches, repeated text served from the embedding cache
+    started = time.perf_counter()
+    computed_before = getattr(embedding_function, "embedded", 0)
+    embeddings = embedding_function.embed_documents(texts) if texts else []
+    stats["embed_seconds"] += time.perf_counter() - started
+    stats["embedded"] += len(texts)
+    if hasattr(embedding_function, "embedded"):
+        stats["embed_cached"] += len(texts) - (embedding_function.embedded - computed_before)
+
+    started = time.perf_counter()
+    collection_name = new_collection_name(name)
+    with local_write() as client:
+        collection = client.create_collection(collection_name, metadata={"source": name})
+        try:
+            for i in range(0, len(texts), WRITE_BATCH_SIZE):
+                collection.upsert(
+                    ids=ids[i:i+WRITE_BATCH_SIZE],
+                    embeddings=embeddings[i:i+WRITE_BATCH_SIZE],
+                    metadatas=metadatas[i:i+WRITE_BATCH_SIZE],
+                    documents=texts[i:i+WRITE_BATCH_SIZE],
+                )
+        except Exception:
+            client.delete_collection(collection_name)
+            raise
+    # Saved after every file so an interrupted run resumes where it stopped
+    update_manifest(name, dict(entry, collection=collection_name))
+    stats["write_seconds"] += time.perf_counter() - started
+
+    started = time.perf_counter()
+    lexical_index.save_index(collection_name_for(name), ids, texts)
+    stats["lexical_seconds"] += time.perf_counter() - started
+
+    if VECTOR_BACKEND == "mmap":
+        started = time.perf_counter()
+        vector_index.save_index(collection_name_for(name), ids, embeddings, texts, metadatas)
+        stats["vector_index_seconds"] += time.perf_counter() - started
+    elif vector_index.has_index(collection_name_for(name)):
+        vector_index.remove_index(collection_name_for(name))  # built from the old chunks
+
+    # Readers now resolve the new generation; the previous one can go
+    with local_write() as client:
+        _drop_document_collections(client, name, keep=collection_name)
+    print(f"[INGEST] {name}: stored {len(texts)} chunks")
+    return collection_name
+
+def _ensure_lexical_index(pdf_name):
+    """Backfill the BM25 index of an unchanged document that was indexed without one"""
+    name = collection_name_for(pdf_name)
+    if lexical_index.has_index(name):
+        return
+    client = get_chroma_client()
+    collection_name = document_collection(pdf_name)
+    if collection_name not in {getattr(c, "name", c) for c in client.list_collections()}:
+        return  # only in the legacy shared collection; re-ingesting it creates both
+    try:
+        chunks = rebuild_lexical_index(client, name, collection_name)
+        print(f"[INGEST] {pdf_name}: built BM25 index from {chunks} stored chunks")
+    except Exception as e:
+        print(f"[INGEST] {pdf_name}: could not build BM25 index: {e}")
+
+def _ensure_vector_index(pdf_name):
+    """Backfill the memory-mapped index of an unchanged document when RAG_VECTOR_BACKEND=mmap"""
+    name = collection_name_for(pdf_name)
+    if VECTOR_BACKEND != "mmap" or vector_index.has_index(name):
+        return
+    client = get_chroma_client()
+    collection_name = document_collection(pdf_name)
+    if collection_name not in {getattr(c, "name", c) for c in client.list_collections()}:
+        return
+    try:
+        chunks = rebuild_vector_index(client, name, collection_name)
+        print(f"[INGEST] {pdf_name}: built vector index from {chunks} stored chunks")
+    except Exception as e:
+        print(f"[INGEST] {pdf_name}: could not build vector index: {e}")
 
-def get_embedding_function():
-    """Get the embedding model"""
-    return HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+def _print_throughput(stats, workers, wall_seconds):
+    def rate(count, seconds):
+        return f"{count / seconds:.1f}" if seconds > 0 else "n/a"
+
+    print(f"[INGEST] Throughput ({workers} worker{'s' if workers != 1 else ''}, {wall_seconds:.1f}s wall):")
+    print(f"[INGEST]   parse: {stats['pages']} pages, {rate(stats['pages'], stats['parse_wall_seconds'])} pages/s "
+          f"({rate(stats['pages'], stats['load_seconds'])} pages/s per worker)")
+    print(f"[INGEST]   chunk: {stats['chunks']} chunks, {rate(stats['chunks'], stats['split_seconds'])} chunks/s per worker")
+    print(f"[INGEST]   embed: {stats['embedded']} embeddings ({stats['embed_cached']} from cache), "
+          f"{rate(stats['embedded'], stats['embed_seconds'])} embeddings/s")
+    print(f"[INGEST]   write: {rate(stats['embedded'], stats['write_seconds'])} chunks/s")
+    print(f"[INGEST]   bm25:  {rate(stats['embedded'], stats['lexical_seconds'])} chunks/s")
+    if VECTOR_BACKEND == "mmap":
+        print(f"[INGEST]   mmap:  {rate(stats['embedded'], stats['vector_index_seconds'])} chunks/s")
+
+def ingest_pdfs(only=None, force=False, workers=1, progress=None):
+    """
+    Ingest PDFs from the pdfs directory into ChromaDB.
+    only: optional list of filenames to (re)index; other manifest entries are left alone.
+    force: re-index even if the manifest says a file is unchanged.
+    workers: number of processes parsing and chunking PDFs in parallel. Parsed
+        chunks stream through a bounded queue to a single embedding/writer thread.
+    progress: optional callback(filename, stage, **details) with stage one of
+        "queued", "skipped", "parsed", "indexed" or "failed".
+    Returns a summary dict of what was added, skipped and removed.
+    """
 
-def ingest_pdfs():
-    """Ingest all PDFs from the pdfs directory into ChromaDB"""
-    
     print(f"[INGEST] Starting PDF ingestion...")
     print(f"[INGEST] PDF Directory: {PDF_DIR}")
     print(f"[INGEST] DB Directory: {DB_DIR}")
-    
+
+    summary = {"indexed": [], "skipped": [], "removed": [], "failed": [], "chunks": 0}
+
+    def report(name, stage, **details):
+        if progress is not None:
+            try:
+                progress(name, stage, **details)
+            except Exception as e:
+                print(f"[INGEST] Progress callback failed: {e}")
+
     # Get all PDF files
-    pdf_files = list(Path(PDF_DIR).glob("*.pdf"))
-    
+    pdf_files = sorted(Path(PDF_DIR).glob("*.pdf"))
+    if only is not None:
+        wanted = {os.path.basename(name) for name in only}
+        pdf_files = [p for p in pdf_files if p.name in wanted]
+
+    documents_state = load_manifest()["documents"]
+
+    # Drop vectors of PDFs that no longer exist
+    on_disk = {p.name for p in Path(PDF_DIR).glob("*.pdf")}
+    stale = [name for name in documents_state if name not in on_disk]
+    if only is not None:
+        stale = [name for name in stale if name in wanted]
+    for name in stale:
+        print(f"[INGEST] Removing vectors of deleted file: {name}")
+        remove_document_vectors(name)
+        page_text_store.remove_pages(documents_state[name].get("sha256", ""))
+        update_manifest(name, None)
+        get_document_catalog().remove(name)
+        summary["removed"].append(name)
+
     if not pdf_files:
         print("[INGEST] No PDF files found!")
-        return
-    
+        return summary
+
     print(f"[INGEST] Found {len(pdf_files)} PDF files")
-    
-    # Initialize embedding function
-    embedding_function = get_embedding_function()
-    
-    # Initialize or load existing ChromaDB
-    db = Chroma(
-        persist_directory=DB_DIR,
-        embedding_function=embedding_function
-    )
-    
-    # Process each PDF
-    all_documents = []
-    
+
+    # Work out which files changed since the last run
+    jobs = []
     for pdf_path in pdf_files:
-        print(f"\n[INGEST] Processing: {pdf_path.name}")
-        
         try:
-            # Load PDF
-            loader = PyPDFLoader(str(pdf_path))
-            documents = loader.load()
-            
-            print(f"[INGEST] Loaded {len(documents)} pages from {pdf_path.name}")
-            
-            # Split into chunks
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200,
-                length_function=len,
-            )
-            
-            chunks = text_splitter.split_documents(documents)
-            
-            # Add source metadata
-            for chunk in chunks:
-                chunk.metadata['source'] = pdf_path.name
-                chunk.metadata['filename'] = pdf_path.name
-            
-            all_documents.extend(chunks)
-            
-            print(f"[INGEST] Created {len(chunks)} chunks from {pdf_path.name}")
-            
+            stat = pdf_path.stat()
+            entry = documents_state.get(pdf_path.name)
+            # Same size and mtime as last time: trust the stored hash instead of re-reading the file
+            if entry and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+                content_hash = entry["sha256"]
+            else:
+                content_hash = file_sha256(pdf_path)
+            fingerprint = ingest_fingerprint(content_hash)
+            if not force and entry and entry.get("fingerprint") == fingerprint:
+                if entry.get("mtime_ns") != stat.st_mtime_ns:
+                    entry = dict(entry, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                    update_manifest(pdf_path.name, entry)
+                get_document_catalog().record_ingested(pdf_path.name, entry)
+                _ensure_lexical_index(pdf_path.name)
+                _ensure_vector_index(pdf_path.name)
+                summary["skipped"].append(pdf_path.name)
+                report(pdf_path.name, "skipped")
+                continue
+            jobs.append({"path": pdf_path, "sha256": content_hash, "fingerprint": fingerprint, "stat": stat})
+            get_document_catalog().set_status(pdf_path.name, "indexing", sha256=content_hash, size=stat.st_size,
+                                              mtime_ns=stat.st_mtime_ns, error=None)
+            report(pdf_path.name, "queued")
         except Exception as e:
-            print(f"[INGEST] Error processing {pdf_path.name}: {e}")
+            print(f"[INGEST] Error reading {pdf_path.name}: {e}")
+            summary["failed"].append(pdf_path.name)
+            get_document_catalog().set_status(pdf_path.name, "failed", error=str(e))
+            report(pdf_path.name, "failed", error=str(e))
+
+    if not jobs:
+        print(f"\n[INGEST] ✅ Everything up to date ({len(summary['skipped'])} PDFs unchanged)")
+        return summary
+
+    workers = max(1, min(workers, len(jobs)))
+    print(f"[INGEST] {len(jobs)} PDFs to index with {workers} parse worker(s)")
+
+    # Initialize embedding function once for all files
+    embedding_function = get_embedding_function()
+
+    stats = {"pages": 0, "chunks": 0, "embedded": 0, "load_seconds": 0.0, "split_seconds": 0.0,
+             "embed_seconds": 0.0, "embed_cached": 0, "write_seconds": 0.0, "lexical_seconds": 0.0,
+             "vector_index_seconds": 0.0, "parse_wall_seconds": 0.0}
+    parsed_queue = queue.Queue(maxsize=workers)
+
+    def writer():
+        while True:
+            item = parsed_queue.get()
+            if item is None:
+                return
+            job, parsed = item
+            name = job["path"].name
+            try:
+                entry = {
+                    "fingerprint": job["fingerprint"],
+                    "sha256": job["sha256"],
+                    "size": job["stat"].st_size,
+                    "mtime_ns": job["stat"].st_mtime_ns,
+                    "chunk_size": CHUNK_SIZE,
+                    "chunk_overlap": CHUNK_OVERLAP,
+                    "embedding_model": EMBEDDING_MODEL_NAME,
+                    "pages": parsed["pages"],
+                    "chunks": len(parsed["texts"]),
+                    "ingested_at": datetime.now(timezone.utc).isoformat(),
+                }
+                entry["collection"] = _write_document(job, parsed, entry, embedding_function, stats)
+                get_document_catalog().record_ingested(name, entry)
+                previous = documents_state.get(name)
+                if previous and previous.get("sha256") not in (None, job["sha256"]):
+                    # Extracted pages of the old version are never read again
+                    page_text_store.remove_pages(previous["sha256"])
+                summary["indexed"].append(name)
+                summary["chunks"] += len(parsed["texts"])
+                report(name, "indexed", chunks=len(parsed["texts"]))
+            except Exception as e:
+                print(f"[INGEST] Error indexing {name}: {e}")
+                summary["failed"].append(name)
+                get_document_catalog().set_status(name, "failed", error=str(e))
+                report(name, "failed", error=str(e))
+
+    started = time.perf_counter()
+    writer_thread = threading.Thread(target=writer, name="ingest-writer", daemon=True)
+    writer_thread.start()
+    try:
+        for job, parsed, error in _iter_parsed(jobs, workers):
+            name = job["path"].name
+            if error is not None:
+                print(f"[INGEST] Error processing {name}: {error}")
+                summary["failed"].append(name)
+                get_document_catalog().set_status(name, "failed", error=str(error))
+                report(name, "failed", error=str(error))
+                continue
+            print(f"[INGEST] Parsed {name}: {parsed['pages']} pages, {len(parsed['texts'])} chunks")
+            report(name, "parsed", pages=parsed["pages"], chunks=len(parsed["texts"]))
+            stats["pages"] += parsed["pages"]
+            stats["chunks"] += len(parsed["texts"])
+            stats["load_seconds"] += parsed["load_seconds"]
+            stats["split_seconds"] += parsed["split_seconds"]
+            # Blocks while the writer is behind, which also stops new files being submitted
+            parsed_queue.put((job, parsed))
+        stats["parse_wall_seconds"] = time.perf_counter() - started
+    finally:
+        parsed_queue.put(None)
+        writer_thread.join()
+
+    print(f"\n[INGEST] ✅ Indexed {len(summary['indexed'])} PDFs ({summary['chunks']} chunks), "
+          f"skipped {len(summary['skipped'])} unchanged, removed {len(summary['removed'])} deleted")
+    _print_throughput(stats, workers, time.perf_counter() - started)
+    print(f"[INGEST] Database saved to: {DB_DIR}")
+    return summary
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def store_stats(client):
+    """Collection count, vector count and on-disk size of chroma_db"""
+    collections = client.list_collections()
+    return {
+        "collections": len(collections),
+        "vectors": sum(client.get_collection(getattr(c, "name", c)).count() for c in collections),
+        "disk_bytes": _dir_size(DB_DIR),
+    }
+
+def _read_collection(collection, include, page_size=1000):
+    """All rows of a collection, read in pages"""
+    rows = {"ids": []}
+    for key in include:
+        rows[key] = []
+    offset = 0
+    while True:
+        page = collection.get(include=include, limit=page_size, offset=offset)
+        if not page["ids"]:
+            return rows
+        rows["ids"].extend(page["ids"])
+        for key in include:
+            rows[key].extend(page[key])
+        offset += len(page["ids"])
+
+def _duplicate_ids(collection):
+    """IDs of chunks whose text already appears earlier in the same collection"""
+    rows = _read_collection(collection, ["documents"])
+    seen, duplicates = set(), []
+    for chunk_id_, text in zip(rows["ids"], rows["documents"]):
+        digest = hashlib.sha1((text or "").encode("utf-8")).digest()
+        if digest in seen:
+            duplicates.append(chunk_id_)
+        else:
+            seen.add(digest)
+    return duplicates
+
+# Suffix of the copy a collection without generations is rebuilt into
+COMPACT_SUFFIX = "_compact"
+
+def _rebuild_collection(client, name):
+    """
+    Recreate a collection from its live rows. Chroma's HNSW index only marks
+    deleted vectors, so this is what actually reclaims their space.
+    The rows are copied into a new collection and the old one is dropped only
+    once the copy is complete:
+    - a document with a manifest entry gets a new generation, and its entry is
+      pointed at it before the old one goes (as in _write_document)
+    - any other collection (the legacy shared one) is copied to
+      <name>_compact, which is renamed over the original once that is
+      deleted; _recover_compaction() finishes the rename if we die in between
+    Returns the name of the rebuilt collection.
+    """
+    collection = client.get_collection(name)
+    metadata = collection.metadata
+    rows = _read_collection(collection, ["embeddings", "metadatas", "documents"])
+    source = (metadata or {}).get("source") if name.startswith("doc_") else None
+    entry = load_manifest()["documents"].get(source) if source else None
+    target = new_collection_name(source) if entry is not None else name + COMPACT_SUFFIX
+
+    rebuilt = client.create_collection(target, metadata=metadata)
+    try:
+        for i in range(0, len(rows["ids"]), WRITE_BATCH_SIZE):
+            rebuilt.add(
+                ids=rows["ids"][i:i+WRITE_BATCH_SIZE],
+                embeddings=[list(e) for e in rows["embeddings"][i:i+WRITE_BATCH_SIZE]],
+                metadatas=rows["metadatas"][i:i+WRITE_BATCH_SIZE],
+                documents=rows["documents"][i:i+WRITE_BATCH_SIZE],
+            )
+    except Exception:
+        client.delete_collection(target)
+        raise
+
+    if entry is not None:
+        update_manifest(source, dict(entry, collection=target))
+        client.delete_collection(name)
+        return target
+    client.delete_collection(name)
+    rebuilt.modify(name=name)
+    return name
+
+def _recover_compaction(client):
+    """
+    Finish or undo rebuilds a previous compaction didn't complete: a copy
+    whose original is gone was complete (the original is only deleted after
+    the copy) and takes its name; a copy next to its original is dropped.
+    """
+    names = {getattr(c, "name", c) for c in client.list_collections()}
+    for name in sorted(names):
+        if not name.endswith(COMPACT_SUFFIX):
             continue
-    
-    if all_documents:
-        print(f"\n[INGEST] Adding {len(all_documents)} total chunks to ChromaDB...")
-        
-        # Add documents to ChromaDB in batches
-        batch_size = 100
-        for i in range(0, len(all_documents), batch_size):
-            batch = all_documents[i:i+batch_size]
-            db.add_documents(batch)
-            print(f"[INGEST] Added batch {i//batch_size + 1}/{(len(all_documents)-1)//batch_size + 1}")
-        
-        print(f"\n[INGEST] ✅ Successfully ingested {len(all_documents)} chunks from {len(pdf_files)} PDFs")
-        print(f"[INGEST] Database saved to: {DB_DIR}")
-    else:
-        print("[INGEST] No documents to ingest!")
+        original = name[:-len(COMPACT_SUFFIX)]
+        if original in names:
+            client.delete_collection(name)
+        else:
+            print(f"[COMPACT] Restoring {original} from an interrupted rebuild")
+            client.get_collection(name).modify(name=original)
+
+def _remove_orphan_segment_dirs(client):
+    """Delete segment directories that no collection in chroma.sqlite3 refers to any more"""
+    import sqlite3
+    sqlite_path = os.path.join(DB_DIR, "chroma.sqlite3")
+    with sqlite3.connect(sqlite_path) as conn:
+        live = {row[0] for row in conn.execute("SELECT id FROM segments")}
+    removed = []
+    for entry in os.scandir(DB_DIR):
+        if entry.is_dir() and entry.name not in live and len(entry.name) == 36 and entry.name.count("-") == 4:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed.append(entry.name)
+    return removed
+
+def _vacuum_sqlite():
+    import sqlite3
+    try:
+        conn = sqlite3.connect(os.path.join(DB_DIR, "chroma.sqlite3"))
+        conn.execute("VACUUM")
+        conn.close()
+        return True
+    except Exception as e:
+        print(f"[COMPACT] VACUUM skipped: {e}")
+        return False
+
+def compact_store(dry_run=False):
+    """
+    Remove orphaned and duplicate chunks, then compact chroma_db.
+    - per-document collections and legacy rows whose PDF is no longer in pdfs/
+    - legacy shared-collection rows for PDFs that now have their own collection
+    - chunks with the same text as an earlier chunk in the same collection
+    Returns a report with before/after vector counts and on-disk size.
+    """
+    on_disk = {p.name for p in Path(PDF_DIR).glob("*.pdf")}
+    report = {"dry_run": dry_run, "orphan_collections": [], "orphan_chunks": 0,
+              "superseded_chunks": 0, "duplicate_chunks": 0, "stale_generations": [], "rebuilt_collections": [],
+              "removed_segment_dirs": [], "removed_lexical_indexes": [], "removed_vector_indexes": [],
+              "vacuumed": False}
+
+    with local_write() as client:
+        if not dry_run:
+            _recover_compaction(client)
+        report["before"] = store_stats(client)
+        collection_names = [getattr(c, "name", c) for c in client.list_collections()]
+        changed = set()
+
+        for name in collection_names:
+            collection = client.get_collection(name)
+
+            if name == DEFAULT_COLLECTION:
+                rows = _read_collection(collection, ["metadatas"])
+                stale_ids = []
+                for row_id, metadata in zip(rows["ids"], rows["metadatas"]):
+                    source = os.path.basename(str((metadata or {}).get("source", "")))
+                    if source not in on_disk:
+                        report["orphan_chunks"] += 1
+                        stale_ids.append(row_id)
+                    elif document_collection(source) in collection_names:
+                        report["superseded_chunks"] += 1
+                        stale_ids.append(row_id)
+                if stale_ids and not dry_run:
+                    for i in range(0, len(stale_ids), WRITE_BATCH_SIZE):
+                        collection.delete(ids=stale_ids[i:i+WRITE_BATCH_SIZE])
+                    changed.add(name)
+            elif name.startswith("doc_"):
+                source = (collection.metadata or {}).get("source")
+                if source not in on_disk:
+                    report["orphan_collections"].append(source or name)
+                    if not dry_run:
+                        client.delete_collection(name)
+                        index_name = collection_name_for(source) if source else name
+                        lexical_index.remove_index(index_name)
+                        vector_index.remove_index(index_name)
+                    continue
+                if name != document_collection(source) and _generation_age(name) > STALE_GENERATION_SECONDS:
+                    # Left behind by an interrupted ingest (newer ones may still be being written)
+                    report["stale_generations"].append(name)
+                    if not dry_run:
+                        client.delete_collection(name)
+                    continue
+
+            duplicates = _duplicate_ids(collection)
+            report["duplicate_chunks"] += len(duplicates)
+            if duplicates and not dry_run:
+                collection.delete(ids=duplicates)
+                changed.add(name)
+
+        if not dry_run:
+            for name in changed:
+                name = _rebuild_collection(client, name)
+                report["rebuilt_collections"].append(name)
+                # Keep BM25 postings pointing at chunks that still exist
+                if name.startswith("doc_"):
+                    rebuild_lexical_index(client, index_name_of(name), name)
+                    if VECTOR_BACKEND == "mmap" or vector_index.has_index(index_name_of(name)):
+                        rebuild_vector_index(client, index_name_of(name), name)
+            # Lexical indexes whose collection is gone (indexes are named after the document, not the generation)
+            live = {index_name_of(getattr(c, "name", c)) for c in client.list_collections()}
+            for name in sorted(lexical_index.indexed_names() - live):
+                lexical_index.remove_index(name)
+                report["removed_lexical_indexes"].append(name)
+            for name in sorted(vector_index.indexed_names() - live):
+                vector_index.remove_index(name)
+                report["removed_vector_indexes"].append(name)
+            # Manifest entries for files that are gone
+            for name in load_manifest()["documents"]:
+                if name not in on_disk:
+                    update_manifest(name, None)
+
+    if not dry_run:
+        report["removed_segment_dirs"] = _remove_orphan_segment_dirs(client)
+        report["vacuumed"] = _vacuum_sqlite()
+        reload_vector_store()
+
+    with local_write() as client:
+        report["after"] = store_stats(client)
+
+    before, after = report["before"], report["after"]
+    print(f"[COMPACT] Vectors: {before['vectors']} -> {after['vectors']}, "
+          f"disk: {before['disk_bytes'] / 1e6:.1f} MB -> {after['disk_bytes'] / 1e6:.1f} MB"
+          f"{' (dry run)' if dry_run else ''}")
+    return report
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally index PDFs into ChromaDB")
+    parser.add_argument("files", nargs="*", help="only (re)index these filenames from pdfs/")
+    parser.add_argument("--force", action="store_true", help="re-index even unchanged files")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes used to parse and chunk PDFs in parallel (default: 1)")
+    parser.add_argument("--compact", action="store_true",
+                        help="remove orphaned/duplicate chunks and compact chroma_db instead of ingesting")
+    parser.add_argument("--dry-run", action="store_true", help="with --compact, only report what would be removed")
+    args = parser.parse_args()
     try:
-        ingest_pdfs()
+        if args.compact:
+            print(json.dumps(compact_store(dry_run=args.dry_run), indent=2))
+        else:
+            ingest_pdfs(only=args.files or None, force=args.force, workers=args.workers)
     except Exception as e:
         print(f"[INGEST] Fatal error: {e}")
         sys.exit(1)
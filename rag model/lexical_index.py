@@ -0,0 +1,201 @@
+"""
+Per-document BM25 inverted index, built at ingest time next to the document's
+Chroma collection.
+
+Vector search over MiniLM embeddings misses exact terms: syllabus keywords,
+acronyms and identifiers such as "OOP" or "TCP three-way handshake". Retrieval
+runs BM25 over this index alongside the vector search and merges the two
+rankings with reciprocal rank fusion (see retrieve._hybrid_search).
+
+One .npz per document in chroma_db/lexical/, named after its collection:
+- vocab: sorted terms, newline-joined UTF-8
+- offsets / postings / tfs: CSR postings lists (chunk index and term frequency)
+- lengths: tokens per chunk
+- ids: the chunks' Chroma IDs, used to fetch the matched chunks
+"""
+
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+import numpy as np
+
+# Inside chroma_db so it is copied and deleted together with the vectors
+LEXICAL_DIR = os.path.join(os.path.dirname(__file__), 'chroma_db', 'lexical')
+INDEX_VERSION = 1
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Indexes kept loaded in memory
+MAX_LOADED = int(os.getenv("RAG_LEXICAL_CACHE_SIZE", "32"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#]*")
+STOPWORDS = frozenset("""
+a an and are as at be been but by can do does for from had has have how if in into is it its
+of on or so such than that the their them then there these they this those to was were what
+when where which while who why will with would you your
+""".split())
+
+def tokenize(text):
+    """Lowercased alphanumeric terms (c++ and c# kept whole), stopwords dropped"""
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS and len(t) <= 40]
+
+class LexicalIndex:
+    def __init__(self, terms, offsets, postings, tfs, lengths, ids):
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.postings = postings
+        self.tfs = tfs
+        self.lengths = lengths
+        self.ids = ids
+        average = float(lengths.mean()) if len(lengths) else 0.0
+        # Length normalisation part of the BM25 denominator, per chunk
+        self._norm = (BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(average, 1.0))).astype(np.float32)
+
+    @classmethod
+    def build(cls, ids, texts):
+        postings = {}
+        lengths = np.zeros(len(texts), dtype=np.uint32)
+        for index, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths[index] = sum(counts.values())
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((index, tf))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.uint32)
+        chunk_list, tf_list = [], []
+        for n, term in enumerate(terms):
+            entries = postings[term]
+            offsets[n + 1] = offsets[n] + len(entries)
+            chunk_list.extend(index for index, _ in entries)
+            tf_list.extend(min(tf, 65535) for _, tf in entries)
+        return cls(terms, offsets, np.array(chunk_list, dtype=np.uint32),
+                   np.array(tf_list, dtype=np.uint16), lengths, list(ids))
+
+    def search(self, query, k):
+        """Top k (chunk_id, score) pairs by BM25; chunks matching no query term are left out"""
+        count = len(self.ids)
+        if not count or k <= 0:
+            return []
+        scores = np.zeros(count, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            chunks = self.postings[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            df = end - start
+            idf = np.log(1.0 + (count - df + 0.5) / (df + 0.5))
+            # Each chunk appears at most once per postings list, so plain fancy-index += is safe
+            scores[chunks] += idf * tf * (BM25_K1 + 1) / (tf + self._norm[chunks])
+
+        hits = np.flatnonzero(scores)
+        if hits.size > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(self.ids[i], float(scores[i])) for i in hits]
+
+    def save(self, path):
+        """Write atomically so a reader never loads a half-written index"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        terms = sorted(self.term_ids, key=self.term_ids.get)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                version=np.array(INDEX_VERSION),
+                vocab=np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8),
+                offsets=self.offsets,
+                postings=self.postings,
+                tfs=self.tfs,
+                lengths=self.lengths,
+                ids=np.array(self.ids, dtype="S"),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data["version"]) != INDEX_VERSION:
+                return None
+            vocab = data["vocab"].tobytes().decode("utf-8")
+            terms = vocab.split("\n") if vocab else []
+            return cls(terms, data["offsets"], data["postings"], data["tfs"], data["lengths"],
+                       [i.decode("ascii") for i in data["ids"]])
+
+def index_path(name):
+    """Index file for a collection name (retrieve.collection_name_for)"""
+    return os.path.join(LEXICAL_DIR, f"{name}.npz")
+
+def save_index(name, ids, texts):
+    index = LexicalIndex.build(ids, texts)
+    index.save(index_path(name))
+    return index
+
+def remove_index(name):
+    try:
+        os.remove(index_path(name))
+    except FileNotFoundError:
+        pass
+
+def has_index(name):
+    return os.path.exists(index_path(name))
+
+def indexed_names():
+    """Collection names that have a lexical index on disk"""
+    try:
+        return {entry.name[:-4] for entry in os.scandir(LEXICAL_DIR) if entry.name.endswith(".npz")}
+    except FileNotFoundError:
+        return set()
+
+# name -> ((mtime_ns, size), LexicalIndex), most recently used last
+_loaded = OrderedDict()
+_loaded_lock = threading.Lock()
+
+def load_index(name):
+    """
+    The document's index, or None if it has none (e.g. ingested before lexical
+    indexing existed). Cached in memory and reloaded when the file changes.
+    """
+    path = index_path(name)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _loaded_lock:
+        cached = _loaded.get(name)
+        if cached is not None and cached[0] == signature:
+            _loaded.move_to_end(name)
+            return cached[1]
+    try:
+        index = LexicalIndex.load(path)
+    except Exception as e:
+        print(f"[RETRIEVE] Could not load lexical index {path}: {e}")
+        return None
+    with _loaded_lock:
+        _loaded[name] = (signature, index)
+        _loaded.move_to_end(name)
+        while len(_loaded) > MAX_LOADED:
+            _loaded.popitem(last=False)
+    return index
+
+def reciprocal_rank_fusion(rankings, k, key=None, rrf_k=60, with_scores=False):
+    """
+    Merge ranked lists: each item scores sum(1 / (rrf_k + rank)) over the
+    lists it appears in. key(item) identifies the same item across lists
+    (default: the item itself). Returns the top k items, or (item, score)
+    pairs with with_scores=True; the first list's object is kept for duplicates.
+    """
+    key = key or (lambda item: item)
+    scores, items = {}, {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            item_key = key(item)
+            scores[item_key] = scores.get(item_key, 0.0) + 1.0 / (rrf_k + rank + 1)
+            items.setdefault(item_key, item)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    if with_scores:
+        return [(items[item_key], scores[item_key]) for item_key in best]
+    return [items[item_key] for item_key in best]
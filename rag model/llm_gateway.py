@@ -0,0 +1,357 @@
+"""
+Shared gateway for Groq chat completions (generate-answer, generate-quiz, quick answers).
+
+One process-wide Groq client with a pooled keep-alive HTTP connection pool,
+instead of a new client (and TLS handshake) per request, plus:
+- an adaptive concurrency limit (AIMD): shrinks multiplicatively when Groq
+  answers 429 or latency spikes well above its recent baseline, grows back by
+  roughly one slot per limit's worth of successful calls
+- token buckets for requests and tokens per minute, sized from
+  GROQ_REQUESTS_PER_MINUTE / GROQ_TOKENS_PER_MINUTE, with the token budget
+  synced to Groq's x-ratelimit-* response headers
+- retries of 429, 5xx and connection errors with jittered exponential backoff
+  (honouring Retry-After)
+
+When a call still cannot be made (queue wait timed out, retries exhausted on
+429) LLMUnavailable is raised so the API can answer 503 with Retry-After
+instead of a generic 500. GROQ_BASE_URL points the client at another server,
+e.g. benchmarks/groq_stub.py.
+"""
+
+import os
+import time
+import random
+import threading
+
+MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "16"))
+MIN_CONCURRENCY = int(os.getenv("GROQ_MIN_CONCURRENCY", "1"))
+INITIAL_CONCURRENCY = int(os.getenv("GROQ_INITIAL_CONCURRENCY", "8"))
+# 0 disables the bucket; set these to your Groq tier's limits
+REQUESTS_PER_MINUTE = float(os.getenv("GROQ_REQUESTS_PER_MINUTE", "0"))
+TOKENS_PER_MINUTE = float(os.getenv("GROQ_TOKENS_PER_MINUTE", "0"))
+MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("GROQ_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("GROQ_BACKOFF_MAX", "8"))
+# Seconds a request may wait for a concurrency slot / rate budget before giving up
+QUEUE_TIMEOUT = float(os.getenv("GROQ_QUEUE_TIMEOUT", "30"))
+REQUEST_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "60"))
+# A call slower than this multiple of the recent baseline counts as a latency spike
+LATENCY_SPIKE_FACTOR = float(os.getenv("GROQ_LATENCY_SPIKE_FACTOR", "2.5"))
+
+class LLMUnavailable(RuntimeError):
+    """The provider is rate limiting us or the gateway queue is saturated"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Blocking token bucket refilled continuously at rate_per_minute (0 = unlimited)"""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self._cond = threading.Condition()
+        self.set_rate(rate_per_minute, capacity)
+
+    def set_rate(self, rate_per_minute, capacity=None):
+        with self._cond:
+            self.rate = rate_per_minute / 60.0
+            # Groq enforces limits per minute, so a minute's worth may go out at once
+            self.capacity = capacity or rate_per_minute
+            self.tokens = self.capacity
+            self.updated = time.monotonic()
+            self._cond.notify_all()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1, timeout=None):
+        """Take amount tokens, waiting up to timeout seconds; False if they did not come in time"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if not self.rate:
+                return True
+            amount = min(amount, self.capacity)
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return True
+                wait = (amount - self.tokens) / self.rate
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    wait = min(wait, remaining)
+                self._cond.wait(wait)
+
+    def sync(self, remaining):
+        """Never believe we have more budget than the provider says is left"""
+        with self._cond:
+            if self.rate:
+                self._refill()
+                self.tokens = min(self.tokens, remaining)
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit driven by throttling and latency feedback"""
+
+    def __init__(self, initial=INITIAL_CONCURRENCY, minimum=MIN_CONCURRENCY, maximum=MAX_CONCURRENCY,
+                 decrease_ratio=0.7, spike_factor=LATENCY_SPIKE_FACTOR, cooldown=1.0):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.decrease_ratio = decrease_ratio
+        self.spike_factor = spike_factor
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._baselines = {}
+        self._last_decrease = 0.0
+        self.counters = {"decreases": 0, "increases": 0, "queue_timeouts": 0}
+
+    def acquire(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self.counters["queue_timeouts"] += 1
+                    return False
+                self._cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def release(self, outcome, latency=None, key=None):
+        """outcome: "ok", "throttled" or "error" (errors do not move the limit)"""
+        with self._cond:
+            self.in_flight -= 1
+            if outcome == "throttled":
+                self._decrease()
+            elif outcome == "ok":
+                baseline = self._baselines.get(key) if latency is not None else None
+                if baseline and latency > baseline * self.spike_factor:
+                    self._decrease()
+                else:
+                    self._increase()
+                if latency is not None:
+                    # Slow EWMA so one spike doesn't immediately become the new normal
+                    self._baselines[key] = latency if baseline is None else baseline * 0.9 + latency * 0.1
+            self._cond.notify_all()
+
+    def _decrease(self):
+        now = time.monotonic()
+        # A burst of 429s from one overloaded moment should shrink the limit once
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * self.decrease_ratio)
+        self.counters["decreases"] += 1
+
+    def _increase(self):
+        if self.limit < self.maximum:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self.counters["increases"] += 1
+
+    def stats(self):
+        with self._cond:
+            return dict(self.counters, limit=round(self.limit, 2), in_flight=self.in_flight)
+
+def estimate_request_tokens(completion_args):
+    """Rough token cost of a request as Groq counts it: prompt plus max_tokens"""
+    prompt_chars = sum(len(m.get("content") or "") for m in completion_args.get("messages", []))
+    return prompt_chars // 4 + int(completion_args.get("max_tokens") or 1024)
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def _parse_reset(value):
+    """Groq reset headers look like "7.66s", "2m59.56s" or "120ms" """
+    if not value:
+        return None
+    try:
+        if value.endswith("ms"):
+            return float(value[:-2]) / 1000
+        seconds = 0.0
+        if "m" in value:
+            minutes, value = value.split("m", 1)
+            seconds += float(minutes) * 60
+        return seconds + float(value.rstrip("s") or 0)
+    except ValueError:
+        return None
+
+class LLMGateway:
+    def __init__(self, api_key=None, base_url=None, limiter=None,
+                 requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+                 max_retries=MAX_RETRIES, queue_timeout=QUEUE_TIMEOUT):
+        import httpx
+        from groq import Groq
+
+        self.limiter = limiter or AdaptiveLimiter()
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self._tokens_configured = bool(tokens_per_minute)
+        self.max_retries = max_retries
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "retries": 0, "throttled": 0, "errors": 0, "rejected": 0,
+                         "prompt_tokens": 0, "completion_tokens": 0}
+
+        http_client = httpx.Client(
+            timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=10.0),
+            limits=httpx.Limits(max_connections=self.limiter.maximum,
+                                max_keepalive_connections=self.limiter.maximum,
+                                keepalive_expiry=60.0),
+        )
+        # Retries happen here, where they can feed the concurrency limit
+        self.client = Groq(api_key=api_key or os.getenv("GROQ_API_KEY"),
+                           base_url=base_url or os.getenv("GROQ_BASE_URL") or None,
+                           http_client=http_client, max_retries=0)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def _count_usage(self, usage):
+        """Token counts Groq reports for a completion (the last chunk's x_groq.usage for streams)"""
+        if usage is None:
+            return
+        self._count("prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+        self._count("completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+
+    def _admit(self, completion_args):
+        """Wait for rate budget and a concurrency slot"""
+        if not self.request_bucket.acquire(1, self.queue_timeout):
+            self._count("rejected")
+            raise LLMUnavailable("LLM request rate limit reached, try again shortly", retry_after=5)
+        if not self.token_bucket.acquire(estimate_request_tokens(completion_args), self.queue_timeout):
+            self._count("rejected")
+            raise LLMUnavailable("LLM token rate limit reached, try again shortly", retry_after=5)
+        if not self.limiter.acquire(self.queue_timeout):
+            self._count("rejected")
+            raise LLMUnavailable("Too many LLM requests in flight, try again shortly", retry_after=2)
+
+    def _observe_headers(self, headers):
+        remaining = headers.get("x-ratelimit-remaining-tokens")
+        if remaining is None:
+            return
+        try:
+            if not self._tokens_configured and headers.get("x-ratelimit-limit-tokens"):
+                self.token_bucket.set_rate(float(headers["x-ratelimit-limit-tokens"]))
+                self._tokens_configured = True
+            self.token_bucket.sync(float(remaining))
+        except ValueError:
+            pass
+
+    def _backoff(self, attempt, error):
+        delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+        retry_after = _retry_after(error)
+        if retry_after is None and getattr(error, "response", None) is not None:
+            retry_after = _parse_reset(error.response.headers.get("x-ratelimit-reset-requests"))
+        if retry_after is not None:
+            delay = min(BACKOFF_MAX, retry_after) + random.uniform(0, BACKOFF_BASE)
+        time.sleep(delay)
+
+    def _call(self, open_call, completion_args):
+        """Run open_call() with admission, feedback and retries; returns (result, latency)"""
+        import groq
+
+        key = (completion_args.get("model"), bool(completion_args.get("stream")))
+        for attempt in range(self.max_retries + 1):
+            self._admit(completion_args)
+            self._count("calls")
+            started = time.perf_counter()
+            try:
+                result = open_call()
+            except groq.RateLimitError as e:
+                self.limiter.release("throttled")
+                self._count("throttled")
+                error = e
+            except (groq.InternalServerError, groq.APIConnectionError) as e:
+                self.limiter.release("error")
+                self._count("errors")
+                error = e
+            except Exception:
+                self.limiter.release("error")
+                self._count("errors")
+                raise
+            else:
+                return result, key, started
+
+            if attempt == self.max_retries:
+                if isinstance(error, groq.RateLimitError):
+                    raise LLMUnavailable("LLM provider is rate limiting requests, try again shortly",
+                                         retry_after=_retry_after(error) or 5) from error
+                raise error
+            self._count("retries")
+            self._backoff(attempt, error)
+
+    def complete(self, **completion_args):
+        """chat.completions.create through the gateway"""
+        raw, key, started = self._call(
+            lambda: self.client.chat.completions.with_raw_response.create(**completion_args), completion_args
+        )
+        self.limiter.release("ok", time.perf_counter() - started, key)
+        self._observe_headers(raw.headers)
+        completion = raw.parse()
+        self._count_usage(getattr(completion, "usage", None))
+        return completion
+
+    def stream(self, **completion_args):
+        """
+        Yield content deltas of a streamed completion. Failures before the
+        stream opens are retried; the concurrency slot is held until the
+        stream is exhausted or the consumer stops iterating.
+        """
+        completion_args = dict(completion_args, stream=True)
+        stream, key, started = self._call(
+            lambda: self.client.chat.completions.create(**completion_args), completion_args
+        )
+        self._observe_headers(stream.response.headers)
+        outcome, first_token = "error", None
+        try:
+            for chunk in stream:
+                x_groq = getattr(chunk, "x_groq", None)
+                if x_groq is not None:
+                    self._count_usage(getattr(x_groq, "usage", None))
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if not text:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                yield text
+            outcome = "ok"
+        finally:
+            stream.response.close()
+            # Time to first token is the latency signal for streams
+            self.limiter.release(outcome, first_token, key)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        return dict(counters, concurrency=self.limiter.stats(),
+                    requests_per_minute=round(self.request_bucket.rate * 60, 1),
+                    tokens_per_minute=round(self.token_bucket.rate * 60, 1))
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+def get_llm_gateway():
+    """Process-wide gateway, created on first use (after any gunicorn fork)"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+        return _gateway
+
+def gateway_stats():
+    """Stats without creating the gateway"""
+    return _gateway.stats() if _gateway is not None else None
@@ -0,0 +1,147 @@
+"""
+Incremental parser for the MCQ arrays generate-quiz asks Groq for.
+
+Completions are fed in as they stream. Each top-level {...} object is parsed
+and validated the moment its closing brace arrives, so valid questions are
+usable long before the completion ends. A malformed, incomplete or invalid
+object only loses itself: code fences, prose and array brackets around the
+objects are ignored, and a completion cut off by max_tokens keeps every
+question finished before the cut.
+
+A valid question has non-empty "text", exactly 4 non-empty "options", a
+"correctAnswer" that resolves to one of the options (exact text, letter
+such as "B" or "B)", or option text without its label) and a "subtopic".
+A missing subtopic is filled in from the default subtopic when one is given.
+"""
+
+import re
+import json
+
+_LABEL_RE = re.compile(r"^\(?([A-Da-d])[).:\]]\s*")
+_LETTER_RE = re.compile(r"^\(?([A-Da-d])\)?[.:]?$")
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+def resolve_answer(answer, options):
+    """The option a correctAnswer refers to, or None"""
+    answer = str(answer or "").strip()
+    if not answer:
+        return None
+    if answer in options:
+        return answer
+    for option in options:
+        if _normalize(option) == _normalize(answer):
+            return option
+    letter = _LETTER_RE.match(answer)
+    if letter:
+        return options["abcd".index(letter.group(1).lower())]
+    # Same option text with a different label, or none
+    bare = _normalize(_LABEL_RE.sub("", answer))
+    for option in options:
+        if _normalize(_LABEL_RE.sub("", option)) == bare:
+            return option
+    return None
+
+def validate_question(item, default_subtopic=""):
+    """Return (question, None) with normalized fields, or (None, reason)"""
+    if not isinstance(item, dict):
+        return None, "not an object"
+    text = item.get("text")
+    if not isinstance(text, str) or not text.strip():
+        return None, "missing text"
+
+    options = item.get("options")
+    if isinstance(options, dict):
+        # {"A": "...", "B": "..."} -> ["A) ...", "B) ..."]
+        options = [f"{label}) {value}" for label, value in sorted(options.items())]
+    if not isinstance(options, list) or len(options) != 4:
+        return None, "options must be a list of 4"
+    options = [str(option).strip() for option in options]
+    if not all(options):
+        return None, "empty option"
+
+    answer = resolve_answer(item.get("correctAnswer"), options)
+    if answer is None:
+        return None, "correctAnswer does not match an option"
+
+    subtopic = item.get("subtopic")
+    if not isinstance(subtopic, str) or not subtopic.strip():
+        if not default_subtopic:
+            return None, "missing subtopic"
+        subtopic = default_subtopic
+
+    return dict(item, text=text.strip(), options=options, correctAnswer=answer, subtopic=subtopic.strip()), None
+
+class MCQStreamParser:
+    """feed() completion text as it streams; each call returns the valid questions it completed"""
+
+    def __init__(self, default_subtopic=""):
+        self.default_subtopic = default_subtopic
+        self.valid = 0
+        self.invalid = 0
+        self.errors = []
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text):
+        completed = []
+        for char in text:
+            if self._depth == 0:
+                # Between objects: skip fences, prose, brackets and commas
+                if char == "{":
+                    self._depth = 1
+                    self._buffer = [char]
+                continue
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    question = self._finish("".join(self._buffer))
+                    if question is not None:
+                        completed.append(question)
+        return completed
+
+    @property
+    def truncated(self):
+        """The completion ended inside an object (e.g. it hit max_tokens)"""
+        return self._depth > 0
+
+    def _finish(self, raw):
+        try:
+            item = json.loads(raw)
+        except ValueError:
+            try:
+                item = json.loads(_TRAILING_COMMA_RE.sub(r"\1", raw))
+            except ValueError as e:
+                return self._reject(f"invalid JSON: {e}")
+        question, reason = validate_question(item, self.default_subtopic)
+        if question is None:
+            return self._reject(reason)
+        self.valid += 1
+        return question
+
+    def _reject(self, reason):
+        self.invalid += 1
+        if len(self.errors) < 5:
+            self.errors.append(reason)
+        return None
+
+def parse_questions(content, default_subtopic=""):
+    """Every valid question in a complete completion"""
+    parser = MCQStreamParser(default_subtopic)
+    return parser.feed(content)
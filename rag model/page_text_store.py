@@ -0,0 +1,167 @@
+"""
+Per-page extracted text of uploaded PDFs, extracted once and shared.
+
+Ingestion (ingest_pdfs.parse_pdf), the preview text and /api/rag/pdf-text
+all read pages from here, so a PDF is parsed once per content hash instead
+of once per consumer and request. Files are keyed by the PDF's SHA-256: an
+edited or re-uploaded file gets a new hash and is extracted again, and an
+unchanged file never is.
+
+One file per document in page_text/<sha256>.pages:
+- line 1: JSON header with the page count, byte offsets of every page in
+  the text blob and the loader's per-page metadata
+- then the pages' UTF-8 text back to back
+so a page range is served with one seek and one read, without loading the book.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+PAGE_TEXT_DIR = os.path.join(os.path.dirname(__file__), 'page_text')
+FORMAT_VERSION = 1
+# Headers kept in memory
+MAX_LOADED = 64
+
+def file_sha256(path):
+    """Content hash of a file, read in 1MB blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def store_path(content_hash):
+    return os.path.join(PAGE_TEXT_DIR, f"{content_hash}.pages")
+
+# path -> ((size, mtime_ns), sha256), so lookups by name don't re-hash unchanged files
+_hashes = {}
+_hashes_lock = threading.Lock()
+
+def content_hash_for(pdf_path):
+    stat = os.stat(pdf_path)
+    signature = (stat.st_size, stat.st_mtime_ns)
+    key = os.path.abspath(pdf_path)
+    with _hashes_lock:
+        cached = _hashes.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    content_hash = file_sha256(pdf_path)
+    with _hashes_lock:
+        _hashes[key] = (signature, content_hash)
+    return content_hash
+
+def extract_pages(pdf_path):
+    """(texts, metadatas) per page, exactly as ingestion has always loaded them"""
+    from langchain_community.document_loaders import PyPDFLoader
+    pages = PyPDFLoader(str(pdf_path)).load()
+    return [page.page_content for page in pages], [page.metadata for page in pages]
+
+def write_pages(content_hash, texts, metadatas):
+    """Write atomically so a concurrent reader (or another ingest process) never sees half a file"""
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = [0]
+    for blob in encoded:
+        offsets.append(offsets[-1] + len(blob))
+    header = {
+        "version": FORMAT_VERSION,
+        "sha256": content_hash,
+        "pages": len(texts),
+        "offsets": offsets,
+        "metadata": metadatas,
+        "extracted_at": time.time(),
+    }
+    os.makedirs(PAGE_TEXT_DIR, exist_ok=True)
+    path = store_path(content_hash)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(json.dumps(header, default=str).encode("utf-8") + b"\n")
+        for blob in encoded:
+            f.write(blob)
+    os.replace(tmp_path, path)
+
+# sha256 -> (header, blob_start), most recently used last
+_headers = OrderedDict()
+_headers_lock = threading.Lock()
+# One extraction per hash at a time in this process
+_extracting = {}
+
+def _read_header(content_hash):
+    with _headers_lock:
+        cached = _headers.get(content_hash)
+        if cached is not None:
+            _headers.move_to_end(content_hash)
+            return cached
+    try:
+        with open(store_path(content_hash), 'rb') as f:
+            header = json.loads(f.readline())
+            blob_start = f.tell()
+    except (FileNotFoundError, ValueError):
+        return None
+    if header.get("version") != FORMAT_VERSION:
+        return None
+    with _headers_lock:
+        _headers[content_hash] = (header, blob_start)
+        while len(_headers) > MAX_LOADED:
+            _headers.popitem(last=False)
+    return header, blob_start
+
+def ensure_pages(pdf_path, content_hash=None):
+    """
+    The document's (header, blob_start), extracting and storing its pages
+    first if this content has never been extracted. Returns (entry, extracted).
+    """
+    content_hash = content_hash or content_hash_for(pdf_path)
+    entry = _read_header(content_hash)
+    if entry is not None:
+        return entry, False
+    with _headers_lock:
+        lock = _extracting.setdefault(content_hash, threading.Lock())
+    with lock:
+        entry = _read_header(content_hash)
+        if entry is not None:
+            return entry, False
+        texts, metadatas = extract_pages(pdf_path)
+        write_pages(content_hash, texts, metadatas)
+        with _headers_lock:
+            _extracting.pop(content_hash, None)
+        return _read_header(content_hash), True
+
+def read_pages(pdf_path, start=0, end=None, content_hash=None):
+    """
+    (page_count, texts) for pages start..end-1 (0-based), reading only that
+    byte range of the stored text. Extracts the PDF first if needed.
+    """
+    content_hash = content_hash or content_hash_for(pdf_path)
+    (header, blob_start), _ = ensure_pages(pdf_path, content_hash)
+    count = header["pages"]
+    start = max(0, min(start, count))
+    end = count if end is None else max(start, min(end, count))
+    if start == end:
+        return count, []
+    offsets = header["offsets"]
+    with open(store_path(content_hash), 'rb') as f:
+        f.seek(blob_start + offsets[start])
+        blob = f.read(offsets[end] - offsets[start])
+    return count, [blob[offsets[i] - offsets[start]:offsets[i + 1] - offsets[start]].decode("utf-8")
+                   for i in range(start, end)]
+
+def load_documents(pdf_path, content_hash=None):
+    """Every page as a langchain Document, the way PyPDFLoader.load() returns them"""
+    from langchain_core.documents import Document
+    content_hash = content_hash or content_hash_for(pdf_path)
+    (header, _), _ = ensure_pages(pdf_path, content_hash)
+    _, texts = read_pages(pdf_path, content_hash=content_hash)
+    return [Document(page_content=text, metadata=dict(metadata))
+            for text, metadata in zip(texts, header["metadata"])]
+
+def remove_pages(content_hash):
+    with _headers_lock:
+        _headers.pop(content_hash, None)
+    try:
+        os.remove(store_path(content_hash))
+    except FileNotFoundError:
+        pass
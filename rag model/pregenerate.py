@@ -0,0 +1,171 @@
+"""
+Pre-generate answers and quizzes for a syllabus into the pre-generated store.
+
+Reads a list of topics, subtopics and PDFs, runs the same retrieval and
+generation as /api/rag/generate-answer and /api/rag/generate-quiz with
+bounded concurrency, and writes every response to pregenerated_store. The
+API then serves those requests from the store instead of generating live.
+
+Input is JSON (a list of objects, or {"items": [...]}) or CSV with a header
+row, using the request fields of the endpoints:
+    topic, subtopic, pdf_name, difficulty, question_count, cognitive_level, subtopics
+CSV subtopics are separated by ";". An optional "endpoints" field/column
+("answer", "quiz" or "answer;quiz") overrides --endpoints for that row.
+
+Runs are resumable: a response already stored for the PDF's current content
+is skipped, so an interrupted run picks up where it stopped. Each response is
+committed as soon as it is generated. --force regenerates everything.
+
+Usage:
+    python pregenerate.py syllabus.json --concurrency 4
+    python pregenerate.py syllabus.csv --endpoints quiz --question-count 10
+"""
+
+import sys
+import csv
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pregenerated_store import get_pregenerated_store, make_key, request_fields, document_fingerprint
+
+ENDPOINTS = {"answer": "generate-answer", "quiz": "generate-quiz"}
+
+def load_items(path):
+    """Syllabus rows as dicts of request fields"""
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            items = []
+            for row in csv.DictReader(f):
+                row = {k.strip(): (v or "").strip() for k, v in row.items() if k}
+                if row.get("subtopics"):
+                    row["subtopics"] = [s.strip() for s in row["subtopics"].split(";") if s.strip()]
+                items.append({k: v for k, v in row.items() if v not in ("", [])})
+            return items
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    items = data.get("items", []) if isinstance(data, dict) else data
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ValueError("Expected a JSON list of objects (or {\"items\": [...]})")
+    return items
+
+def plan_jobs(items, endpoints, quiz_defaults):
+    """(endpoint, request body) for every row and endpoint, duplicates removed"""
+    jobs, seen = [], set()
+    for item in items:
+        if not str(item.get("topic", "")).strip() or not str(item.get("pdf_name", "")).strip():
+            print(f"[PREGEN] Skipping row without topic or pdf_name: {item}")
+            continue
+        row_endpoints = item.get("endpoints") or endpoints
+        if isinstance(row_endpoints, str):
+            row_endpoints = [e.strip() for e in row_endpoints.replace(";", ",").split(",") if e.strip()]
+        for name in row_endpoints:
+            endpoint = ENDPOINTS.get(name, name)
+            if endpoint not in ENDPOINTS.values():
+                print(f"[PREGEN] Unknown endpoint '{name}' for {item.get('topic')}")
+                continue
+            body = {k: v for k, v in item.items() if k != "endpoints"}
+            body["topic"] = str(body["topic"]).strip()
+            body["subtopic"] = str(body.get("subtopic", "")).strip()
+            body["pdf_name"] = str(body["pdf_name"]).strip()
+            if endpoint == "generate-quiz":
+                body = dict(quiz_defaults, **body)
+            key = make_key(endpoint, body["pdf_name"], **request_fields(endpoint, body))
+            if key not in seen:
+                seen.add(key)
+                jobs.append((endpoint, body, key))
+    return jobs
+
+def pregenerate(items, endpoints=("answer", "quiz"), concurrency=4, force=False, quiz_defaults=None):
+    """Generate and store every missing response; returns a summary dict"""
+    # Imported here so --help and input errors don't pay for loading the RAG stack
+    from rag_api import app
+
+    store = get_pregenerated_store()
+    jobs = plan_jobs(items, endpoints, quiz_defaults or {})
+    summary = {"jobs": len(jobs), "stored": 0, "skipped": 0, "failed": [], "seconds": 0.0}
+    pending = []
+    for endpoint, body, key in jobs:
+        fingerprint = document_fingerprint(body["pdf_name"])
+        if fingerprint is None:
+            summary["failed"].append({"endpoint": endpoint, "topic": body["topic"], "pdf_name": body["pdf_name"],
+                                      "error": "PDF is not indexed (run ingest_pdfs.py first)"})
+            continue
+        if not force and store.has_current(key, body["pdf_name"], fingerprint):
+            summary["skipped"] += 1
+            continue
+        pending.append((endpoint, body, key, fingerprint))
+    print(f"[PREGEN] {len(jobs)} requests: {summary['skipped']} already stored, {len(pending)} to generate, "
+          f"{len(summary['failed'])} unavailable")
+
+    local = threading.local()
+
+    def run(endpoint, body, key, fingerprint):
+        # One test client per worker thread; the store is bypassed so --force really regenerates
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        started = time.perf_counter()
+        response = client.post(f"/api/rag/{endpoint}", json=dict(body, use_pregenerated=False))
+        payload = response.get_json(silent=True) or {}
+        if response.status_code != 200 or not payload.get("success"):
+            raise RuntimeError(payload.get("error") or f"HTTP {response.status_code}")
+        if endpoint == "generate-quiz" and len(payload.get("questions", [])) < int(body.get("question_count", 5)):
+            raise RuntimeError(f"only {len(payload.get('questions', []))} questions generated")
+        generation_ms = round((time.perf_counter() - started) * 1000, 1)
+        payload.pop("cache", None)
+        store.put(key, endpoint, body["pdf_name"], request_fields(endpoint, body), payload, fingerprint, generation_ms)
+        return generation_ms
+
+    started = time.perf_counter()
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    try:
+        futures = {pool.submit(run, *job): job for job in pending}
+        for done, future in enumerate(as_completed(futures), 1):
+            endpoint, body, _, _ = futures[future]
+            label = f"{endpoint} {body['pdf_name']}: {body['topic']}" + (f" / {body['subtopic']}" if body["subtopic"] else "")
+            progress = f"{done}/{len(pending)}"
+            try:
+                generation_ms = future.result()
+                summary["stored"] += 1
+                print(f"[PREGEN] {progress} stored {label} ({generation_ms / 1000:.1f}s)")
+            except Exception as e:
+                summary["failed"].append({"endpoint": endpoint, "topic": body["topic"], "pdf_name": body["pdf_name"],
+                                          "error": str(e)})
+                print(f"[PREGEN] {progress} failed {label}: {e}")
+    except KeyboardInterrupt:
+        print("[PREGEN] Interrupted; stored responses are kept, re-run to resume")
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown(wait=True)
+    summary["seconds"] = round(time.perf_counter() - started, 1)
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("syllabus", help="JSON or CSV file of topic/subtopic/pdf_name rows")
+    parser.add_argument("--endpoints", default="answer,quiz", help="answer, quiz or both (default: answer,quiz)")
+    parser.add_argument("--concurrency", type=int, default=4, help="requests generated at once (default: 4)")
+    parser.add_argument("--force", action="store_true", help="regenerate responses that are already stored")
+    parser.add_argument("--difficulty", default="medium", help="quiz default when a row has none")
+    parser.add_argument("--question-count", type=int, default=5, help="quiz default when a row has none")
+    parser.add_argument("--cognitive-level", default="application", help="quiz default when a row has none")
+    args = parser.parse_args()
+    try:
+        items = load_items(args.syllabus)
+        summary = pregenerate(
+            items,
+            endpoints=[e.strip() for e in args.endpoints.split(",") if e.strip()],
+            concurrency=args.concurrency,
+            force=args.force,
+            quiz_defaults={"difficulty": args.difficulty, "question_count": args.question_count,
+                           "cognitive_level": args.cognitive_level},
+        )
+    except KeyboardInterrupt:
+        sys.exit(130)
+    except Exception as e:
+        print(f"[PREGEN] Fatal error: {e}")
+        sys.exit(1)
+    print(json.dumps(summary, indent=2))
+    sys.exit(1 if summary["failed"] else 0)
@@ -0,0 +1,167 @@
+"""
+Persistent store of pre-generated generate-answer and generate-quiz responses.
+
+pregenerate.py fills it ahead of term from the syllabus (topic, subtopic and
+PDF lists); the endpoints check it before retrieval and serve a stored
+response in about a millisecond, falling back to live generation otherwise.
+
+Entries are keyed by endpoint, PDF and the normalized request fields, and
+record the PDF's ingest fingerprint (ingest_manifest.json) at generation
+time. A PDF that has since been re-ingested with different content, or
+deleted, no longer matches, so stale entries are never served.
+
+SQLite in WAL mode, so the API can read while a pre-generation run writes.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from response_cache import normalize_text
+
+STORE_PATH = os.getenv("RAG_PREGENERATED_DB",
+                       os.path.join(os.path.dirname(__file__), 'pregenerated', 'pregenerated.sqlite3'))
+STORE_ENABLED = os.getenv("RAG_PREGENERATED", "true").lower() != "false"
+# Kept in sync with ingest_pdfs.MANIFEST_PATH without importing the ingest stack
+MANIFEST_PATH = os.path.join(os.path.dirname(__file__), 'chroma_db', 'ingest_manifest.json')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    endpoint TEXT NOT NULL,
+    pdf_name TEXT NOT NULL,
+    request TEXT NOT NULL,
+    fingerprint TEXT,
+    response TEXT NOT NULL,
+    generation_ms REAL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_pdf ON entries (pdf_name);
+"""
+
+def make_key(endpoint, pdf_name, **fields):
+    """Identity of a request: endpoint, PDF and normalized fields (lists keep their order)"""
+    normalized = {
+        name: [normalize_text(v) for v in value] if isinstance(value, (list, tuple)) else normalize_text(value)
+        for name, value in sorted(fields.items())
+    }
+    payload = json.dumps([endpoint, os.path.basename(pdf_name or ""), normalized])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def request_fields(endpoint, body):
+    """The fields of a request body that determine its response, with the endpoints' defaults"""
+    fields = {"topic": body.get("topic", ""), "subtopic": body.get("subtopic", "")}
+    if endpoint == "generate-quiz":
+        fields.update(
+            difficulty=body.get("difficulty", "medium"),
+            question_count=int(body.get("question_count", 5)),
+            cognitive_level=body.get("cognitive_level", "application"),
+            subtopics=[str(s).strip() for s in body.get("subtopics") or [] if str(s).strip()],
+        )
+    return fields
+
+_manifest = {"signature": None, "documents": {}}
+_manifest_lock = threading.Lock()
+
+def document_fingerprint(pdf_name):
+    """The PDF's current ingest fingerprint, or None if it isn't indexed (re-read only when the manifest changes)"""
+    try:
+        stat = os.stat(MANIFEST_PATH)
+        signature = (stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        signature = None
+    with _manifest_lock:
+        if signature is None:
+            _manifest.update(signature=None, documents={})
+        elif signature != _manifest["signature"]:
+            try:
+                with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+                    documents = json.load(f).get("documents", {})
+                _manifest.update(signature=signature, documents=documents)
+            except (OSError, ValueError):
+                pass  # caught mid-write; keep the previous copy and re-read next time
+        entry = _manifest["documents"].get(os.path.basename(pdf_name or ""))
+    return entry.get("fingerprint") if entry else None
+
+class PregeneratedStore:
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stale": 0, "stores": 0}
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def lookup(self, key, pdf_name):
+        """Stored response for key if it was generated from the PDF's current content, else None"""
+        row = self._connection().execute(
+            "SELECT fingerprint, response FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        if row[0] != document_fingerprint(pdf_name):
+            self._count("stale")
+            return None
+        self._count("hits")
+        return json.loads(row[1])
+
+    def get(self, endpoint, pdf_name, **fields):
+        return self.lookup(make_key(endpoint, pdf_name, **fields), pdf_name)
+
+    def has_current(self, key, pdf_name, fingerprint):
+        """A pre-generation run can skip key (resuming after an interruption)"""
+        row = self._connection().execute("SELECT fingerprint FROM entries WHERE key = ?", (key,)).fetchone()
+        return row is not None and row[0] == fingerprint
+
+    def put(self, key, endpoint, pdf_name, fields, response, fingerprint, generation_ms=None):
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO entries (key, endpoint, pdf_name, request, fingerprint, response, "
+                "generation_ms, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, endpoint, os.path.basename(pdf_name), json.dumps(fields), fingerprint,
+                 json.dumps(response), generation_ms, time.time()),
+            )
+        self._count("stores")
+
+    def delete_pdf(self, pdf_name):
+        """Drop every entry for a PDF; returns how many were removed"""
+        connection = self._connection()
+        with connection:
+            cursor = connection.execute("DELETE FROM entries WHERE pdf_name = ?", (os.path.basename(pdf_name),))
+        return cursor.rowcount
+
+    def stats(self):
+        rows = self._connection().execute(
+            "SELECT endpoint, COUNT(*) FROM entries GROUP BY endpoint"
+        ).fetchall()
+        with self._lock:
+            counters = dict(self.counters)
+        return dict(counters, enabled=STORE_ENABLED, path=self.path, entries=dict(rows))
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_pregenerated_store():
+    """Process-wide store, opened on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PregeneratedStore()
+        return _store
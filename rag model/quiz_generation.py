@@ -0,0 +1,289 @@
+"""
+MCQ generation for /api/rag/generate-quiz.
+
+A quiz of up to RAG_QUIZ_SHARD_SIZE questions on one subtopic is a single
+Groq completion. Larger quizzes, and quizzes over a list of subtopics, fan out:
+- the quiz is split by subtopic, then into shards of at most
+  RAG_QUIZ_SHARD_SIZE questions
+- each shard gets its own context: retrieved for its subtopic, with shards of
+  the same subtopic taking different chunks of a wider retrieval, packed into
+  RAG_QUIZ_CONTEXT_TOKEN_BUDGET tokens (context_packing.py)
+- shards are generated concurrently, at most RAG_QUIZ_CONCURRENCY at a time,
+  each asking for a few extra questions (RAG_QUIZ_OVERGENERATE)
+- results are merged in shard order, near-duplicate questions dropped and any
+  shortfall topped up, so exactly question_count questions come back
+Wall-clock time tracks the slowest shard instead of the sum of all of them.
+
+Every completion is streamed and parsed incrementally (mcq_parser.py): each
+question is validated as soon as its JSON object closes, so a malformed
+object or a completion cut off mid-array only loses the broken questions,
+and top-up re-requests just the missing count. iter_questions() yields the
+accepted questions as they arrive, which generate-quiz can stream to the client.
+"""
+
+import os
+import re
+import math
+import queue
+import threading
+import contextvars
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from llm_gateway import get_llm_gateway, LLMUnavailable
+from mcq_parser import MCQStreamParser
+from context_packing import pack_context, QUIZ_TOKEN_BUDGET
+import tracing
+
+SHARD_SIZE = int(os.getenv("RAG_QUIZ_SHARD_SIZE", "5"))
+CONCURRENCY = int(os.getenv("RAG_QUIZ_CONCURRENCY", "6"))
+# Largest question_count generate-quiz accepts
+MAX_QUESTIONS = int(os.getenv("RAG_QUIZ_MAX_QUESTIONS", "50"))
+OVERGENERATE = float(os.getenv("RAG_QUIZ_OVERGENERATE", "0.2"))
+# Word-set Jaccard similarity at which two questions count as the same question
+DUPLICATE_THRESHOLD = float(os.getenv("RAG_QUIZ_DUPLICATE_THRESHOLD", "0.7"))
+TOP_UP_ROUNDS = 2
+# Chunks of context per shard (the single-completion path has always used up to 5)
+CHUNKS_PER_SHARD = 5
+
+SYSTEM_PROMPT = "You are a JSON-only response bot. You output valid JSON arrays of quiz questions."
+
+def build_prompt(topic, subtopic, pdf_name, context_text, count, difficulty, cognitive_level, avoid=None):
+    prompt = f"""You are an expert assessment generator. Create exactly {count} multiple choice questions (MCQs) for the topic "{topic}" (Subtopic: "{subtopic}") based on the provided text context.
+
+Context from document ({pdf_name}):
+{context_text}
+
+Requirements:
+1. Difficulty: {difficulty}
+2. Cognitive Level: {cognitive_level}
+3. Generate exactly {count} valid JSON objects.
+4. Each question must have "text", "options" (array of 4 strings, labeled A, B, C, D), "correctAnswer", and "subtopic".
+5. IMPORTANT: Instead of a generic explanation, you MUST provide the specific "subtopic" that the question maps to. This is CRITICAL for analytics.
+6. Return ONLY a JSON array. No markdown, no intro text.
+
+Example format:
+[
+  {{
+    "text": "Question?",
+    "options": ["A) Opt1", "B) Opt2", "C) Opt3", "D) Opt4"],
+    "correctAnswer": "B) Opt2",
+    "subtopic": "Specific Subtopic Name"
+  }}
+]
+"""
+    if avoid:
+        listed = "\n".join(f"- {text}" for text in avoid)
+        prompt += f"\nDo NOT repeat or rephrase any of these existing questions:\n{listed}\n"
+    return prompt
+
+def max_tokens_for(count):
+    """Completion budget for count questions (the old single call always used 3000)"""
+    return min(3000, 400 + 250 * count)
+
+def _words(question):
+    return frozenset(re.findall(r"[a-z0-9]+", str(question.get("text", "")).lower()))
+
+def is_near_duplicate(words, other_words, threshold=DUPLICATE_THRESHOLD):
+    if not words or not other_words:
+        return words == other_words
+    return len(words & other_words) / len(words | other_words) >= threshold
+
+def plan_shards(question_count, subtopic="", subtopics=None):
+    """
+    Split a quiz into shards: [{"subtopic": ..., "count": n}].
+    Questions are spread evenly over subtopics, then each subtopic's share is
+    cut into pieces of at most SHARD_SIZE. No questions, no shards.
+    """
+    if question_count < 1:
+        return []
+    subtopics = [s.strip() for s in (subtopics or []) if str(s).strip()] or [subtopic]
+    subtopics = subtopics[:question_count] or [subtopic]
+    shards = []
+    base, extra = divmod(question_count, len(subtopics))
+    for i, name in enumerate(subtopics):
+        share = base + (1 if i < extra else 0)
+        pieces = max(1, math.ceil(share / SHARD_SIZE))
+        piece_base, piece_extra = divmod(share, pieces)
+        for j in range(pieces):
+            count = piece_base + (1 if j < piece_extra else 0)
+            if count:
+                shards.append({"subtopic": name, "count": count})
+    return shards
+
+def assign_contexts(shards, topic, pdf_name, retrieve_many):
+    """
+    Attach retrieved chunks to each shard. Shards on the same subtopic share
+    one wider retrieval and take alternating chunks of it, so they are shown
+    different material. retrieve_many(queries, k) -> one list of Documents per query.
+    """
+    if not shards:
+        return shards
+    groups = {}
+    for shard in shards:
+        query = f"{topic} {shard['subtopic']}".strip()
+        groups.setdefault(query, []).append(shard)
+    queries = list(groups)
+    k = CHUNKS_PER_SHARD * max(len(group) for group in groups.values())
+    for query, results in zip(queries, retrieve_many(queries, k)):
+        group = groups[query]
+        for i, shard in enumerate(group):
+            shard["query"] = query
+            shard["chunks"] = results[i::len(group)][:CHUNKS_PER_SHARD] or results[:CHUNKS_PER_SHARD]
+    return shards
+
+def context_text_for(chunks):
+    """Every chunk verbatim (shown to admins; prompts use context_packing.pack_context)"""
+    return "\n\n".join(doc.page_content.replace("\n", " ").strip() for doc in chunks)
+
+def _stream(model, prompt, count):
+    return get_llm_gateway().stream(
+        model=model,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.5,
+        max_tokens=max_tokens_for(count)
+    )
+
+def iter_questions(shards, question_count, topic, pdf_name, difficulty, cognitive_level, model, stats=None):
+    """
+    Stream every shard concurrently and yield (shard_index, question) for each
+    valid, non-duplicate question as it completes, up to question_count.
+    Until all shards finish, a shard only contributes its own count (so a fast
+    shard cannot crowd out the other subtopics); its extras then cover shards
+    that fell short, and top-up rounds ask for whatever is still missing.
+    Top-up questions get shard_index len(shards).
+    stats, if given, is filled in as generation goes.
+    Raises LLMUnavailable if nothing could be generated because Groq is rate limiting.
+    """
+    fan_out = len(shards) > 1
+    stats = {} if stats is None else stats
+    stats.update(shards=len(shards), failed_shards=0, salvaged_shards=0, invalid_questions=0,
+                 duplicates_removed=0, top_up_rounds=0, context_tokens=0, context_tokens_saved=0)
+    events = queue.Queue()
+    stop = threading.Event()
+    finished = {}
+    unavailable = []
+
+    def run(index, shard, context_text, count, avoid=None):
+        """Feed one streamed completion through the parser; questions go to events as they validate"""
+        parser = MCQStreamParser(shard["subtopic"])
+        with tracing.stage("prompt_build"):
+            prompt = build_prompt(topic, shard["subtopic"], pdf_name, context_text,
+                                  count, difficulty, cognitive_level, avoid)
+        failed = False
+        try:
+            with closing(_stream(model, prompt, count)) as deltas:
+                for text in deltas:
+                    if stop.is_set():
+                        break
+                    with tracing.stage("parse_output"):
+                        questions = parser.feed(text)
+                    for question in questions:
+                        events.put((index, question))
+        except LLMUnavailable as e:
+            unavailable.append(e)
+            failed = True
+        except Exception as e:
+            print(f"[QUIZ] Shard for '{shard['subtopic']}' failed: {e}")
+            failed = True
+        if parser.invalid or (parser.truncated and not stop.is_set()):
+            print(f"[QUIZ] Shard for '{shard['subtopic']}': {parser.valid} valid, {parser.invalid} invalid"
+                  f"{', truncated' if parser.truncated else ''} {parser.errors}")
+        finished[index] = (parser, failed)
+        events.put((index, None))
+
+    def extra(count):
+        return math.ceil(count * (1 + OVERGENERATE)) if fan_out else count
+
+    def submit(index, shard, count, avoid=None):
+        with tracing.stage("context_packing"):
+            context_text, packing = pack_context(shard["chunks"], QUIZ_TOKEN_BUDGET)
+        stats["context_tokens"] += packing["tokens"]
+        stats["context_tokens_saved"] += packing["tokens_saved"]
+        # Shards time their stages into the request's trace
+        pool.submit(contextvars.copy_context().run, run, index, shard, context_text, count, avoid)
+
+    accepted = []
+    seen = []
+
+    def accept(index, question):
+        words = _words(question)
+        if any(is_near_duplicate(words, other) for other in seen):
+            stats["duplicates_removed"] += 1
+            return False
+        seen.append(words)
+        accepted.append((index, question))
+        return True
+
+    def drain(quotas):
+        """Accept questions until every shard in quotas has finished or the quiz is full"""
+        pending = len(quotas)
+        taken = dict.fromkeys(quotas, 0)
+        reserve = []
+        while pending and len(accepted) < question_count:
+            index, question = events.get()
+            if question is None:
+                pending -= 1
+                parser, failed = finished[index]
+                stats["invalid_questions"] += parser.invalid
+                if index < len(shards):
+                    if not parser.valid:
+                        stats["failed_shards"] += 1
+                    elif failed or parser.truncated:
+                        stats["salvaged_shards"] += 1
+            elif taken[index] >= quotas[index]:
+                reserve.append((index, question))
+            elif accept(index, question):
+                taken[index] += 1
+                yield index, question
+        # Extras from shards that over-delivered cover the ones that fell short
+        for index, question in sorted(reserve, key=lambda item: item[0]):
+            if len(accepted) >= question_count:
+                break
+            if accept(index, question):
+                yield index, question
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(CONCURRENCY, len(shards))))
+    try:
+        for index, shard in enumerate(shards):
+            submit(index, shard, extra(shard["count"]))
+        # Wall-clock generation time; shards stream in parallel, so their own times would overlap
+        with tracing.stage("llm"):
+            yield from drain({index: shard["count"] for index, shard in enumerate(shards)})
+
+        # Failed shards, invalid questions or duplicates left us short: ask again over all the context
+        all_chunks = [doc for shard in shards for doc in shard["chunks"]]
+        subtopics = ", ".join(dict.fromkeys(shard["subtopic"] for shard in shards if shard["subtopic"]))
+        top_up_shard = {"subtopic": subtopics, "chunks": all_chunks}
+        top_up = len(shards)
+        for _ in range(TOP_UP_ROUNDS):
+            missing = question_count - len(accepted)
+            if missing <= 0:
+                break
+            stats["top_up_rounds"] += 1
+            avoid = [q["text"] for _, q in accepted][-30:]
+            submit(top_up, top_up_shard, extra(missing), avoid)
+            with tracing.stage("llm"):
+                yield from drain({top_up: missing})
+    finally:
+        # Also reached when the consumer stops early (e.g. an SSE client disconnected)
+        stop.set()
+        pool.shutdown(wait=False)
+
+    if not accepted and unavailable:
+        raise unavailable[0]
+
+def generate_questions(shards, question_count, topic, pdf_name, difficulty, cognitive_level, model):
+    """
+    Generate every shard concurrently, merge, de-duplicate and top up.
+    Returns (questions, stats); questions has at most question_count entries.
+    Raises LLMUnavailable if nothing could be generated because Groq is rate limiting.
+    """
+    stats = {}
+    generated = list(iter_questions(shards, question_count, topic, pdf_name, difficulty,
+                                    cognitive_level, model, stats))
+    # Back in shard order so questions on the same subtopic stay together
+    generated.sort(key=lambda item: item[0])
+    return [question for _, question in generated], stats
@@ -3,14 +3,34 @@ RAG API for EduGen AI - Flask-based REST API for PDF retrieval and answer genera
 This API integrates with the existing retrieve.py RAG model
 """
 
-from flask import Flask, request, jsonify
+import env_file
+
+# Before the modules below read their RAG_* settings at import time
+env_file.load_env_file()
+
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
 import os
 import sys
-from dotenv import load_dotenv
-import PyPDF2
+import json
+import math
+import time
+import threading
 from pathlib import Path
+from response_cache import get_response_cache, chunk_digests, normalize_text
+from work_pool import run_blocking
+from llm_gateway import get_llm_gateway, gateway_stats, LLMUnavailable
+from context_packing import pack_context
+import page_text_store
+from document_catalog import get_document_catalog, DOCUMENT_EXTENSIONS, STATUSES as DOCUMENT_STATUSES
+from pregenerated_store import get_pregenerated_store, request_fields, STORE_ENABLED as PREGENERATED_ENABLED
+from single_flight import get_single_flight, COALESCE_ENABLED
+import quiz_generation
+import uploads
+import tracing
+import work_pool
 
 # Lazy import function for RAG (to avoid blocking server startup with model downloads)
 def get_rag_functions():
@@ -18,64 +38,329 @@ def get_rag_functions():
     from retrieve import get_relevant_context, groq_summarize, parse_llm_output, DB_DIR
     return get_relevant_context, groq_summarize, parse_llm_output, DB_DIR
 
-load_dotenv()
+def query_embedder(query):
+    """Callable giving the query's embedding on demand (an embedding-cache hit after retrieval)"""
+    def embed():
+        from retrieve import get_embedding_function
+        return run_blocking(get_embedding_function().embed_query, query)
+    return embed
+
+def wants_stream():
+    """Client asked for Server-Sent Events (?stream=1 or Accept: text/event-stream)"""
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events):
+    return Response(events, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # stop proxies from buffering the stream
+    })
+
+def pregenerated_response(endpoint, pdf_name, data):
+    """
+    Response stored by pregenerate.py for this request, or None to generate live.
+    Clients (and pregenerate.py itself) can pass "use_pregenerated": false to skip the store.
+    """
+    if not PREGENERATED_ENABLED or data.get('use_pregenerated', True) is False:
+        return None
+    try:
+        with tracing.stage("pregenerated_lookup"):
+            return get_pregenerated_store().get(endpoint, pdf_name, **request_fields(endpoint, data))
+    except Exception as e:
+        print(f"[RAG API] Pre-generated store unavailable: {e}")
+        return None
+
+def coalescing_key(endpoint, data):
+    """Identical requests: same endpoint, response format, PDF and normalized fields"""
+    fields = {
+        name: [normalize_text(item) for item in value] if isinstance(value, list) else normalize_text(value)
+        for name, value in request_fields(endpoint, data).items()
+    }
+    return json.dumps([endpoint, wants_stream(), str(data.get('pdf_name', '')).strip(),
+                       data.get('use_pregenerated', True) is False, fields], sort_keys=True)
+
+def coalesced(endpoint, compute):
+    """
+    Run compute() once for identical requests in flight at the same time
+    (single_flight.py); the others wait and get its response, marked with
+    X-RAG-Coalesced: true. Requests asking for debug timings, and bodies
+    that don't parse, are computed on their own.
+    """
+    data = request.get_json(silent=True)
+    trace = tracing.current()
+    if not COALESCE_ENABLED or not isinstance(data, dict) or data.get('debug') is True or (trace is not None and trace.debug):
+        return compute()
+    try:
+        key = coalescing_key(endpoint, data)
+    except (TypeError, ValueError, AttributeError):
+        return compute()
+
+    flight, leader = get_single_flight().join(endpoint, key)
+    if not leader:
+        print(f"[RAG API] Joined an identical {endpoint} request in flight")
+        shared = flight.wait()
+        if shared is None:
+            # The leader timed out or its stream was cancelled: don't replay a partial result
+            return compute()
+        kind, result = shared
+        response = sse_response(result) if kind == "stream" else Response(*result)
+        response.headers['X-RAG-Coalesced'] = 'true'
+        return response
+    try:
+        response = app.make_response(compute())
+    except BaseException as e:
+        flight.fail(e)
+        raise
+    if response.is_streamed:
+        # Streams are shared event by event: the SSE generator is drained for every subscriber at once
+        return sse_response(flight.stream(response.response))
+    flight.resolve((response.get_data(), response.status_code,
+                    [(name, value) for name, value in response.headers if name.lower() != 'content-length']))
+    return response
+
+def llm_unavailable_response(error):
+    """503 with Retry-After when Groq is rate limiting us or the gateway queue is full"""
+    response = jsonify({"success": False, "error": str(error), "retry_after": error.retry_after})
+    response.status_code = 503
+    if error.retry_after:
+        response.headers['Retry-After'] = str(math.ceil(error.retry_after))
+    return response
+
+def elapsed_ms(since):
+    return round((time.perf_counter() - since) * 1000, 1)
+
+def truthy(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+def note_debug_flag(data):
+    """"debug": true in a JSON body asks for stage timings like ?debug=1 does"""
+    if isinstance(data, dict) and data.get('debug') is True:
+        tracing.request_debug(request.endpoint or request.path)
+
+def start_rag_warm_up():
+    """Load the embedding model and vector store in the background so the first request doesn't pay for it"""
+    def _warm_up():
+        try:
+            import retrieve
+            run_blocking(retrieve.warm_up)
+        except Exception as e:
+            print(f"[RAG API] RAG warm-up failed: {e}")
+
+    thread = threading.Thread(target=_warm_up, name="rag-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def get_rag_engine_status():
+    """Engine readiness without triggering the heavy retrieve import"""
+    rag_module = sys.modules.get('retrieve')
+    if rag_module is None:
+        return {"ready": False, "model_loaded": False, "vector_store_open": False}
+    return rag_module.engine_status()
 
 app = Flask(__name__)
+# Uploaded files stream into hashed temp files instead of memory (see uploads.py)
+app.request_class = uploads.UploadRequest
 CORS(app, origins=["http://localhost:3000", "https://edugen-ai-zeta.vercel.app"])
 
 # Configuration
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'pdfs')
-ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'txt'}
-MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
+ALLOWED_EXTENSIONS = DOCUMENT_EXTENSIONS  # pdf, doc, docx, txt
+MAX_FILE_SIZE = uploads.MAX_FILE_SIZE  # RAG_MAX_FILE_SIZE_MB, 16MB by default
+# Refuse oversized requests from Content-Length alone; the margin covers multipart headers
+app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE + 1024 * 1024
+AUTO_INGEST = os.getenv('RAG_AUTO_INGEST', 'true').lower() != 'false'
 
 # Ensure upload folder exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+@app.before_request
+def start_trace():
+    """Per-request stage timings (see tracing.py); ?debug=1 or X-RAG-Debug: 1 returns them"""
+    debug = truthy(request.args.get('debug', '')) or truthy(request.headers.get('X-RAG-Debug', ''))
+    tracing.begin(request.endpoint or request.path, debug=debug)
+
+@app.after_request
+def finish_trace(response):
+    trace = tracing.current()
+    if trace is None:
+        return response
+    if response.is_streamed:
+        # SSE generators keep adding stages; record the request once the last event is out
+        response.call_on_close(lambda: trace.finish(response.status_code))
+        return response
+    if trace.debug and response.is_json:
+        body = response.get_json(silent=True)
+        if isinstance(body, dict):
+            body["debug"] = {"timings": trace.timings()}
+            response.set_data(app.json.dumps(body))
+    tracing.end(response.status_code)
+    return response
+
+@app.teardown_request
+def abandon_trace(error):
+    # Unhandled exceptions skip after_request
+    if error is not None:
+        tracing.end(500)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def extract_text_from_pdf(pdf_path, max_pages=50):
-    """Extract text from PDF for quick preview"""
-    try:
-        with open(pdf_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            text = ""
-            for i, page in enumerate(reader.pages[:max_pages]):
-                text += page.extract_text() + "\n"
-            return text
-    except Exception as e:
-        print(f"Error extracting PDF text: {e}")
-        return None
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(error):
+    return jsonify({
+        "success": False,
+        "error": f"File too large. Maximum size is {MAX_FILE_SIZE / (1024 * 1024):g}MB"
+    }), 413
+
+def start_page_extraction(pdf_path):
+    """Extract a PDF's page text in the background when no ingestion job will"""
+    def _extract():
+        try:
+            run_blocking(page_text_store.ensure_pages, pdf_path)
+        except Exception as e:
+            print(f"[RAG API] Page text extraction failed for {pdf_path}: {e}")
+
+    threading.Thread(target=_extract, name="page-text", daemon=True).start()
 
 @app.route('/api/rag/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
+    """
+    Health check endpoint
+    Pass ?ready=1 to get a 503 until the retrieval engine has warmed up (readiness probe).
+    """
+    engine = get_rag_engine_status()
+    status_code = 200
+    if request.args.get('ready') and not engine["ready"]:
+        status_code = 503
     return jsonify({
         "status": "healthy",
+        "ready": engine["ready"],
         "service": "EduGen RAG API",
-        "upload_folder": UPLOAD_FOLDER
-    }), 200
+        "upload_folder": UPLOAD_FOLDER,
+        "rag_engine": engine,
+        "startup": tracing.startup_times(),
+        "llm_gateway": gateway_stats()
+    }), status_code
+
+def metric_gauges():
+    """Cache, queue and LLM counters for /api/rag/metrics, from whatever is already loaded"""
+    cache = get_response_cache().stats()
+    gauges = [
+        ("rag_response_cache_lookups_total", "Response cache lookups by result", "counter",
+         [({"result": result}, cache[result]) for result in ("hits", "semantic_hits", "misses")]),
+        ("rag_response_cache_hit_ratio", "Share of response cache lookups served from the cache", "gauge",
+         [({}, cache["hit_rate"])]),
+        ("rag_response_cache_entries", "Responses held in the cache", "gauge", [({}, cache["entries"])]),
+        ("rag_work_pool_queue_depth", "Blocking calls waiting for a work pool thread", "gauge",
+         [({}, work_pool.queue_depth())]),
+    ]
+    coalescing = get_single_flight().stats()
+    gauges += [
+        ("rag_single_flight_requests_total",
+         "Generation requests that computed (leader) or joined an identical one in flight (coalesced)", "counter",
+         [({"endpoint": endpoint, "role": role}, counters[name])
+          for endpoint, counters in sorted(coalescing["endpoints"].items())
+          for role, name in (("leader", "flights"), ("coalesced", "coalesced"))]),
+        ("rag_single_flight_failures_total",
+         "Shared computations cancelled or failed, and followers that computed on their own", "counter",
+         [({"endpoint": endpoint, "outcome": outcome}, counters[outcome])
+          for endpoint, counters in sorted(coalescing["endpoints"].items())
+          for outcome in ("cancelled", "errors", "recomputed")]),
+        ("rag_single_flight_in_flight", "Shared computations in flight", "gauge", [({}, coalescing["in_flight"])]),
+    ]
+    if PREGENERATED_ENABLED:
+        try:
+            counters = get_pregenerated_store().stats()
+            gauges.append(("rag_pregenerated_lookups_total", "Pre-generated store lookups by result", "counter",
+                           [({"result": result}, counters[result]) for result in ("hits", "misses", "stale")]))
+        except Exception as e:
+            print(f"[RAG API] Pre-generated store unavailable: {e}")
+    engine = get_rag_engine_status()
+    embedding_cache = engine.get("embedding_cache")
+    if embedding_cache:
+        query_cache = embedding_cache["query_cache"]
+        gauges.append(("rag_embedding_cache_lookups_total", "Embedding cache lookups by cache and result", "counter",
+                       [({"cache": "document", "result": "hits"}, embedding_cache["hits"]),
+                        ({"cache": "document", "result": "misses"}, embedding_cache["misses"]),
+                        ({"cache": "query", "result": "hits"}, query_cache["hits"]),
+                        ({"cache": "query", "result": "misses"}, query_cache["misses"])]))
+    ingest_jobs = sys.modules.get('ingest_jobs')
+    if ingest_jobs is not None:
+        gauges.append(("rag_ingest_queue_depth", "Ingestion jobs waiting to start", "gauge",
+                       [({}, ingest_jobs.get_ingest_queue().depth())]))
+    llm = gateway_stats()
+    if llm is not None:
+        gauges += [
+            ("rag_llm_requests_total", "Groq gateway calls and outcomes", "counter",
+             [({"outcome": name}, llm[name]) for name in ("calls", "retries", "throttled", "errors", "rejected")]),
+            ("rag_llm_tokens_total", "Tokens reported by Groq", "counter",
+             [({"type": "prompt"}, llm["prompt_tokens"]), ({"type": "completion"}, llm["completion_tokens"])]),
+            ("rag_llm_in_flight", "Groq requests in flight", "gauge", [({}, llm["concurrency"]["in_flight"])]),
+            ("rag_llm_concurrency_limit", "Adaptive Groq concurrency limit", "gauge",
+             [({}, llm["concurrency"]["limit"])]),
+        ]
+    return gauges
+
+@app.route('/api/rag/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics: stage and request latency histograms, cache hit rates, queue depths, LLM tokens"""
+    return Response(tracing.render_metrics(metric_gauges()), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/rag/cache-stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters for the response cache and the pre-generated store, plus request coalescing"""
+    stats = {"success": True, "response_cache": get_response_cache().stats(),
+             "single_flight": get_single_flight().stats()}
+    try:
+        stats["pregenerated"] = get_pregenerated_store().stats()
+    except Exception as e:
+        stats["pregenerated"] = {"error": str(e)}
+    return jsonify(stats), 200
+
+LIST_PDFS_MAX_LIMIT = int(os.getenv('RAG_LIST_PDFS_MAX_LIMIT', 1000))
 
 @app.route('/api/rag/list-pdfs', methods=['GET'])
 def list_pdfs():
-    """List all available documents from local storage"""
+    """
+    List available documents from the document catalog
+    Query (all optional): status (queued, indexing, indexed, failed, uploaded, stored),
+    q (name contains), type (pdf, docx, ...), sort (name, size, updated_at,
+    ingested_at, pages, chunks), order (asc/desc), offset, limit
+    
+    Each document carries size, sha256, pages, chunks, status, ingested_at,
+    embedding_model and error; "total" counts every match and "next_offset"
+    is null on the last page.
+    """
     try:
-        files_list = []
-        if os.path.exists(UPLOAD_FOLDER):
-            for filename in os.listdir(UPLOAD_FOLDER):
-                if '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS:
-                    file_path = os.path.join(UPLOAD_FOLDER, filename)
-                    file_size = os.path.getsize(file_path)
-                    files_list.append({
-                        "name": filename,
-                        "size": file_size,
-                        "size_mb": round(file_size / (1024 * 1024), 2)
-                    })
+        status = request.args.get('status') or None
+        if status and status not in DOCUMENT_STATUSES:
+            return jsonify({"success": False, "error": f"status must be one of {', '.join(DOCUMENT_STATUSES)}"}), 400
+        try:
+            offset = max(0, int(request.args.get('offset', 0)))
+            limit = min(max(1, int(request.args.get('limit', LIST_PDFS_MAX_LIMIT))), LIST_PDFS_MAX_LIMIT)
+            total, files_list = get_document_catalog().list(
+                status=status,
+                query=request.args.get('q'),
+                extension=request.args.get('type'),
+                sort=request.args.get('sort', 'name'),
+                descending=request.args.get('order', 'asc').lower() == 'desc',
+                offset=offset,
+                limit=limit,
+            )
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
         
         return jsonify({
             "success": True,
             "pdfs": files_list,
             "count": len(files_list),
+            "total": total,
+            "offset": offset,
+            "next_offset": offset + len(files_list) if offset + len(files_list) < total else None,
             "storage": "local"
         }), 200
     except Exception as e:
@@ -84,9 +369,117 @@ def list_pdfs():
             "error": str(e)
         }), 500
 
+PDF_TEXT_MAX_PAGES = int(os.getenv('RAG_PDF_TEXT_MAX_PAGES', 50))
+
+@app.route('/api/rag/pdf-text', methods=['GET'])
+def pdf_text():
+    """
+    Extracted text of a PDF, a page range at a time
+    Query: pdf_name, start_page (1-based, default 1), page_count (default 10,
+    at most RAG_PDF_TEXT_MAX_PAGES)
+    
+    Pages are served from the per-page text store; a PDF that was never
+    extracted is parsed once on the first request.
+    """
+    started = time.perf_counter()
+    try:
+        pdf_name = request.args.get('pdf_name', '').strip()
+        if not pdf_name:
+            return jsonify({"success": False, "error": "pdf_name is required"}), 400
+        try:
+            start_page = int(request.args.get('start_page', 1))
+            page_count = int(request.args.get('page_count', 10))
+        except ValueError:
+            return jsonify({"success": False, "error": "start_page and page_count must be integers"}), 400
+        if start_page < 1 or page_count < 1:
+            return jsonify({"success": False, "error": "start_page and page_count must be at least 1"}), 400
+        page_count = min(page_count, PDF_TEXT_MAX_PAGES)
+        
+        pdf_path = os.path.join(UPLOAD_FOLDER, secure_filename(pdf_name))
+        if not pdf_name.lower().endswith('.pdf') or not os.path.exists(pdf_path):
+            return jsonify({"success": False, "error": f"PDF file '{pdf_name}' not found"}), 404
+        
+        total_pages, texts = run_blocking(page_text_store.read_pages, pdf_path, start_page - 1, start_page - 1 + page_count)
+        end_page = start_page + len(texts) - 1
+        return jsonify({
+            "success": True,
+            "pdf_name": pdf_name,
+            "total_pages": total_pages,
+            "start_page": start_page,
+            "end_page": end_page if texts else None,
+            "next_start_page": end_page + 1 if end_page < total_pages else None,
+            "pages": [{"page": start_page + i, "text": text} for i, text in enumerate(texts)],
+            "timings": {"total_ms": elapsed_ms(started)}
+        }), 200
+    except Exception as e:
+        print(f"[RAG API] PDF text error: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+def register_upload(filename, local_file_path):
+    """Catalog a newly stored file and start its ingestion (or page extraction); returns the ingest job or None"""
+    ingest_job = None
+    is_pdf = filename.lower().endswith('.pdf')
+    get_document_catalog().record_upload(
+        filename, local_file_path, "queued" if AUTO_INGEST and is_pdf else "uploaded" if is_pdf else "stored"
+    )
+    if AUTO_INGEST and is_pdf:
+        from ingest_jobs import get_ingest_queue
+        ingest_job = get_ingest_queue().enqueue(filename)
+        print(f"[RAG API] Queued ingestion job {ingest_job['job_id']} for {filename}")
+    elif is_pdf:
+        start_page_extraction(local_file_path)
+    return ingest_job
+
+def duplicate_upload_response(existing, file_size):
+    """
+    The already stored document with the uploaded content; nothing is saved
+    again. If that document isn't indexed (its ingest failed or never ran),
+    its ingestion is queued instead of trusting the earlier upload.
+    """
+    print(f"[RAG API] Upload is identical to {existing}, returning the existing document")
+    catalog = get_document_catalog()
+    record = catalog.get(existing) or {}
+    ingest_job = None
+    if AUTO_INGEST and existing.lower().endswith('.pdf') and record.get("status") != "indexed":
+        from ingest_jobs import get_ingest_queue
+        if record.get("status") not in ("queued", "indexing"):
+            catalog.set_status(existing, "queued", error=None)
+        ingest_job = get_ingest_queue().enqueue(existing)
+        print(f"[RAG API] {existing} is not indexed, queued ingestion job {ingest_job['job_id']}")
+        record = catalog.get(existing) or record
+    return jsonify({
+        "success": True,
+        "filename": existing,
+        "size_mb": round(file_size / (1024 * 1024), 2),
+        "storage": "local",
+        "message": f"Identical file already uploaded as {existing}",
+        "duplicate": True,
+        "duplicate_of": existing,
+        "document": record,
+        "ingest_job_id": ingest_job["job_id"] if ingest_job else None,
+        "ingest_status": ingest_job["status"] if ingest_job else record.get("status")
+    }), 200
+
+def stored_upload_response(filename, file_size, ingest_job):
+    return jsonify({
+        "success": True,
+        "filename": filename,
+        "size_mb": round(file_size / (1024 * 1024), 2),
+        "storage": "local",
+        "message": "File uploaded successfully",
+        "duplicate": False,
+        "ingest_job_id": ingest_job["job_id"] if ingest_job else None,
+        "ingest_status": ingest_job["status"] if ingest_job else None
+    }), 200
+
 @app.route('/api/rag/upload-pdf', methods=['POST'])
 def upload_pdf():
-    """Upload a file to local storage for RAG processing"""
+    """
+    Upload a file to local storage for RAG processing.
+    The file streams into a hashed temp file while the request is read (413
+    as soon as it passes MAX_FILE_SIZE), then either matches a stored
+    document by content hash or is renamed into place atomically.
+    """
     print("[RAG API] ===== UPLOAD REQUEST RECEIVED =====")
     try:
         # Check if file is in request
@@ -101,38 +494,110 @@ def upload_pdf():
         if not allowed_file(file.filename):
             return jsonify({"success": False, "error": "Only PDF, DOC, DOCX, and TXT files are allowed"}), 400
         
-        # Check file size
-        file.seek(0, 2)  # Seek to end
-        file_size = file.tell()
-        file.seek(0)  # Reset to beginning
-        
-        if file_size > MAX_FILE_SIZE:
-            return jsonify({
-                "success": False,
-                "error": f"File too large. Maximum size is {MAX_FILE_SIZE / (1024 * 1024)}MB"
-            }), 400
-        
-        # Save file locally for RAG processing
+        upload = file.stream  # uploads.HashingUpload, already complete and size-checked
         filename = secure_filename(file.filename)
-        local_file_path = os.path.join(UPLOAD_FOLDER, filename)
-        print(f"[RAG API] Saving file locally: {local_file_path}")
-        file.save(local_file_path)
+        existing = uploads.finalize(filename, upload.commit, upload.sha256)
+        if existing is not None:
+            return duplicate_upload_response(existing, upload.size)
         print(f"[RAG API] File saved successfully: {filename}")
         
-        return jsonify({
-            "success": True,
-            "filename": filename,
-            "size_mb": round(file_size / (1024 * 1024), 2),
-            "storage": "local",
-            "message": "File uploaded successfully"
-        }), 200
+        # Index just this file in the background; the client can poll the job
+        ingest_job = register_upload(filename, os.path.join(UPLOAD_FOLDER, filename))
+        return stored_upload_response(filename, upload.size, ingest_job)
         
+    except HTTPException:
+        raise
     except Exception as e:
         return jsonify({
             "success": False,
             "error": str(e)
         }), 500
 
+def upload_error_response(error):
+    return jsonify(dict(error.details, success=False, error=str(error))), error.status
+
+@app.route('/api/rag/uploads', methods=['POST'])
+def create_resumable_upload():
+    """
+    Start a chunked, resumable upload for files too large for one request.
+    Body: {"filename", "size" (bytes), "sha256" (optional, verified on completion)}.
+    """
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(str(data.get('filename', '')))
+    if not filename:
+        return jsonify({"success": False, "error": "filename is required"}), 400
+    if not allowed_file(filename):
+        return jsonify({"success": False, "error": "Only PDF, DOC, DOCX, and TXT files are allowed"}), 400
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "size must be an integer"}), 400
+    try:
+        session = uploads.create_session(filename, size, data.get('sha256'))
+    except uploads.UploadError as e:
+        return upload_error_response(e)
+    print(f"[RAG API] Started resumable upload {session['upload_id']} for {filename} ({size} bytes)")
+    return jsonify({"success": True, **session}), 201
+
+@app.route('/api/rag/uploads/<upload_id>', methods=['GET'])
+def resumable_upload_status(upload_id):
+    """Bytes received so far; a client resumes by sending the rest from that offset"""
+    try:
+        return jsonify({"success": True, **uploads.session_status(upload_id)}), 200
+    except uploads.UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/api/rag/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Append the raw request body at ?offset= (the bytes received so far)"""
+    try:
+        offset = int(request.args.get('offset', '0'))
+    except ValueError:
+        return jsonify({"success": False, "error": "offset must be an integer"}), 400
+    try:
+        session = uploads.append_chunk(upload_id, offset, request.stream, request.content_length)
+    except uploads.UploadError as e:
+        return upload_error_response(e)
+    return jsonify({"success": True, **session}), 200
+
+@app.route('/api/rag/uploads/<upload_id>/complete', methods=['POST'])
+def complete_resumable_upload(upload_id):
+    """Verify a fully received upload, then store it like /api/rag/upload-pdf (de-duplicated by content hash)"""
+    try:
+        filename, existing, session = run_blocking(uploads.complete_session, upload_id)
+    except uploads.UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+    if existing is not None:
+        return duplicate_upload_response(existing, session["size"])
+    print(f"[RAG API] Resumable upload {upload_id} saved as {filename}")
+    ingest_job = register_upload(filename, os.path.join(UPLOAD_FOLDER, filename))
+    return stored_upload_response(filename, session["size"], ingest_job)
+
+
+@app.route('/api/rag/ingest-status/<job_id>', methods=['GET'])
+def ingest_status(job_id):
+    """Progress of a background ingestion job started by an upload"""
+    from ingest_jobs import get_ingest_queue
+    job = get_ingest_queue().get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Unknown ingestion job"}), 404
+    return jsonify({"success": True, "job": job}), 200
+
+
+def remove_pdf_vectors(filename):
+    """Drop a deleted document's chunks from the vector store and the ingest manifest"""
+    if not filename.lower().endswith('.pdf'):
+        return False
+    try:
+        from ingest_pdfs import remove_document_vectors, update_manifest
+        remove_document_vectors(filename)
+        update_manifest(filename, None)
+        return True
+    except Exception as e:
+        print(f"[RAG API] Failed to remove vectors for {filename}: {e}")
+        return False
 
 @app.route('/api/rag/delete-pdf', methods=['POST'])
 def delete_pdf():
@@ -148,10 +613,20 @@ def delete_pdf():
         file_path = os.path.join(UPLOAD_FOLDER, filename)
         if os.path.exists(file_path):
             try:
+                content_hash = page_text_store.content_hash_for(file_path)
                 os.remove(file_path)
+                page_text_store.remove_pages(content_hash)
+                get_document_catalog().remove(filename)
+                vectors_removed = remove_pdf_vectors(filename)
+                get_response_cache().invalidate_pdf(filename)
+                try:
+                    get_pregenerated_store().delete_pdf(filename)
+                except Exception as e:
+                    print(f"[RAG API] Failed to remove pre-generated entries for {filename}: {e}")
                 return jsonify({
                     "success": True,
-                    "message": f"File '{filename}' deleted successfully"
+                    "message": f"File '{filename}' deleted successfully",
+                    "vectors_removed": vectors_removed
                 }), 200
             except Exception as error:
                 return jsonify({
@@ -170,6 +645,21 @@ def delete_pdf():
             "error": str(e)
         }), 500
 
+@app.route('/api/rag/compact', methods=['POST'])
+def compact_vector_store():
+    """
+    Remove orphaned and duplicate chunks and compact chroma_db.
+    Body (optional): { "dry_run": true } to only report what would be removed
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        from ingest_pdfs import compact_store
+        report = compact_store(dry_run=bool(data.get('dry_run')))
+        return jsonify({"success": True, "report": report}), 200
+    except Exception as e:
+        print(f"[RAG API] Compaction failed: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
 @app.route('/api/rag/generate-answer', methods=['POST'])
 def generate_answer():
     """
@@ -181,12 +671,29 @@ def generate_answer():
         "subtopic": "Object Oriented Programming",
         "pdf_name": "python.pdf"
     }
+    
+    With ?stream=1 or "Accept: text/event-stream" the answer is streamed as
+    Server-Sent Events: "sources" (retrieval metadata), then "token" events
+    with markdown text as it is generated, then "done" with chunks_found,
+    timings and cache status ("error" if generation fails).
+    
+    Answers pre-generated by pregenerate.py are served from its store
+    (cache: "pregenerated"); pass "use_pregenerated": false to generate live.
+    
+    Identical requests arriving while one is generating share its retrieval
+    and generation (see coalesced()).
     """
+    return coalesced('generate-answer', answer_response)
+
+def answer_response():
+    """The generate-answer response for the current request"""
+    started = time.perf_counter()
     try:
         data = request.get_json()
         
         if not data:
             return jsonify({"success": False, "error": "No data provided"}), 400
+        note_debug_flag(data)
         
         topic = data.get('topic', '').strip()
         subtopic = data.get('subtopic', '').strip()
@@ -198,6 +705,14 @@ def generate_answer():
         if not pdf_name:
             return jsonify({"success": False, "error": "PDF name is required"}), 400
         
+        # Syllabus topics pre-generated ahead of time skip retrieval and generation
+        stored = pregenerated_response('generate-answer', pdf_name, data)
+        if stored is not None:
+            print(f"[RAG API] Serving pre-generated answer for: {topic} / {subtopic}")
+            if wants_stream():
+                return sse_response(stream_cached_answer(stored, "pregenerated", started, elapsed_ms(started)))
+            return jsonify(dict(stored, cache="pregenerated")), 200
+        
         # Construct the query
         query = f"{topic}"
         if subtopic:
@@ -209,20 +724,36 @@ def generate_answer():
         get_relevant_context, groq_summarize, parse_llm_output, DB_DIR = get_rag_functions()
         
         # Get relevant context from RAG
-        results = get_relevant_context(query, subject_filter=pdf_name)
+        with tracing.stage("retrieval"):
+            results = run_blocking(get_relevant_context, query, subject_filter=pdf_name)
+        retrieval_ms = elapsed_ms(started)
         
         if not results or len(results) == 0:
             print(f"[RAG API] No relevant information found in PDF. Switching to General AI Answer generation.")
             context_text = "No specific context found in the uploaded document. Please generate a comprehensive answer based on your general academic knowledge."
             sources = ["General AI Knowledge (Topic not found in PDF)"]
+            packing = None
         else:
-            # Build context from retrieved documents
-            chunks = []
-            for doc in results[:10]:  # Use more chunks for comprehensive answer
-                txt = doc.page_content.replace("\n", " ").strip()
-                chunks.append(txt)
-            context_text = "\n\n".join(chunks)
+            # Build context from retrieved documents: overlaps merged, near-duplicates dropped, within the token budget
+            with tracing.stage("context_packing"):
+                context_text, packing = pack_context(results[:10])  # Use more chunks for comprehensive answer
             sources = [pdf_name]
+            print(f"[RAG API] Context packed: {packing['chunks']} chunks -> {packing['passages']} passages, "
+                  f"~{packing['tokens_saved']} tokens saved")
+
+        # Serve repeated requests over the same retrieved chunks from the response cache
+        cache = get_response_cache()
+        cache_scope = cache.make_scope('generate-answer', pdf_name)
+        chunk_ids = chunk_digests(results)
+        embed_query = query_embedder(query)
+        with tracing.stage("cache_lookup"):
+            cached, cache_status = cache.get(cache_scope, query, chunk_ids, embed_query)
+        if cached is not None:
+            print(f"[RAG API] Response cache {cache_status} for: {query}")
+            cached = dict(cached, topic=topic, subtopic=subtopic)
+            if wants_stream():
+                return sse_response(stream_cached_answer(cached, cache_status, started, retrieval_ms))
+            return jsonify(dict(cached, cache=cache_status)), 200
 
         # Use Groq to generate a comprehensive answer
         groq_api_key = os.getenv("GROQ_API_KEY")
@@ -236,6 +767,7 @@ def generate_answer():
         print(f"[RAG API] Using Groq API Key: {groq_api_key[:8]}...")
         
         # Enhanced prompt for 16-mark answer
+        prompt_started = time.perf_counter()
         enhanced_prompt = f"""Create a comprehensive, well-structured answer for the topic: "{query}". 
         
 This answer is for a 16-mark exam question, so it should be detailed and thorough.
@@ -259,34 +791,52 @@ Format the answer with proper markdown formatting:
 
 Make it comprehensive enough to score full marks (16/16) in an exam."""
         
-        # Call Groq API
-        try:
-            from groq import Groq
-            client = Groq(api_key=groq_api_key)
-            
-            # Use a more powerful model for better answers
-            model = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
-            
-            system_msg = """You are an expert educational assistant creating comprehensive exam answers. 
+        system_msg = """You are an expert educational assistant creating comprehensive exam answers. 
 Your answers should be detailed, well-structured, and worthy of full marks in academic examinations.
 Use the provided context to create accurate, informative answers."""
-            
-            user_msg = f"{enhanced_prompt}\n\n**Context from PDF:**\n{context_text}"
-            
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_msg},
-                    {"role": "user", "content": user_msg}
-                ],
-                max_tokens=2000,  # Allow longer responses for 16-mark answers
-                temperature=0.3,  # Lower temperature for more focused answers
-            )
+        
+        user_msg = f"{enhanced_prompt}\n\n**Context from PDF:**\n{context_text}"
+        
+        completion_args = {
+            # Use a more powerful model for better answers
+            "model": os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile"),
+            "messages": [
+                {"role": "system", "content": system_msg},
+                {"role": "user", "content": user_msg}
+            ],
+            "max_tokens": 2000,  # Allow longer responses for 16-mark answers
+            "temperature": 0.3,  # Lower temperature for more focused answers
+        }
+        trace = tracing.current()
+        if trace is not None:
+            trace.add("prompt_build", time.perf_counter() - prompt_started)
+        
+        if wants_stream():
+            payload = {
+                "success": True,
+                "sources": sources,
+                "topic": topic,
+                "subtopic": subtopic,
+                "pdf_used": pdf_name,
+                "chunks_found": len(results),
+                "context": context_text,
+                "context_packing": packing
+            }
+            cache_entry = (cache, cache_scope, query, chunk_ids, embed_query)
+            return sse_response(stream_generated_answer(
+                completion_args, payload, cache_entry, started, retrieval_ms
+            ))
+        
+        # Call Groq API
+        try:
+            with tracing.stage("llm"):
+                response = get_llm_gateway().complete(**completion_args)
             
             generated_answer = response.choices[0].message.content.strip()
             
             # Parse answer and sources
-            answer_text, extracted_sources = parse_llm_output(generated_answer)
+            with tracing.stage("parse_output"):
+                answer_text, extracted_sources = parse_llm_output(generated_answer)
             
             if not answer_text:
                 answer_text = generated_answer
@@ -294,7 +844,7 @@ Use the provided context to create accurate, informative answers."""
             # Add source metadata
             final_sources = extracted_sources if extracted_sources else sources
             
-            return jsonify({
+            payload = {
                 "success": True,
                 "answer": answer_text,
                 "sources": final_sources,
@@ -302,9 +852,16 @@ Use the provided context to create accurate, informative answers."""
                 "subtopic": subtopic,
                 "pdf_used": pdf_name,
                 "chunks_found": len(results),
-                "context": context_text  # Add context for admin dashboard
-            }), 200
+                "context": context_text,  # Add context for admin dashboard
+                "context_packing": packing
+            }
+            with tracing.stage("cache_store"):
+                cache.put(cache_scope, query, chunk_ids, payload, pdf_name, embed_query)
+            return jsonify(dict(payload, cache=cache_status)), 200
             
+        except LLMUnavailable as groq_error:
+            print(f"[RAG API] Groq unavailable: {groq_error}")
+            return llm_unavailable_response(groq_error)
         except Exception as groq_error:
             print(f"[RAG API] Groq API error: {groq_error}")
             return jsonify({
@@ -319,6 +876,72 @@ Use the provided context to create accurate, informative answers."""
             "error": str(e)
         }), 500
 
+def stream_cached_answer(cached, cache_status, started, retrieval_ms):
+    """SSE events for an answer served from the response cache"""
+    meta = {k: v for k, v in cached.items() if k != 'answer'}
+    yield sse_event('sources', meta)
+    yield sse_event('token', {"text": cached["answer"]})
+    yield sse_event('done', {
+        "success": True,
+        "chunks_found": cached.get("chunks_found", 0),
+        "cache": cache_status,
+        "timings": {"retrieval_ms": retrieval_ms, "first_token_ms": elapsed_ms(started), "total_ms": elapsed_ms(started)},
+        "debug": tracing.debug_timings()
+    })
+
+def stream_generated_answer(completion_args, payload, cache_entry, started, retrieval_ms):
+    """
+    SSE events for a freshly generated answer: retrieval metadata first,
+    then markdown tokens as Groq produces them, then a summary.
+    The full answer is cached once the stream completes.
+    """
+    yield sse_event('sources', payload)
+    first_token_ms = None
+    parts = []
+    trace = tracing.current()
+    try:
+        with tracing.stage("llm"):
+            llm_started = time.perf_counter()
+            for text in get_llm_gateway().stream(**completion_args):
+                if first_token_ms is None:
+                    first_token_ms = elapsed_ms(started)
+                    if trace is not None:
+                        trace.add("llm_first_token", time.perf_counter() - llm_started)
+                parts.append(text)
+                yield sse_event('token', {"text": text})
+    except LLMUnavailable as groq_error:
+        print(f"[RAG API] Groq unavailable: {groq_error}")
+        yield sse_event('error', {"success": False, "error": str(groq_error), "retry_after": groq_error.retry_after})
+        return
+    except Exception as groq_error:
+        print(f"[RAG API] Groq streaming error: {groq_error}")
+        yield sse_event('error', {"success": False, "error": f"Failed to generate answer: {str(groq_error)}"})
+        return
+    
+    _, _, parse_llm_output, _ = get_rag_functions()
+    generated_answer = "".join(parts).strip()
+    with tracing.stage("parse_output"):
+        answer_text, extracted_sources = parse_llm_output(generated_answer)
+    final = dict(payload, answer=answer_text or generated_answer,
+                 sources=extracted_sources if extracted_sources else payload["sources"])
+    cache, cache_scope, query, chunk_ids, embed_query = cache_entry
+    with tracing.stage("cache_store"):
+        cache.put(cache_scope, query, chunk_ids, final, payload["pdf_used"], embed_query)
+    
+    total_ms = elapsed_ms(started)
+    yield sse_event('done', {
+        "success": True,
+        "chunks_found": payload["chunks_found"],
+        "cache": "miss",
+        "timings": {
+            "retrieval_ms": retrieval_ms,
+            "first_token_ms": first_token_ms,
+            "generation_ms": round(total_ms - retrieval_ms, 1),
+            "total_ms": total_ms
+        },
+        "debug": tracing.debug_timings()
+    })
+
 @app.route('/api/rag/quick-answer', methods=['POST'])
 def quick_answer():
     """
@@ -326,6 +949,7 @@ def quick_answer():
     """
     try:
         data = request.get_json()
+        note_debug_flag(data)
         query = data.get('query', '').strip()
         pdf_name = data.get('pdf_name', '').strip()
         
@@ -336,16 +960,19 @@ def quick_answer():
         get_relevant_context, groq_summarize, parse_llm_output, DB_DIR = get_rag_functions()
         
         # Get relevant context
-        results = get_relevant_context(query, subject_filter=pdf_name)
+        with tracing.stage("retrieval"):
+            results = run_blocking(get_relevant_context, query, subject_filter=pdf_name)
         
         if not results:
             return jsonify({"success": False, "error": "No results found"}), 404
         
         # Get quick summary
-        groq_answer = groq_summarize(results, query)
+        with tracing.stage("llm"):
+            groq_answer = run_blocking(groq_summarize, results, query)
         
         if groq_answer:
-            answer, sources = parse_llm_output(groq_answer)
+            with tracing.stage("parse_output"):
+                answer, sources = parse_llm_output(groq_answer)
             return jsonify({
                 "success": True,
                 "answer": answer,
@@ -366,31 +993,147 @@ def quick_answer():
             "error": str(e)
         }), 500
 
+MAX_BATCH_QUERIES = int(os.getenv('RAG_MAX_BATCH_QUERIES', 100))
+
+@app.route('/api/rag/batch-retrieve', methods=['POST'])
+def batch_retrieve():
+    """
+    Retrieve context for many topics/subtopics in one request
+    
+    Request body:
+    {
+        "pdf_name": "python.pdf",
+        "queries": ["Decorators", {"topic": "Python", "subtopic": "Generators"}],
+        "k": 5
+    }
+    
+    Object queries are turned into "topic - subtopic" like generate-answer does.
+    All queries are embedded in one batched pass and searched together.
+    """
+    started = time.perf_counter()
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"success": False, "error": "No data provided"}), 400
+        note_debug_flag(data)
+        
+        pdf_name = str(data.get('pdf_name') or '').strip()
+        try:
+            k = int(data.get('k', 5))
+        except (TypeError, ValueError):
+            return jsonify({"success": False, "error": "k must be an integer"}), 400
+        if not isinstance(data.get('queries') or [], list):
+            return jsonify({"success": False, "error": "queries must be a list"}), 400
+        queries = []
+        for item in data.get('queries') or []:
+            if isinstance(item, dict):
+                query = str(item.get('topic') or '').strip()
+                subtopic = str(item.get('subtopic') or '').strip()
+                if query and subtopic:
+                    query += f" - {subtopic}"
+            else:
+                query = str(item).strip()
+            if not query:
+                return jsonify({"success": False, "error": "Every query needs text or a topic"}), 400
+            queries.append(query)
+        
+        if not queries:
+            return jsonify({"success": False, "error": "queries is required"}), 400
+        if len(queries) > MAX_BATCH_QUERIES:
+            return jsonify({"success": False, "error": f"At most {MAX_BATCH_QUERIES} queries per request"}), 400
+        if not 1 <= k <= 50:
+            return jsonify({"success": False, "error": "k must be between 1 and 50"}), 400
+        
+        print(f"[RAG API] Batch retrieving {len(queries)} queries from {pdf_name or 'all documents'}")
+        from retrieve import get_relevant_contexts
+        with tracing.stage("retrieval"):
+            batches = run_blocking(get_relevant_contexts, queries, subject_filter=pdf_name or None, k=k)
+        
+        results = []
+        for query, hits in zip(queries, batches):
+            results.append({
+                "query": query,
+                "chunks_found": len(hits),
+                "chunks": [
+                    {"content": doc.page_content, "metadata": doc.metadata, "score": score}
+                    for doc, score in hits
+                ]
+            })
+        return jsonify({
+            "success": True,
+            "pdf_name": pdf_name,
+            "results": results,
+            "timings": {"total_ms": elapsed_ms(started)}
+        }), 200
+    
+    except Exception as e:
+        print(f"[RAG API] Batch retrieve error: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
 @app.route('/api/rag/generate-quiz', methods=['POST'])
 def generate_quiz():
     """
     Generate MCQs from PDF using RAG
-    Expects: { topic, subtopic (opt), pdf_name, difficulty, question_count, cognitive_level }
+    Expects: { topic, subtopic (opt), subtopics (opt list), pdf_name, difficulty, question_count, cognitive_level }
+    
+    Quizzes larger than RAG_QUIZ_SHARD_SIZE, or over a list of subtopics, are
+    generated as concurrent shards (see quiz_generation.py) and always return
+    exactly question_count questions unless generation keeps failing.
+    
+    With ?stream=1 or "Accept: text/event-stream" the quiz is streamed as
+    Server-Sent Events: "meta" (source, context, chunks_found), one "question"
+    event per question as soon as it is validated, then "done" with generation
+    stats, timings and cache status ("error" if generation fails).
+    
+    Quizzes pre-generated by pregenerate.py are served from its store
+    (cache: "pregenerated"); pass "use_pregenerated": false to generate live.
+    
+    Identical requests arriving while one is generating share its retrieval
+    and generation (see coalesced()).
     """
+    return coalesced('generate-quiz', quiz_response)
+
+def quiz_response():
+    """The generate-quiz response for the current request"""
+    started = time.perf_counter()
     try:
         data = request.get_json()
         if not data:
             return jsonify({"success": False, "error": "No data provided"}), 400
+        note_debug_flag(data)
             
         topic = data.get('topic', '').strip()
         subtopic = data.get('subtopic', '').strip()
         pdf_name = data.get('pdf_name', '').strip()
         difficulty = data.get('difficulty', 'medium')
-        question_count = int(data.get('question_count', 5))
+        question_count = data.get('question_count', 5)
         cognitive_level = data.get('cognitive_level', 'application')
+        subtopics = [str(s).strip() for s in data.get('subtopics') or [] if str(s).strip()]
         
         if not topic or not pdf_name:
             return jsonify({"success": False, "error": "Topic and PDF name are required"}), 400
+        try:
+            question_count = int(question_count)
+        except (TypeError, ValueError):
+            return jsonify({"success": False, "error": "question_count must be an integer"}), 400
+        if not 1 <= question_count <= quiz_generation.MAX_QUESTIONS:
+            return jsonify({"success": False,
+                            "error": f"question_count must be between 1 and {quiz_generation.MAX_QUESTIONS}"}), 400
+        
+        # Syllabus quizzes pre-generated ahead of time skip retrieval and generation
+        stored = pregenerated_response('generate-quiz', pdf_name, data)
+        if stored is not None:
+            print(f"[RAG API] Serving pre-generated quiz for: {topic} / {subtopic}")
+            if wants_stream():
+                return sse_response(stream_cached_quiz(stored, "pregenerated", started))
+            return jsonify(dict(stored, cache="pregenerated")), 200
             
         # Construct query
         query = f"Generate {question_count} {difficulty} {cognitive_level} multiple choice questions about {topic}"
         if subtopic:
             query += f" specifically regarding {subtopic}"
+        if subtopics:
+            query += f" across subtopics: {', '.join(subtopics)}"
             
         print(f"[RAG API] Generating quiz for: {query} from {pdf_name}")
         
@@ -410,9 +1153,26 @@ def generate_quiz():
         # Lazy import
         get_relevant_context, _, parse_llm_output, _ = get_rag_functions()
         
+        def retrieve_many(queries, k):
+            if len(queries) == 1:
+                return [run_blocking(get_relevant_context, queries[0], subject_filter=pdf_name, k=k)]
+            from retrieve import get_relevant_contexts
+            batches = run_blocking(get_relevant_contexts, queries, subject_filter=pdf_name, k=k)
+            return [[doc for doc, _ in hits] for hits in batches]
+        
+        # Large quizzes and subtopic lists fan out into concurrently generated shards
+        shards = quiz_generation.plan_shards(question_count, subtopic, subtopics)
+        
         # Get context
-        print(f"[RAG API] Retrieving context from vector DB for: {pdf_name}")
-        results = get_relevant_context(topic if not subtopic else f"{topic} {subtopic}", subject_filter=pdf_name)
+        print(f"[RAG API] Retrieving context from vector DB for: {pdf_name} ({len(shards)} shard(s))")
+        retrieval_query = topic if not subtopic else f"{topic} {subtopic}"
+        if subtopics:
+            retrieval_query += " | " + " | ".join(subtopics)
+        with tracing.stage("retrieval"):
+            quiz_generation.assign_contexts(shards, topic, pdf_name, retrieve_many)
+        results = []
+        for shard in shards:
+            results.extend(doc for doc in shard["chunks"] if doc not in results)
         
         if not results:
              print(f"[RAG API] No context found in vector DB for quiz. PDF may not be indexed yet.")
@@ -423,10 +1183,21 @@ def generate_quiz():
              }), 404
              
         # Build context
-        chunks = []
-        for doc in results[:8]:
-            chunks.append(doc.page_content.replace("\n", " ").strip())
-        context_text = "\n\n".join(chunks)
+        context_text = quiz_generation.context_text_for(results)
+        
+        # Serve repeated requests over the same retrieved chunks from the response cache
+        cache = get_response_cache()
+        cache_scope = cache.make_scope('generate-quiz', pdf_name, difficulty=difficulty,
+                                       question_count=question_count, cognitive_level=cognitive_level)
+        chunk_ids = chunk_digests(results)
+        embed_query = query_embedder(retrieval_query)
+        with tracing.stage("cache_lookup"):
+            cached, cache_status = cache.get(cache_scope, retrieval_query, chunk_ids, embed_query)
+        if cached is not None:
+            print(f"[RAG API] Response cache {cache_status} for quiz: {retrieval_query}")
+            if wants_stream():
+                return sse_response(stream_cached_quiz(cached, cache_status, started))
+            return jsonify(dict(cached, cache=cache_status)), 200
         
         groq_api_key = os.getenv("GROQ_API_KEY")
         if not groq_api_key:
@@ -434,69 +1205,122 @@ def generate_quiz():
 
         print(f"[RAG API] Using Groq API Key: {groq_api_key[:8]}...")
         
-        from groq import Groq
-        client = Groq(api_key=groq_api_key)
         model = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
-
-        prompt = f"""You are an expert assessment generator. Create exactly {question_count} multiple choice questions (MCQs) for the topic "{topic}" (Subtopic: "{subtopic}") based on the provided text context.
-
-Context from document ({pdf_name}):
-{context_text}
-
-Requirements:
-1. Difficulty: {difficulty}
-2. Cognitive Level: {cognitive_level}
-3. Generate exactly {question_count} valid JSON objects.
-4. Each question must have "text", "options" (array of 4 strings, labeled A, B, C, D), "correctAnswer", and "subtopic".
-5. IMPORTANT: Instead of a generic explanation, you MUST provide the specific "subtopic" that the question maps to. This is CRITICAL for analytics.
-6. Return ONLY a JSON array. No markdown, no intro text.
-
-Example format:
-[
-  {{
-    "text": "Question?",
-    "options": ["A) Opt1", "B) Opt2", "C) Opt3", "D) Opt4"],
-    "correctAnswer": "B) Opt2",
-    "subtopic": "Specific Subtopic Name"
-  }}
-]
-"""
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You are a JSON-only response bot. You output valid JSON arrays of quiz questions."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.5,
-            max_tokens=3000
-        )
-        
-        content = response.choices[0].message.content.strip()
-        # Clean markdown
-        content = content.replace("```json", "").replace("```", "").strip()
+        if wants_stream():
+            meta = {"success": True, "source": pdf_name, "context": context_text, "chunks_found": len(results)}
+            cache_entry = (cache, cache_scope, retrieval_query, chunk_ids, embed_query)
+            return sse_response(stream_generated_quiz(
+                shards, question_count, (topic, pdf_name, difficulty, cognitive_level, model),
+                meta, cache_entry, started
+            ))
         
-        import json
-        try:
-            questions = json.loads(content)
-            if not isinstance(questions, list):
-                raise ValueError("Response is not a list")
-            return jsonify({
-                "success": True,
-                "questions": questions,
-                "source": pdf_name,
-                "context": context_text,  # Add context for admin dashboard
-                "chunks_found": len(results)  # Add chunks count for admin dashboard
-            }), 200
-        except Exception as json_err:
-            print(f"JSON Parse Error: {json_err}, Content: {content[:100]}...")
+        questions, quiz_stats = quiz_generation.generate_questions(
+            shards, question_count, topic, pdf_name, difficulty, cognitive_level, model
+        )
+        if not questions:
             return jsonify({"success": False, "error": "Failed to parse AI response"}), 500
+        if len(questions) < question_count:
+            print(f"[RAG API] Quiz short by {question_count - len(questions)} questions after top-up")
+        
+        payload = {
+            "success": True,
+            "questions": questions,
+            "source": pdf_name,
+            "context": context_text,  # Add context for admin dashboard
+            "chunks_found": len(results),  # Add chunks count for admin dashboard
+            "generation": quiz_stats
+        }
+        # Only complete quizzes are worth serving again
+        if len(questions) == question_count:
+            with tracing.stage("cache_store"):
+                cache.put(cache_scope, retrieval_query, chunk_ids, payload, pdf_name, embed_query)
+        return jsonify(dict(payload, cache=cache_status)), 200
 
+    except LLMUnavailable as e:
+        print(f"[RAG API] Groq unavailable for quiz: {e}")
+        return llm_unavailable_response(e)
     except Exception as e:
         print(f"[RAG API] Error generating quiz: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+def stream_cached_quiz(cached, cache_status, started):
+    """SSE events for a quiz served from the response cache"""
+    yield sse_event('meta', {k: v for k, v in cached.items() if k not in ('questions', 'generation')})
+    for number, question in enumerate(cached["questions"], 1):
+        yield sse_event('question', {"number": number, "question": question})
+    yield sse_event('done', {
+        "success": True,
+        "question_count": len(cached["questions"]),
+        "generation": cached.get("generation"),
+        "cache": cache_status,
+        "timings": {"first_question_ms": elapsed_ms(started), "total_ms": elapsed_ms(started)},
+        "debug": tracing.debug_timings()
+    })
+
+def stream_generated_quiz(shards, question_count, generation_args, meta, cache_entry, started):
+    """
+    SSE events for a freshly generated quiz: retrieval metadata first, then
+    each question as soon as it is validated and de-duplicated (shards finish
+    in any order), then a summary. The quiz is cached once it is complete,
+    with its questions back in shard order.
+    """
+    yield sse_event('meta', meta)
+    quiz_stats = {}
+    generated = []
+    first_question_ms = None
+    try:
+        for index, question in quiz_generation.iter_questions(shards, question_count, *generation_args,
+                                                              stats=quiz_stats):
+            if first_question_ms is None:
+                first_question_ms = elapsed_ms(started)
+            generated.append((index, question))
+            yield sse_event('question', {"number": len(generated), "question": question})
+    except LLMUnavailable as groq_error:
+        print(f"[RAG API] Groq unavailable for quiz: {groq_error}")
+        yield sse_event('error', {"success": False, "error": str(groq_error), "retry_after": groq_error.retry_after})
+        return
+    except Exception as groq_error:
+        print(f"[RAG API] Quiz streaming error: {groq_error}")
+        yield sse_event('error', {"success": False, "error": str(groq_error)})
+        return
+    
+    if not generated:
+        yield sse_event('error', {"success": False, "error": "Failed to parse AI response"})
+        return
+    if len(generated) < question_count:
+        print(f"[RAG API] Quiz short by {question_count - len(generated)} questions after top-up")
+    
+    generated.sort(key=lambda item: item[0])
+    questions = [question for _, question in generated]
+    if len(questions) == question_count:
+        cache, cache_scope, query, chunk_ids, embed_query = cache_entry
+        payload = {
+            "success": True,
+            "questions": questions,
+            "source": meta["source"],
+            "context": meta["context"],
+            "chunks_found": meta["chunks_found"],
+            "generation": quiz_stats
+        }
+        with tracing.stage("cache_store"):
+            cache.put(cache_scope, query, chunk_ids, payload, meta["source"], embed_query)
+    
+    yield sse_event('done', {
+        "success": True,
+        "question_count": len(questions),
+        "generation": quiz_stats,
+        "cache": "miss",
+        "timings": {"first_question_ms": first_question_ms, "total_ms": elapsed_ms(started)},
+        "debug": tracing.debug_timings()
+    })
+
+tracing.mark_startup("imported")
+
 if __name__ == '__main__':
     port = int(os.getenv('RAG_API_PORT', 5000))
     print(f"[RAG API] Starting server on port {port} (debug mode: OFF)")
+    print("[RAG API] Development server; use 'python serve.py' for production")
+    if os.getenv('RAG_WARMUP', 'true').lower() != 'false':
+        start_rag_warm_up()
     app.run(host='0.0.0.0', port=port, debug=False)
 
@@ -0,0 +1,194 @@
+"""
+Response cache for the LLM-backed RAG endpoints (generate-answer, generate-quiz).
+
+Two layers:
+- exact: LRU with TTL, keyed by the normalized request plus digests of the
+  retrieved chunks, so a re-ingested PDF (different chunks) never hits stale entries
+- semantic (optional): reuses a cached response when a new query's embedding is
+  within a cosine-similarity threshold of a cached query for the same PDF and
+  the same generation parameters
+
+Entries for a PDF are dropped when it is re-ingested or deleted in this process,
+and everything is dropped when retrieve.py reloads chroma_db after an external
+re-ingest.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+CACHE_ENABLED = os.getenv("RAG_RESPONSE_CACHE", "true").lower() != "false"
+CACHE_TTL = float(os.getenv("RAG_RESPONSE_CACHE_TTL", "600"))
+CACHE_SIZE = int(os.getenv("RAG_RESPONSE_CACHE_SIZE", "512"))
+SEMANTIC_ENABLED = os.getenv("RAG_SEMANTIC_CACHE", "false").lower() == "true"
+SEMANTIC_THRESHOLD = float(os.getenv("RAG_SEMANTIC_CACHE_THRESHOLD", "0.95"))
+
+def normalize_text(value):
+    """Case- and whitespace-insensitive form of a request field"""
+    return re.sub(r"\s+", " ", str(value or "")).strip().lower()
+
+def chunk_digests(results):
+    """Stable identifiers for retrieved chunks (digest of their text)"""
+    return [hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()[:16] for doc in results]
+
+class ResponseCache:
+    def __init__(self, max_entries=CACHE_SIZE, ttl=CACHE_TTL,
+                 semantic=SEMANTIC_ENABLED, threshold=SEMANTIC_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic = semantic
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # scope -> {key: unit query vector}
+        self._vectors = {}
+        self._generation = None
+        self.counters = {"hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0,
+                         "evictions": 0, "expired": 0, "invalidations": 0}
+
+    @staticmethod
+    def make_scope(endpoint, pdf_name, **params):
+        """Everything except the query text that must match for a semantic hit"""
+        normalized = {k: normalize_text(v) for k, v in sorted(params.items())}
+        return json.dumps([endpoint, os.path.basename(pdf_name or ""), normalized])
+
+    @staticmethod
+    def make_key(scope, query, chunk_ids):
+        payload = json.dumps([scope, normalize_text(query), list(chunk_ids)])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _check_generation(self):
+        """Drop everything if retrieve.py reopened chroma_db since the entries were stored"""
+        import sys
+        rag_module = sys.modules.get("retrieve")
+        generation = rag_module.store_generation() if rag_module else None
+        if generation != self._generation:
+            if self._entries:
+                self.counters["invalidations"] += len(self._entries)
+            self._entries.clear()
+            self._vectors.clear()
+            self._generation = generation
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._vectors.get(entry["scope"], {}).pop(key, None)
+
+    def _live_entry(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now - entry["stored_at"] > self.ttl:
+            self._drop(key)
+            self.counters["expired"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, scope, query, chunk_ids, embed_query=None):
+        """
+        Return (response, status) where status is "hit", "semantic_hit" or "miss".
+        embed_query: zero-argument callable giving the query embedding, only
+        called when the semantic layer needs it.
+        """
+        if not CACHE_ENABLED:
+            return None, "disabled"
+        key = self.make_key(scope, query, chunk_ids)
+        now = time.time()
+        with self._lock:
+            self._check_generation()
+            entry = self._live_entry(key, now)
+            if entry is not None:
+                self.counters["hits"] += 1
+                return entry["response"], "hit"
+            candidates = list(self._vectors.get(scope, {}).items()) if self.semantic else []
+
+        if candidates and embed_query is not None:
+            import numpy as np
+            vector = self._unit(embed_query())
+            keys = [k for k, _ in candidates]
+            similarities = np.stack([v for _, v in candidates]) @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                with self._lock:
+                    entry = self._live_entry(keys[best], now)
+                    if entry is not None:
+                        self.counters["semantic_hits"] += 1
+                        return entry["response"], "semantic_hit"
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None, "miss"
+
+    @staticmethod
+    def _unit(vector):
+        # NumPy only when the semantic cache is used; it is a tenth of rag_api's import time
+        import numpy as np
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def put(self, scope, query, chunk_ids, response, pdf_name, embed_query=None):
+        if not CACHE_ENABLED:
+            return
+        key = self.make_key(scope, query, chunk_ids)
+        vector = self._unit(embed_query()) if self.semantic and embed_query is not None else None
+        with self._lock:
+            self._check_generation()
+            self._drop(key)
+            self._entries[key] = {
+                "response": response,
+                "scope": scope,
+                "pdf_name": os.path.basename(pdf_name or ""),
+                "stored_at": time.time(),
+            }
+            if vector is not None:
+                self._vectors.setdefault(scope, {})[key] = vector
+            self.counters["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.counters["evictions"] += 1
+
+    def invalidate_pdf(self, pdf_name):
+        """Forget every response generated from a PDF (re-ingested or deleted)"""
+        pdf_name = os.path.basename(pdf_name or "")
+        with self._lock:
+            stale = [k for k, e in self._entries.items() if e["pdf_name"] == pdf_name]
+            for key in stale:
+                self._drop(key)
+            self.counters["invalidations"] += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.counters["invalidations"] += len(self._entries)
+            self._entries.clear()
+            self._vectors.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["semantic_hits"] + self.counters["misses"]
+            hits = self.counters["hits"] + self.counters["semantic_hits"]
+            return dict(
+                self.counters,
+                enabled=CACHE_ENABLED,
+                semantic_enabled=self.semantic,
+                entries=len(self._entries),
+                hit_rate=round(hits / lookups, 4) if lookups else None,
+            )
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """Process-wide response cache, created on first use"""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
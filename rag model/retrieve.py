@@ -1,69 +1,570 @@
 import os
+import json
+import hashlib
+import threading
+import contextvars
+import time
+from contextlib import contextmanager
+import env_file
+
+# Before the modules below read their RAG_* settings
+env_file.load_env_file()
+
+import chromadb
 from langchain_community.vectorstores import Chroma
 from langchain_huggingface import HuggingFaceEmbeddings
-from dotenv import load_dotenv
-
-load_dotenv()
+from embedding_cache import CachedEmbeddings
+import lexical_index
+import vector_index
+import index_snapshot
+import tracing
 
 # Define DB directory relative to this file
 DB_DIR = os.path.join(os.path.dirname(__file__), 'chroma_db')
+# ingest_pdfs.py's manifest; each entry points at the document's current collection
+MANIFEST_PATH = os.path.join(DB_DIR, 'ingest_manifest.json')
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+USE_EMBEDDING_CACHE = os.getenv("RAG_EMBEDDING_CACHE", "true").lower() != "false"
+
+# Collection used before documents got their own collections.
+# Still searched (with a metadata filter) for PDFs that haven't been re-ingested.
+DEFAULT_COLLECTION = "langchain"
+
+# When a filter can't be pushed down to Chroma, fetch k * this many results and filter them here
+FILTER_FETCH_MULTIPLIER = int(os.getenv("RAG_FILTER_FETCH_MULTIPLIER", "8"))
+
+# How often (seconds) to stat chroma_db for changes made by ingestion
+RELOAD_CHECK_INTERVAL = float(os.getenv("RAG_RELOAD_CHECK_INTERVAL", "2"))
+
+# Merge BM25 (lexical_index.py) and vector results for documents that have a lexical index
+HYBRID_SEARCH = os.getenv("RAG_HYBRID_SEARCH", "true").lower() != "false"
+# Each ranking contributes k * this many candidates to the fusion
+HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "4"))
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+
+# "chroma", or "mmap" to search documents through their memory-mapped vector_index
+# (documents without one, and the legacy shared collection, still go to Chroma)
+VECTOR_BACKEND = os.getenv("RAG_VECTOR_BACKEND", "chroma").lower()
+
+# Process-wide retrieval engine state.
+# The embedding model and the Chroma client are loaded once per worker
+# and shared by every request thread instead of being rebuilt per call.
+_engine_lock = threading.RLock()
+_ready = threading.Event()
+_embedding_function = None
+_client = None
+_db = None
+_doc_stores = {}
+_doc_collections = set()
+_local_writers = 0
+_db_signature = None
+_last_reload_check = 0.0
+_warmup_error = None
+_warmup_seconds = None
+_reload_count = 0
 
 def get_embedding_function():
-    # Use the same embedding model as used for ingestion
-    return HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    """
+    Return the shared embedding model, loading it on first use.
+    Wrapped in the persistent embedding cache unless RAG_EMBEDDING_CACHE=false.
+    """
+    global _embedding_function
+    if _embedding_function is None:
+        with _engine_lock:
+            if _embedding_function is None:
+                # Use the same embedding model as used for ingestion
+                with tracing.stage("model_load"):
+                    model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+                if USE_EMBEDDING_CACHE:
+                    model = CachedEmbeddings(model, EMBEDDING_MODEL_NAME)
+                _embedding_function = model
+    return _embedding_function
 
-def get_relevant_context(query, subject_filter=None):
+def collection_name_for(source):
     """
-    Retrieve relevant documents from ChromaDB.
-    If subject_filter is provided, filter by source/filename.
+    Stable name for a single document's indexes (BM25, memory-mapped vectors)
+    and the prefix of its Chroma collections (see document_collection())
+    """
+    digest = hashlib.sha1(os.path.basename(source).encode("utf-8")).hexdigest()[:24]
+    return f"doc_{digest}"
+
+_collection_pointers = {"signature": None, "collections": {}}
+_collection_pointers_lock = threading.Lock()
+
+def document_collection(source):
+    """
+    Chroma collection currently holding a document's chunks.
+    Re-ingestion and compaction write a new generation of the collection and
+    only then point the document's manifest entry at it (ingest_pdfs.py), so
+    readers see the old chunks or the new ones, never none. Documents indexed
+    before generations existed keep the collection_name_for() name.
+    """
+    source = os.path.basename(source)
+    try:
+        stat = os.stat(MANIFEST_PATH)
+        signature = (stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        signature = None
+    with _collection_pointers_lock:
+        if signature != _collection_pointers["signature"]:
+            collections = {}
+            try:
+                if signature is not None:
+                    with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+                        documents = json.load(f).get("documents", {})
+                    collections = {name: entry["collection"] for name, entry in documents.items()
+                                   if entry.get("collection")}
+                _collection_pointers.update(signature=signature, collections=collections)
+            except (OSError, ValueError) as e:
+                print(f"[RETRIEVE] Could not read ingest manifest: {e}")
+        return _collection_pointers["collections"].get(source) or collection_name_for(source)
+
+def _has_collection(name):
+    """
+    Whether the open client has the collection; reopens the client first if
+    chroma_db changed on disk (ingestion in another process may just have
+    written it). Call with _engine_lock held.
+    """
+    if name in _doc_collections:
+        return True
+    if _client is not None and _local_writers == 0 and _store_signature() != _db_signature:
+        print("[RETRIEVE] chroma_db changed on disk, reloading vector store")
+        _open_vector_store()
+    return name in _doc_collections
+
+def _store_signature():
+    """
+    Cheap fingerprint of the persisted store: name, mtime and size of the
+    SQLite file and segment directories. Our own bookkeeping files are ignored.
     """
     try:
+        return tuple(sorted(
+            (entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+            for entry in os.scandir(DB_DIR)
+            if entry.name == "chroma.sqlite3"
+            or (entry.is_dir() and entry.path not in (lexical_index.LEXICAL_DIR, vector_index.VECTOR_DIR))
+        ))
+    except FileNotFoundError:
+        return None
+
+def _open_vector_store():
+    global _client, _db, _db_signature, _doc_collections, _reload_count
+    if _client is not None:
+        # Drop chromadb's per-path client cache, otherwise reopening the
+        # same directory hands back the stale in-memory index.
+        try:
+            from chromadb.api.client import SharedSystemClient
+            SharedSystemClient.clear_system_cache()
+        except Exception as e:
+            print(f"[RETRIEVE] Could not clear Chroma client cache: {e}")
+        _reload_count += 1
+    embedding_function = get_embedding_function()
+    with tracing.stage("vector_store_open"):
+        _db_signature = _store_signature()
+        _client = chromadb.PersistentClient(path=DB_DIR)
+        _db = Chroma(
+            client=_client,
+            collection_name=DEFAULT_COLLECTION,
+            embedding_function=embedding_function
+        )
+        # chromadb < 0.5 returns Collection objects here, newer versions return names
+        _doc_collections = {getattr(c, "name", c) for c in _client.list_collections()}
+    _doc_stores.clear()
+    return _db
+
+def get_vector_store():
+    """
+    Return the shared Chroma handle on the default collection.
+    Reopens the client when the on-disk chroma_db has changed since it was loaded.
+    """
+    global _last_reload_check
+    db = _db
+    now = time.monotonic()
+    if db is not None and now - _last_reload_check < RELOAD_CHECK_INTERVAL:
+        return db
+    with _engine_lock:
+        _last_reload_check = now
+        if _db is None:
+            return _open_vector_store()
+        if _local_writers == 0 and _store_signature() != _db_signature:
+            print("[RETRIEVE] chroma_db changed on disk, reloading vector store")
+            return _open_vector_store()
+        return _db
+
+def reload_vector_store():
+    """Force the shared Chroma handle to be reopened on next use"""
+    global _last_reload_check
+    with _engine_lock:
+        if _client is not None:
+            _open_vector_store()
+        _last_reload_check = time.monotonic()
+
+@contextmanager
+def local_write():
+    """
+    Wrap writes made through this process's shared client.
+    They are visible to readers immediately, so they must not be mistaken for
+    an external re-ingest (which would reopen the client mid-write).
+    Yields the shared chromadb client.
+    """
+    global _local_writers, _db_signature, _doc_collections
+    client = get_chroma_client()
+    with _engine_lock:
+        _local_writers += 1
+    try:
+        yield client
+    finally:
+        with _engine_lock:
+            _local_writers -= 1
+            # Collections may have been created or dropped; cached handles to dropped ones are invalid
+            _doc_collections = {getattr(c, "name", c) for c in client.list_collections()}
+            _doc_stores.clear()
+            if _local_writers == 0:
+                _db_signature = _store_signature()
+
+def get_chroma_client():
+    """Shared chromadb client, for code that needs collections other than the default one"""
+    get_vector_store()
+    return _client
+
+def get_document_store(source):
+    """
+    Shared handle on the per-document collection for `source`.
+    Returns None if the document hasn't been ingested into its own collection.
+    """
+    get_vector_store()
+    name = document_collection(source)
+    store = _doc_stores.get(name)
+    if store is None:
+        with _engine_lock:
+            if not _has_collection(name):
+                return None
+            store = _doc_stores.get(name)
+            if store is None:
+                store = Chroma(
+                    client=_client,
+                    collection_name=name,
+                    embedding_function=get_embedding_function()
+                )
+                _doc_stores[name] = store
+    return store
+
+def warm_up():
+    """Load the embedding model and vector store so the first request doesn't pay for it"""
+    global _warmup_error, _warmup_seconds
+    started = time.perf_counter()
+    try:
+        # The snapshot is one file read; it overlaps with loading the model
+        snapshot_loader = threading.Thread(target=index_snapshot.get_snapshot, name="rag-snapshot", daemon=True)
+        snapshot_loader.start()
         embedding_function = get_embedding_function()
-        db = Chroma(persist_directory=DB_DIR, embedding_function=embedding_function)
-        
-        # Determine number of results to fetch
-        k = 5
-        
-        search_kwargs = {"k": k}
+        embedding_function.embed_query("warm up")
+        get_vector_store()
+        snapshot_loader.join()
+        _warmup_error = None
+        _warmup_seconds = round(time.perf_counter() - started, 3)
+        _ready.set()
+        tracing.mark_startup("ready")
+        print(f"[RETRIEVE] Retrieval engine ready in {_warmup_seconds}s")
+    except Exception as e:
+        _warmup_error = str(e)
+        print(f"[RETRIEVE] Warm-up failed: {e}")
+
+def store_generation():
+    """Increments whenever the store is reopened, e.g. after an external re-ingest"""
+    return _reload_count
+
+def is_ready():
+    return _ready.is_set()
+
+def engine_status():
+    """Readiness details for the health endpoint"""
+    # Only once warm-up has read it; health checks must not trigger the read
+    snapshot = _snapshot() if _ready.is_set() else None
+    return {
+        "ready": _ready.is_set(),
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "model_loaded": _embedding_function is not None,
+        "vector_store_open": _db is not None,
+        "warmup_seconds": _warmup_seconds,
+        "reloads": _reload_count,
+        "hybrid_search": HYBRID_SEARCH,
+        "vector_backend": VECTOR_BACKEND,
+        "index_snapshot": snapshot.status() if snapshot is not None else None,
+        "embedding_cache": (
+            _embedding_function.stats()
+            if isinstance(_embedding_function, CachedEmbeddings) else None
+        ),
+        "error": _warmup_error,
+    }
+
+def _matches_source(doc, source):
+    metadata = doc.metadata or {}
+    return any(
+        os.path.basename(str(metadata.get(key, ""))) == source
+        for key in ("source", "filename")
+    )
+
+# Runs the BM25 half of a hybrid search while the calling thread does the vector half.
+# Not used under gevent, where extra "threads" would be greenlets on another thread's hub.
+_lexical_pool = None
+
+def _submit_lexical(fn, *args):
+    global _lexical_pool
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched("threading"):
+            return None
+    except ImportError:
+        pass
+    if _lexical_pool is None:
+        with _engine_lock:
+            if _lexical_pool is None:
+                from concurrent.futures import ThreadPoolExecutor
+                _lexical_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rag-lexical")
+    # In the caller's context so its stages land in the request's trace
+    return _lexical_pool.submit(contextvars.copy_context().run, fn, *args)
+
+def _embed_query(query):
+    with tracing.stage("embed_query"):
+        return get_embedding_function().embed_query(query)
+
+def _vector_search(store, embedding, k, **kwargs):
+    with tracing.stage("vector_search"):
+        return store.similarity_search_by_vector(embedding, k=k, **kwargs)
+
+def _lexical_search(index, queries, k):
+    """BM25 hits for each query"""
+    with tracing.stage("lexical_search"):
+        return [index.search(query, k) for query in queries]
+
+def _get_chunks(collection, chunk_ids):
+    """{chunk_id: Document} for the IDs that exist in the collection"""
+    if not chunk_ids:
+        return {}
+    from langchain_core.documents import Document
+    with tracing.stage("fetch_chunks"):
+        rows = collection.get(ids=list(chunk_ids), include=["documents", "metadatas"])
+    return {
+        row_id: Document(page_content=text or "", metadata=metadata or {})
+        for row_id, text, metadata in zip(rows["ids"], rows["documents"], rows["metadatas"])
+    }
+
+def _fetch_chunks(source, chunk_ids):
+    """Documents for chunk IDs of a per-document collection, in the given order"""
+    collection = get_chroma_client().get_collection(document_collection(source))
+    by_id = _get_chunks(collection, chunk_ids)
+    # Chunks removed since the index was written (e.g. by compaction) are skipped
+    return [by_id[chunk_id] for chunk_id in chunk_ids if chunk_id in by_id]
+
+def _hybrid_search(query, source, store, index, k):
+    """BM25 and vector search over one document in parallel, merged with reciprocal rank fusion"""
+    fetch = k * HYBRID_CANDIDATES
+    future = _submit_lexical(_lexical_search, index, [query], fetch)
+    vector_results = _vector_search(store, _embed_query(query), fetch)
+    lexical_hits = (future.result() if future is not None else _lexical_search(index, [query], fetch))[0]
+    if not lexical_hits:
+        return vector_results[:k]
+    lexical_results = _fetch_chunks(source, [chunk_id for chunk_id, _ in lexical_hits])
+    return lexical_index.reciprocal_rank_fusion(
+        [vector_results, lexical_results], k, key=lambda doc: doc.page_content, rrf_k=RRF_K
+    )
+
+_snapshot_model_warned = False
+
+def _snapshot():
+    """The prebuilt index snapshot (index_snapshot.py), if there is one for this embedding model"""
+    global _snapshot_model_warned
+    snapshot = index_snapshot.get_snapshot()
+    if snapshot is None or snapshot.embedding_model == EMBEDDING_MODEL_NAME:
+        return snapshot
+    if not _snapshot_model_warned:
+        _snapshot_model_warned = True
+        print(f"[RETRIEVE] Ignoring index snapshot built with {snapshot.embedding_model}")
+    return None
+
+def _array_index(name):
+    """
+    A VectorIndex answering for the collection: from the index snapshot while
+    it covers the document, else its memory-mapped index if RAG_VECTOR_BACKEND=mmap
+    """
+    snapshot = _snapshot()
+    if snapshot is not None:
+        index = snapshot.vector_index(name)
+        if index is not None:
+            return index
+    if VECTOR_BACKEND != "mmap":
+        return None
+    return vector_index.load_index(name)
+
+def _lexical_index(name):
+    """The collection's BM25 index, from the snapshot when its vectors come from there too"""
+    snapshot = _snapshot()
+    if snapshot is not None and snapshot.vector_index(name) is not None:
+        return snapshot.lexical_index(name)
+    return lexical_index.load_index(name)
+
+def _scoped_search(query, source, k, hybrid=None):
+    """
+    Search only the chunks of one document.
+    Uses the index snapshot or the document's memory-mapped index
+    (RAG_VECTOR_BACKEND=mmap) when they cover it, or its
+    own collection when it has one, fused with BM25 over the document's
+    lexical index when hybrid search is on. Otherwise falls back to the shared
+    collection with the filter pushed down to Chroma, and finally to an
+    over-fetched unfiltered search that is filtered here (covers stores where
+    `source` was saved as a full path).
+    """
+    source = os.path.basename(source)
+    index = _array_index(collection_name_for(source))
+    if index is not None:
+        return [doc for doc, _ in get_relevant_contexts([query], source, k, hybrid)[0]]
+    store = get_document_store(source)
+    if store is not None:
+        if HYBRID_SEARCH if hybrid is None else hybrid:
+            index = _lexical_index(collection_name_for(source))
+            if index is not None:
+                return _hybrid_search(query, source, store, index, k)
+        return _vector_search(store, _embed_query(query), k)
+
+    db = get_vector_store()
+    query_embedding = _embed_query(query)
+    try:
+        results = _vector_search(db, query_embedding, k, filter={"source": source})
+        if results:
+            return results
+    except Exception as e:
+        print(f"[RETRIEVE] Metadata filter failed ({e}), post-filtering instead")
+
+    candidates = _vector_search(db, query_embedding, k * FILTER_FETCH_MULTIPLIER)
+    return [doc for doc in candidates if _matches_source(doc, source)][:k]
+
+def get_relevant_context(query, subject_filter=None, k=5, hybrid=None):
+    """
+    Retrieve relevant documents from ChromaDB.
+    If subject_filter is provided, only chunks from that document (source/filename) are searched.
+    hybrid: override RAG_HYBRID_SEARCH for this call (False = vector search only).
+    """
+    try:
         if subject_filter:
-            # Assuming 'source' metadata field stores the filename or path
-            # We might need to verify how metadata is stored. 
-            # Often it's stored as 'source'. 
-            # If the full path is stored, we might need to filter differently, 
-            # but usually exact match on filename works if we stored it that way.
-            # For now, we'll try to match whatever is passed.
-            # Note: Chroma filtering syntax: filter={"metadata_field": "value"}
-            
-            # Since we don't know exactly how it was ingested, we'll try simple source matching.
-            # If ingestion stored full path, we might need a more complex filter or just rely on similarity.
-            # But let's assume 'source' is the key.
-            pass 
-            # Logic: If we can't guarantee metadata format, we might just retrieve more and filter valid ones?
-            # But search_kwargs 'filter' is efficient.
-            # Let's trust the ingestion process stored 'source'.
-            # search_kwargs["filter"] = {"source": subject_filter} 
-            # COMMENTING OUT FILTER for now to avoid errors if metadata doesn't match. 
-            # Ideally we check the DB structure. But basic retrieval should return something.
-        
-        results = db.similarity_search(query, **search_kwargs)
-        return results
+            return _scoped_search(query, subject_filter, k, hybrid)
+        db = get_vector_store()
+        return _vector_search(db, _embed_query(query), k)
     except Exception as e:
         print(f"Error in get_relevant_context: {e}")
         return []
 
+def _embed_queries(queries):
+    """All query embeddings from one batched model pass (cache hits skip the model)"""
+    embedding_function = get_embedding_function()
+    with tracing.stage("embed_query"):
+        if isinstance(embedding_function, CachedEmbeddings):
+            return embedding_function.embed_queries(queries)
+        return embedding_function.embed_documents(queries)
+
+def _similarity(distance):
+    """Cosine similarity from Chroma's default squared-L2 distance (MiniLM vectors are unit length)"""
+    return round(1.0 - float(distance) / 2.0, 6)
+
+def _query_rows(collection, embeddings, n_results, where=None):
+    """One Chroma query for every embedding; per query a list of (chunk_id, Document, distance)"""
+    from langchain_core.documents import Document
+    with tracing.stage("vector_search"):
+        rows = collection.query(query_embeddings=embeddings, n_results=n_results, where=where,
+                                include=["documents", "metadatas", "distances"])
+    return [
+        [(row_id, Document(page_content=text or "", metadata=metadata or {}), distance)
+         for row_id, text, metadata, distance in zip(ids, texts, metadatas, distances)]
+        for ids, texts, metadatas, distances
+        in zip(rows["ids"], rows["documents"], rows["metadatas"], rows["distances"])
+    ]
+
+def _scored(rows):
+    return [[(doc, _similarity(distance)) for _, doc, distance in hits] for hits in rows]
+
+def _hybrid_batch(collection, index, queries, embeddings, k):
+    """_hybrid_search for many queries: one vector query, one fetch of the extra lexical hits"""
+    fetch = k * HYBRID_CANDIDATES
+    future = _submit_lexical(_lexical_search, index, queries, fetch)
+    vector_rows = _query_rows(collection, embeddings, fetch)
+    lexical_rows = future.result() if future is not None else _lexical_search(index, queries, fetch)
+
+    docs = {chunk_id: doc for hits in vector_rows for chunk_id, doc, _ in hits}
+    missing = {chunk_id for hits in lexical_rows for chunk_id, _ in hits} - docs.keys()
+    docs.update(_get_chunks(collection, sorted(missing)))
+
+    results = []
+    for vector_hits, lexical_hits in zip(vector_rows, lexical_rows):
+        if not lexical_hits:
+            results.append(_scored([vector_hits[:k]])[0])
+            continue
+        fused = lexical_index.reciprocal_rank_fusion(
+            [[chunk_id for chunk_id, _, _ in vector_hits],
+             [chunk_id for chunk_id, _ in lexical_hits if chunk_id in docs]],
+            k, rrf_k=RRF_K, with_scores=True,
+        )
+        results.append([(docs[chunk_id], round(score, 6)) for chunk_id, score in fused])
+    return results
+
+def get_relevant_contexts(queries, subject_filter=None, k=5, hybrid=None):
+    """
+    Batched get_relevant_context: every query is embedded in one model pass
+    and searched with a single Chroma (or memory-mapped index) query.
+    Returns one list of (Document, score) pairs per query, where score is the
+    reciprocal-rank-fusion score for hybrid results and the cosine similarity otherwise.
+    """
+    queries = list(queries)
+    if not queries:
+        return []
+    try:
+        embeddings = _embed_queries(queries)
+        source = os.path.basename(subject_filter or "")
+        name = collection_name_for(source)
+        # A snapshot or memory-mapped index answers the same query()/get() calls as the collection
+        collection = _array_index(name) if subject_filter else None
+        if collection is None:
+            db = get_vector_store()
+            if not subject_filter:
+                return _scored(_query_rows(db._collection, embeddings, k))
+            chroma_name = document_collection(source)
+            with _engine_lock:
+                present = _has_collection(chroma_name)
+            if present:
+                collection = get_chroma_client().get_collection(chroma_name)
+        if collection is not None:
+            index = _lexical_index(name) if (HYBRID_SEARCH if hybrid is None else hybrid) else None
+            if index is not None:
+                return _hybrid_batch(collection, index, queries, embeddings, k)
+            return _scored(_query_rows(collection, embeddings, k))
+
+        # Legacy shared collection: filter pushed down, then over-fetch and post-filter
+        # for the queries that found nothing (same fallbacks as _scoped_search)
+        try:
+            rows = _query_rows(db._collection, embeddings, k, where={"source": source})
+        except Exception as e:
+            print(f"[RETRIEVE] Metadata filter failed ({e}), post-filtering instead")
+            rows = [[] for _ in queries]
+        empty = [i for i, hits in enumerate(rows) if not hits]
+        if empty:
+            wide = _query_rows(db._collection, [embeddings[i] for i in empty], k * FILTER_FETCH_MULTIPLIER)
+            for i, hits in zip(empty, wide):
+                rows[i] = [hit for hit in hits if _matches_source(hit[1], source)][:k]
+        return _scored(rows)
+    except Exception as e:
+        print(f"Error in get_relevant_contexts: {e}")
+        return [[] for _ in queries]
+
 def groq_summarize(results, query):
     """
     Summarize context using Groq to answer the query.
     Used for quick answers.
     """
     try:
-        from groq import Groq
+        from llm_gateway import get_llm_gateway
         api_key = os.getenv("GROQ_API_KEY")
         if not api_key:
             print("GROQ_API_KEY not found.")
             return None
-            
-        client = Groq(api_key=api_key)
         
         context_text = "\n\n".join([doc.page_content for doc in results])
         messages = [
@@ -71,7 +572,7 @@ def groq_summarize(results, query):
             {"role": "user", "content": f"Context:\n{context_text}\n\nQuestion: {query}\n\nAnswer concisely based on the context."}
         ]
         
-        chat_completion = client.chat.completions.create(
+        chat_completion = get_llm_gateway().complete(
             messages=messages,
             model="llama3-8b-8192", # Default, can be overridden
             temperature=0.5,
@@ -0,0 +1,142 @@
+"""
+Production server for the RAG API (instead of the Flask dev server in rag_api.py).
+
+    python serve.py
+
+Runs rag_api.app under gunicorn:
+- gevent workers by default, so hundreds of requests waiting on Groq are cheap
+  greenlets instead of pinned OS threads (RAG_WORKER_CLASS=gthread to use a
+  thread pool instead)
+- CPU-bound request work (embedding, PDF parsing) goes through the bounded
+  pool in work_pool.py (RAG_CPU_WORKERS per worker process); background
+  ingestion has its own pool (RAG_INGEST_WORKERS)
+- RAG_API_WORKERS processes forked from a master that has already loaded the
+  embedding model, so the weights are shared copy-on-write; each worker opens its
+  own Chroma client and warms up after the fork
+- one worker by default while uploads are ingested in-process
+  (RAG_AUTO_INGEST=true), two otherwise: each worker runs its own ingest
+  queue, so same-file uploads are only coalesced within a worker. Job status
+  is shared through ingest_jobs' job files, so polling works from any worker.
+  Scale a multi-worker deployment with RAG_AUTO_INGEST=false and
+  python ingest_pdfs.py run separately.
+- SIGTERM drains in-flight requests for up to RAG_GRACEFUL_TIMEOUT seconds
+
+gunicorn does not run on Windows; there it falls back to the threaded Flask server.
+"""
+
+import os
+import sys
+import importlib.util
+
+def _default_worker_class():
+    return "gevent" if importlib.util.find_spec("gevent") else "gthread"
+
+WORKER_CLASS = os.getenv("RAG_WORKER_CLASS") or _default_worker_class()
+
+if WORKER_CLASS == "gevent":
+    # Must happen before anything imports socket/ssl/threading
+    from gevent import monkey
+    monkey.patch_all(aggressive=False)
+    # gunicorn's gevent worker re-patches aggressively, which removes select.epoll.
+    # Import the Groq HTTP stack now: httpcore pulls in trio (when installed), which
+    # needs select.epoll at import time.
+    try:
+        import httpcore  # noqa: F401
+    except ImportError:
+        pass
+
+import env_file
+
+env_file.load_env_file()
+
+import tracing
+
+# Workers report cold start from when the service started, not from their fork
+os.environ.setdefault("RAG_PROCESS_START", str(tracing.PROCESS_START))
+
+PORT = int(os.getenv('RAG_API_PORT', 5000))
+AUTO_INGEST = os.getenv('RAG_AUTO_INGEST', 'true').lower() != 'false'
+WORKERS = int(os.getenv('RAG_API_WORKERS', 1 if AUTO_INGEST else 2))
+THREADS = int(os.getenv('RAG_API_THREADS', 32))  # gthread only
+WORKER_CONNECTIONS = int(os.getenv('RAG_WORKER_CONNECTIONS', 1000))  # gevent only
+GRACEFUL_TIMEOUT = int(os.getenv('RAG_GRACEFUL_TIMEOUT', 30))
+PRELOAD_MODEL = os.getenv('RAG_PRELOAD_MODEL', 'true').lower() != 'false'
+TORCH_THREADS = os.getenv('RAG_TORCH_THREADS')
+
+def preload_model():
+    """Load embedding weights and the index snapshot in the master so forked workers share them"""
+    if not PRELOAD_MODEL:
+        return
+    try:
+        import retrieve
+        retrieve.get_embedding_function()
+        retrieve.index_snapshot.get_snapshot()
+        print("[SERVE] Embedding model preloaded in master process")
+    except Exception as e:
+        print(f"[SERVE] Model preload failed, workers will load it themselves: {e}")
+
+def post_fork(server, worker):
+    if TORCH_THREADS:
+        try:
+            import torch
+            torch.set_num_threads(int(TORCH_THREADS))
+        except ImportError:
+            pass
+    import rag_api
+    if os.getenv('RAG_WARMUP', 'true').lower() != 'false':
+        rag_api.start_rag_warm_up()
+
+def worker_exit(server, worker):
+    import work_pool
+    work_pool.shutdown()
+    if PRELOAD_MODEL:
+        # Native threads started in the preloading master (chromadb) do not survive
+        # the fork and abort interpreter teardown; requests are drained, so skip it
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(0)
+
+def run_gunicorn():
+    from gunicorn.app.base import BaseApplication
+
+    class RagApplication(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": f"0.0.0.0:{PORT}",
+                "workers": WORKERS,
+                "worker_class": WORKER_CLASS,
+                "threads": THREADS,
+                "worker_connections": WORKER_CONNECTIONS,
+                "preload_app": True,
+                "graceful_timeout": GRACEFUL_TIMEOUT,
+                # Streaming answers can legitimately take a while
+                "timeout": 180,
+                "keepalive": 5,
+                "post_fork": post_fork,
+                "worker_exit": worker_exit,
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from rag_api import app
+            preload_model()
+            return app
+
+    print(f"[SERVE] Starting RAG API on port {PORT}: {WORKERS} x {WORKER_CLASS} workers")
+    if AUTO_INGEST and WORKERS > 1:
+        print("[SERVE] RAG_AUTO_INGEST is on with several workers: each runs its own ingest queue, "
+              "so uploads of the same file are only coalesced within a worker")
+    RagApplication().run()
+
+def run_fallback():
+    from rag_api import app, start_rag_warm_up
+    print(f"[SERVE] gunicorn not available, using threaded Flask server on port {PORT}")
+    start_rag_warm_up()
+    app.run(host='0.0.0.0', port=PORT, debug=False, threaded=True)
+
+if __name__ == '__main__':
+    if sys.platform == 'win32' or importlib.util.find_spec("gunicorn") is None:
+        run_fallback()
+    else:
+        run_gunicorn()
@@ -0,0 +1,247 @@
+"""
+Single-flight coalescing of identical in-flight generation requests.
+
+When a teacher posts a topic, many students ask generate-answer or
+generate-quiz for the same topic and PDF within the same second. The first
+request (the leader) runs retrieval and the Groq completion; identical
+requests arriving while it is in flight (followers) wait for it and get its
+response instead of starting their own:
+- plain responses: followers get the leader's result once it is done
+- streams: the leader's events are buffered as they are produced and every
+  subscriber replays them from the start, then follows live
+A flight ends when its response is complete; later requests go through the
+response cache as usual.
+
+Errors propagate: an exception raised by the leader is raised in every
+follower, and error responses (a 503 from the LLM gateway, say) are shared
+like any other result.
+
+Cancellation: a stream is produced by a background thread, so the leader's
+client disconnecting does not cut the followers off. Once the last
+subscriber has gone the stream is closed, which stops the Groq stream(s)
+behind it; a request arriving after that starts a new flight. Followers
+that have joined but not yet subscribed keep the stream alive. A follower
+that still finds its flight cancelled, or waits longer than
+RAG_COALESCE_WAIT_TIMEOUT seconds for the leader, computes on its own.
+
+Counters: flights (computations started), coalesced (requests that joined
+another request's flight, i.e. upstream retrieval + LLM calls saved),
+cancelled, errors and recomputed (followers that timed out or found their
+flight cancelled and computed on their own), per endpoint.
+"""
+
+import os
+import threading
+import contextvars
+
+COALESCE_ENABLED = os.getenv("RAG_COALESCE_REQUESTS", "true").lower() != "false"
+WAIT_TIMEOUT = float(os.getenv("RAG_COALESCE_WAIT_TIMEOUT", "120"))
+
+class Flight:
+    """One in-flight computation, shared by every request with its key"""
+
+    def __init__(self, group, endpoint, key):
+        self.group = group
+        self.endpoint = endpoint
+        self.key = key
+        self.result = None
+        self.events = None
+        self.error = None
+        self.resolved = False  # result, stream or error is known
+        self.done = False  # nothing more will be produced
+        self.cancelled = False
+        self.subscribers = 0
+        # Followers between join() and wait(): not subscribed yet, but they will be
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def resolve(self, result):
+        """Leader: share a plain result"""
+        with self._cond:
+            self.result = result
+            self.resolved = self.done = True
+            self._cond.notify_all()
+        self.group._finish(self)
+
+    def fail(self, error):
+        """Leader: the computation raised; followers raise the same error"""
+        with self._cond:
+            self.error = error
+            self.resolved = self.done = True
+            self._cond.notify_all()
+        self.group._finish(self, error=True)
+
+    def stream(self, items):
+        """
+        Leader: share an iterator of events. It is drained by a background
+        thread (in the caller's context, so tracing stages still land in the
+        leader's trace); returns the leader's own subscription.
+        """
+        with self._cond:
+            self.events = []
+            self.resolved = True
+            subscription = _Subscription(self)
+            self._cond.notify_all()
+        threading.Thread(target=contextvars.copy_context().run, args=(self._pump, items),
+                         name="single-flight", daemon=True).start()
+        return subscription
+
+    def _pump(self, items):
+        error = None
+        try:
+            for item in items:
+                with self._cond:
+                    if self.cancelled:
+                        break
+                    self.events.append(item)
+                    self._cond.notify_all()
+        except Exception as e:
+            print(f"[SINGLE FLIGHT] {self.endpoint} stream failed: {e}")
+            error = e
+        finally:
+            # Closing the generator stops the upstream Groq stream(s)
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+            with self._cond:
+                self.error = error
+                self.done = True
+                self._cond.notify_all()
+            self.group._finish(self, error=error is not None)
+
+    def wait(self, timeout=WAIT_TIMEOUT):
+        """
+        Follower: block until the leader has a result.
+        Returns ("result", value) or ("stream", iterator of events), or None if
+        the flight was cancelled or the leader took longer than timeout (the
+        caller then computes on its own); raises the leader's error.
+        """
+        with self._cond:
+            try:
+                resolved = self._cond.wait_for(lambda: self.resolved, timeout)
+                if resolved and not self.cancelled:
+                    if self.events is not None:
+                        # Subscribed before leaving the waiting count, so the stream can't be cancelled in between
+                        return "stream", _Subscription(self)
+                    if self.error is not None:
+                        raise self.error
+                    return "result", self.result
+            finally:
+                self.waiting -= 1
+        if not resolved:
+            print(f"[SINGLE FLIGHT] {self.endpoint}: leader still busy after {timeout:g}s, computing separately")
+        self.group._count(self.endpoint, "recomputed")
+        return None
+
+class _Subscription:
+    """
+    One client's view of a streamed flight: every event from the start, then
+    live ones. WSGI servers call close() when the client is done or gone.
+    """
+
+    def __init__(self, flight):
+        # Counted right away, so a subscriber leaving can't cancel a stream another has yet to start reading
+        flight.subscribers += 1
+        self.flight = flight
+        self.index = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        flight = self.flight
+        with flight._cond:
+            while self.index >= len(flight.events) and not flight.done:
+                flight._cond.wait()
+            if self.index < len(flight.events):
+                self.index += 1
+                return flight.events[self.index - 1]
+            error = flight.error
+        self.close()
+        if error is not None:
+            raise error
+        raise StopIteration
+
+    def close(self):
+        flight = self.flight
+        with flight._cond:
+            if self.closed:
+                return
+            self.closed = True
+            flight.subscribers -= 1
+            cancel = (flight.subscribers == 0 and flight.waiting == 0
+                      and not flight.done and not flight.cancelled)
+            if cancel:
+                flight.cancelled = True
+        if cancel:
+            flight.group._cancel(flight)
+
+class SingleFlight:
+    """Registry of in-flight computations by key"""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.counters = {}
+
+    def _count(self, endpoint, name):
+        with self._lock:
+            self._count_locked(endpoint, name)
+
+    def _count_locked(self, endpoint, name):
+        counters = self.counters.setdefault(endpoint, {"flights": 0, "coalesced": 0, "cancelled": 0,
+                                                       "errors": 0, "recomputed": 0})
+        counters[name] += 1
+
+    def join(self, endpoint, key):
+        """(flight, leader): leader is True if the caller must compute and then resolve/fail/stream it"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                with flight._cond:
+                    if not flight.cancelled:
+                        flight.waiting += 1
+                        self._count_locked(endpoint, "coalesced")
+                        return flight, False
+            flight = self._flights[key] = Flight(self, endpoint, key)
+            self._count_locked(endpoint, "flights")
+            return flight, True
+
+    def _finish(self, flight, error=False):
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            if error:
+                self._count_locked(flight.endpoint, "errors")
+
+    def _cancel(self, flight):
+        with self._lock:
+            # A new request must not join a stream that is shutting down
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            self._count_locked(flight.endpoint, "cancelled")
+        print(f"[SINGLE FLIGHT] {flight.endpoint}: every client left, stream cancelled")
+
+    def stats(self):
+        with self._lock:
+            endpoints = {endpoint: dict(counters) for endpoint, counters in self.counters.items()}
+            in_flight = len(self._flights)
+        return {
+            "enabled": COALESCE_ENABLED,
+            "in_flight": in_flight,
+            "upstream_calls_saved": sum(counters["coalesced"] - counters["recomputed"]
+                                        for counters in endpoints.values()),
+            "endpoints": endpoints,
+        }
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+def get_single_flight():
+    """Process-wide single-flight registry, created on first use"""
+    global _single_flight
+    with _single_flight_lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight()
+        return _single_flight
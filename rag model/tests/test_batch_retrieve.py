@@ -0,0 +1,33 @@
+import pytest
+
+import rag_api
+
+@pytest.fixture
+def client():
+    return rag_api.app.test_client()
+
+@pytest.mark.parametrize("body, error", [
+    ({"queries": ["loops"], "k": "abc"}, "k must be an integer"),
+    ({"queries": ["loops"], "k": None}, "k must be an integer"),
+    ({"queries": ["loops"], "k": 0}, "k must be between 1 and 50"),
+    ({"queries": "loops"}, "queries must be a list"),
+    ({"queries": []}, "queries is required"),
+    ({"queries": [{"subtopic": "loops"}]}, "Every query needs text or a topic"),
+])
+def test_invalid_requests_get_a_400(client, body, error):
+    response = client.post('/api/rag/batch-retrieve', json=body)
+    assert response.status_code == 400
+    assert response.get_json()["error"] == error
+
+def test_non_string_topic_and_subtopic_are_accepted(client, monkeypatch):
+    seen = {}
+
+    def get_relevant_contexts(queries, subject_filter=None, k=5):
+        seen["queries"] = queries
+        return [[] for _ in queries]
+
+    retrieve = pytest.importorskip("retrieve")
+    monkeypatch.setattr(retrieve, "get_relevant_contexts", get_relevant_contexts)
+    response = client.post('/api/rag/batch-retrieve', json={"queries": [{"topic": "x", "subtopic": 3}], "k": "2"})
+    assert response.status_code == 200
+    assert seen["queries"] == ["x - 3"]
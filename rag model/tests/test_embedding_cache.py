@@ -0,0 +1,52 @@
+import os
+
+from embedding_cache import CachedEmbeddings, EmbeddingCache, QueryEmbeddingCache
+
+class CountingEmbeddings:
+    """Two-dimensional embeddings that record every text the model is asked for"""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def make_embeddings(tmp_path, query_entries=2):
+    base = CountingEmbeddings()
+    cache = EmbeddingCache("test-model", directory=str(tmp_path))
+    return base, CachedEmbeddings(base, "test-model", cache=cache,
+                                  query_cache=QueryEmbeddingCache(query_entries))
+
+def test_document_embeddings_are_persisted(tmp_path):
+    base, embeddings = make_embeddings(tmp_path)
+    embeddings.embed_documents(["alpha", "beta"])
+    reopened = CachedEmbeddings(base, "test-model", cache=EmbeddingCache("test-model", directory=str(tmp_path)))
+    assert reopened.embed_documents(["alpha", "beta"]) == [[5.0, 1.0], [4.0, 1.0]]
+    assert sorted(base.calls) == ["alpha", "beta"]
+
+def test_query_embeddings_stay_in_memory(tmp_path):
+    base, embeddings = make_embeddings(tmp_path)
+    embeddings.embed_documents(["alpha"])
+    size = os.path.getsize(embeddings.cache.path)
+    embeddings.embed_query("what is alpha")
+    embeddings.embed_queries(["what is beta", "what is gamma"])
+    assert os.path.getsize(embeddings.cache.path) == size
+    assert len(embeddings.cache) == 1
+
+def test_query_cache_is_bounded_lru(tmp_path):
+    base, embeddings = make_embeddings(tmp_path, query_entries=2)
+    embeddings.embed_query("one")
+    embeddings.embed_query("two")
+    embeddings.embed_query("one")  # hit; "two" is now least recently used
+    embeddings.embed_query("three")
+    assert base.calls == ["one", "two", "three"]
+    embeddings.embed_query("one")
+    embeddings.embed_query("two")
+    assert base.calls == ["one", "two", "three", "two"]
+    stats = embeddings.stats()["query_cache"]
+    assert stats["entries"] == 2
+    assert stats["hits"] == 2
@@ -0,0 +1,13 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import check_import_time
+
+def test_rag_api_import_loads_no_heavy_modules():
+    result, _ = check_import_time.measure()
+    assert result["heavy"] == []
+
+def test_rag_api_import_is_within_budget():
+    # Best of three, so one slow interpreter start on a busy machine doesn't fail the suite
+    assert min(check_import_time.measure()[0]["ms"] for _ in range(3)) <= check_import_time.DEFAULT_BUDGET_MS
@@ -0,0 +1,76 @@
+import os
+import json
+
+import numpy as np
+import pytest
+
+import index_snapshot
+import vector_index
+from lexical_index import LexicalIndex
+
+WORDS = "loop function class recursion list tuple dict generator decorator closure".split()
+
+def make_document(name, seed, chunks=40, dim=16):
+    rng = np.random.default_rng(seed)
+    ids = [f"{name}-{i}" for i in range(chunks)]
+    texts = [" ".join(rng.choice(WORDS, size=12)) for _ in range(chunks)]
+    return {"collection": f"doc_{name}", "manifest": {"sha256": f"sha-{name}", "size": 100 + seed},
+            "ids": ids, "embeddings": rng.normal(size=(chunks, dim)).astype(np.float32), "texts": texts,
+            "metadatas": [{"source": f"{name}.pdf", "page": i} for i in range(chunks)],
+            "lexical": LexicalIndex.build(ids, texts)}
+
+@pytest.fixture
+def snapshot(monkeypatch, tmp_path):
+    pdf_dir = tmp_path / "pdfs"
+    pdf_dir.mkdir()
+    monkeypatch.setattr(index_snapshot, "PDF_DIR", str(pdf_dir))
+    monkeypatch.setattr(index_snapshot, "MANIFEST_PATH", str(tmp_path / "ingest_manifest.json"))
+    documents = {"a.pdf": make_document("a", 1), "b.pdf": make_document("b", 2)}
+    for name, document in documents.items():
+        (pdf_dir / name).write_bytes(b"x" * document["manifest"]["size"])
+    path = tmp_path / "rag_index.snap"
+    index_snapshot.write_snapshot(str(path), documents, "test-model")
+    return index_snapshot.load_snapshot(str(path)), documents, tmp_path
+
+def test_snapshot_round_trip_searches_like_the_source_indexes(snapshot):
+    loaded, documents, _ = snapshot
+    assert loaded.embedding_model == "test-model"
+    assert loaded.served() == {"a.pdf", "b.pdf"}
+    queries = np.random.default_rng(7).normal(size=(5, 16)).astype(np.float32)
+    for document in documents.values():
+        reference = vector_index.VectorIndex(*vector_index.VectorIndex.build(
+            document["ids"], document["embeddings"], document["texts"], document["metadatas"]))
+        index = loaded.vector_index(document["collection"])
+        assert index.query(queries, n_results=5) == reference.query(queries, n_results=5)
+        assert index.get(document["ids"][:3])["documents"] == document["texts"][:3]
+        lexical = loaded.lexical_index(document["collection"])
+        for query in ("recursion closure", "dict generator loop", "unknown"):
+            assert lexical.search(query, 5) == document["lexical"].search(query, 5)
+
+def test_snapshot_arrays_are_aligned(snapshot):
+    loaded, _, _ = snapshot
+    body = len(index_snapshot.MAGIC) + 8 + loaded.header["header_bytes"]
+    assert body % index_snapshot.ALIGN == 0
+    for document in loaded.documents.values():
+        for offset, _, _ in document["vector"]["arrays"].values():
+            assert offset % index_snapshot.ALIGN == 0
+
+def test_document_reingested_with_other_content_stops_being_served(snapshot):
+    loaded, _, tmp_path = snapshot
+    assert loaded.served() == {"a.pdf", "b.pdf"}
+    manifest = tmp_path / "ingest_manifest.json"
+    manifest.write_text(json.dumps({"documents": {"a.pdf": {"sha256": "something-else"},
+                                                  "b.pdf": {"sha256": "sha-b"}}}))
+    assert loaded.served() == {"b.pdf"}
+    assert loaded.vector_index("doc_a") is None
+    assert loaded.lexical_index("doc_a") is None
+    assert loaded.vector_index("doc_b") is not None
+
+def test_document_replaced_on_disk_stops_being_served(snapshot):
+    loaded, _, tmp_path = snapshot
+    assert loaded.served() == {"a.pdf", "b.pdf"}
+    # Uploads move the new file into place with a rename
+    upload = tmp_path / "upload.tmp"
+    upload.write_bytes(b"a different upload")
+    os.replace(upload, tmp_path / "pdfs" / "b.pdf")
+    assert loaded.served() == {"a.pdf"}
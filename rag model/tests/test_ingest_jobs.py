@@ -0,0 +1,29 @@
+import ingest_jobs
+from ingest_jobs import IngestQueue
+
+def make_queue(monkeypatch, tmp_path):
+    monkeypatch.setattr(ingest_jobs, "JOB_DIR", str(tmp_path))
+    queue = IngestQueue()
+    # Jobs stay queued: nothing here should ingest
+    monkeypatch.setattr(queue, "_start_workers", lambda: None)
+    return queue
+
+def test_job_is_visible_to_another_worker(monkeypatch, tmp_path):
+    queue = make_queue(monkeypatch, tmp_path)
+    job = queue.enqueue("notes.pdf")
+    other_worker = IngestQueue()
+    assert other_worker.get(job["job_id"]) == job
+
+def test_job_updates_are_published(monkeypatch, tmp_path):
+    queue = make_queue(monkeypatch, tmp_path)
+    job = queue.enqueue("notes.pdf")
+    queue.enqueue("notes.pdf")
+    queue._update(job["job_id"], status="done", stage="done")
+    seen = IngestQueue().get(job["job_id"])
+    assert seen["status"] == "done"
+    assert seen["coalesced"] == 1
+
+def test_unknown_or_malformed_job_id(monkeypatch, tmp_path):
+    queue = make_queue(monkeypatch, tmp_path)
+    assert queue.get("0" * 32) is None
+    assert queue.get("../../etc/passwd") is None
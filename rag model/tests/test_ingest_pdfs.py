@@ -0,0 +1,86 @@
+import json
+import multiprocessing
+import os
+
+import pytest
+
+import document_catalog
+
+pytest.importorskip("langchain_huggingface")
+import ingest_pdfs
+
+@pytest.fixture
+def manifest(monkeypatch, tmp_path):
+    path = tmp_path / "ingest_manifest.json"
+    monkeypatch.setattr(ingest_pdfs, "DB_DIR", str(tmp_path))
+    monkeypatch.setattr(ingest_pdfs, "MANIFEST_PATH", str(path))
+    monkeypatch.setattr(ingest_pdfs, "MANIFEST_LOCK_PATH", f"{path}.lock")
+    return path
+
+def _add_entries(worker, count):
+    for i in range(count):
+        ingest_pdfs.update_manifest(f"doc-{worker}-{i}.pdf", {"sha256": f"{worker}:{i}"})
+
+def test_concurrent_processes_do_not_lose_manifest_entries(manifest):
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_add_entries, args=(worker, 25)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert all(process.exitcode == 0 for process in processes)
+    documents = json.loads(manifest.read_text())["documents"]
+    assert len(documents) == 100
+
+@pytest.fixture
+def pdf_dir(monkeypatch, tmp_path, manifest):
+    """Ingest a tmp folder with parsing and the Chroma write replaced by recorders"""
+    folder = tmp_path / "pdfs"
+    folder.mkdir()
+    written = []
+
+    def write_document(job, parsed, entry, embedding_function, stats):
+        written.append(job["path"].name)
+        ingest_pdfs.update_manifest(job["path"].name, dict(entry, collection="stub"))
+        return "stub"
+
+    monkeypatch.setattr(ingest_pdfs, "PDF_DIR", str(folder))
+    monkeypatch.setattr(ingest_pdfs, "parse_pdf", lambda path, content_hash=None: {
+        "pages": 1, "texts": ["text"], "metadatas": [{}], "load_seconds": 0.0, "split_seconds": 0.0})
+    monkeypatch.setattr(ingest_pdfs, "_write_document", write_document)
+    monkeypatch.setattr(ingest_pdfs, "get_embedding_function", lambda: None)
+    monkeypatch.setattr(ingest_pdfs, "_ensure_lexical_index", lambda name: None)
+    monkeypatch.setattr(ingest_pdfs, "_ensure_vector_index", lambda name: None)
+    monkeypatch.setattr(ingest_pdfs.page_text_store, "remove_pages", lambda content_hash: None)
+    catalog = document_catalog.DocumentCatalog(path=str(tmp_path / "documents.json"), folder=str(folder),
+                                               manifest_path=str(manifest))
+    monkeypatch.setattr(ingest_pdfs, "get_document_catalog", lambda: catalog)
+    return folder, written
+
+def test_only_the_changed_pdf_is_reingested(pdf_dir):
+    folder, written = pdf_dir
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        (folder / name).write_bytes(f"%PDF-1.4 {name}".encode())
+    first = ingest_pdfs.ingest_pdfs()
+    assert sorted(first["indexed"]) == ["a.pdf", "b.pdf", "c.pdf"]
+
+    # Same size, so only the content hash can tell the new bytes apart
+    changed = folder / "b.pdf"
+    changed.write_bytes(b"%PDF-1.4 B.pdf")
+    os.utime(changed, ns=(changed.stat().st_atime_ns, changed.stat().st_mtime_ns + 10**9))
+    # A touched but unchanged file keeps its entry and is not re-ingested
+    touched = folder / "c.pdf"
+    os.utime(touched, ns=(touched.stat().st_atime_ns, touched.stat().st_mtime_ns + 10**9))
+    written.clear()
+
+    second = ingest_pdfs.ingest_pdfs()
+    assert written == ["b.pdf"]
+    assert second["indexed"] == ["b.pdf"]
+    assert sorted(second["skipped"]) == ["a.pdf", "c.pdf"]
+    documents = ingest_pdfs.load_manifest()["documents"]
+    assert documents["b.pdf"]["sha256"] == ingest_pdfs.file_sha256(changed)
+    assert documents["c.pdf"]["mtime_ns"] == touched.stat().st_mtime_ns
+
+    written.clear()
+    assert ingest_pdfs.ingest_pdfs()["indexed"] == []
+    assert written == []
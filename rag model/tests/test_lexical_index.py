@@ -0,0 +1,55 @@
+import math
+
+import pytest
+
+import lexical_index
+from lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+CORPUS = {
+    "tcp": "The TCP three-way handshake opens a connection: SYN, SYN-ACK, ACK.",
+    "udp": "UDP sends datagrams without a handshake or a connection.",
+    "oop": "OOP groups data and behaviour into classes and objects.",
+    "cpp": "C++ supports OOP with classes, and templates for generic code.",
+    "long": "A connection " + "filler words about networking in general " * 20,
+}
+
+@pytest.fixture
+def index():
+    return LexicalIndex.build(list(CORPUS), list(CORPUS.values()))
+
+def test_tokenize_keeps_language_names_and_drops_stopwords():
+    assert tokenize("What is C++ and C# in the OOP sense?") == ["c++", "c#", "oop", "sense"]
+
+def test_bm25_ranks_rarer_and_denser_matches_first(index):
+    ranked = [chunk_id for chunk_id, _ in index.search("tcp handshake connection", 5)]
+    # tcp matches all three terms; udp two; long only the common "connection" in a long chunk
+    assert ranked == ["tcp", "udp", "long"]
+
+def test_bm25_scores_match_the_formula(index):
+    [(chunk_id, score)] = index.search("templates", 1)
+    count, lengths = len(CORPUS), [len(tokenize(text)) for text in CORPUS.values()]
+    length = len(tokenize(CORPUS["cpp"]))
+    idf = math.log(1 + (count - 1 + 0.5) / (1 + 0.5))
+    norm = lexical_index.BM25_K1 * (1 - lexical_index.BM25_B + lexical_index.BM25_B * length / (sum(lengths) / count))
+    assert chunk_id == "cpp"
+    assert score == pytest.approx(idf * (lexical_index.BM25_K1 + 1) / (1 + norm), rel=1e-5)
+
+def test_chunks_without_query_terms_are_left_out(index):
+    assert index.search("quantum entanglement", 5) == []
+    assert [chunk_id for chunk_id, _ in index.search("oop", 5)] == ["oop", "cpp"]
+
+def test_rrf_fuses_bm25_with_a_vector_ranking(index):
+    lexical = [chunk_id for chunk_id, _ in index.search("oop classes", 5)]
+    assert lexical == ["oop", "cpp"]
+    vector = ["cpp", "udp", "tcp", "oop"]
+    fused = reciprocal_rank_fusion([vector, lexical], 4, with_scores=True)
+    # cpp: 1/61 + 1/62; oop: 1/64 + 1/61; udp: 1/62; tcp: 1/63
+    assert [chunk_id for chunk_id, _ in fused] == ["cpp", "oop", "udp", "tcp"]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+    assert fused[1][1] == pytest.approx(1 / 64 + 1 / 61)
+
+def test_rrf_keeps_the_first_lists_object_for_duplicates():
+    vector = [{"id": "a", "from": "vector"}, {"id": "b", "from": "vector"}]
+    lexical = [{"id": "b", "from": "lexical"}]
+    fused = reciprocal_rank_fusion([vector, lexical], 2, key=lambda item: item["id"])
+    assert fused == [{"id": "b", "from": "vector"}, {"id": "a", "from": "vector"}]
@@ -0,0 +1,125 @@
+import os
+import sys
+import time
+
+import groq
+import pytest
+
+import llm_gateway
+from llm_gateway import AdaptiveLimiter, LLMGateway, LLMUnavailable
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from groq_stub import start_stub
+
+MESSAGES = [{"role": "user", "content": "Explain photosynthesis"}]
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    # Keep the jitter small; Retry-After from the stub (0.2s) still applies
+    monkeypatch.setattr(llm_gateway, "BACKOFF_BASE", 0.01)
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**options):
+        server, state = start_stub(latency_ms=0, **options)
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}", state
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+def make_gateway(base_url, **options):
+    # A huge spike factor keeps sub-millisecond latency jitter from moving the limit
+    limiter = options.pop("limiter", None) or AdaptiveLimiter(initial=4, maximum=8, spike_factor=1000)
+    return LLMGateway(api_key="test", base_url=base_url, limiter=limiter, requests_per_minute=0,
+                      tokens_per_minute=0, **dict({"max_retries": 2, "queue_timeout": 1}, **options))
+
+def test_complete_returns_the_completion(stub):
+    base_url, state = stub()
+    gateway = make_gateway(base_url)
+    completion = gateway.complete(model="stub", messages=MESSAGES)
+    assert "Section 1" in completion.choices[0].message.content
+    assert gateway.counters["calls"] == 1
+    assert gateway.counters["completion_tokens"] > 0
+    assert gateway.limiter.in_flight == 0
+
+def test_429_is_retried_after_retry_after(stub):
+    base_url, state = stub(rate_limit_every=2)
+    gateway = make_gateway(base_url)
+    gateway.complete(model="stub", messages=MESSAGES)
+    started = time.monotonic()
+    gateway.complete(model="stub", messages=MESSAGES)
+    assert time.monotonic() - started >= 0.2
+    assert state.rate_limited == 1
+    assert gateway.counters["throttled"] == 1
+    assert gateway.counters["retries"] == 1
+
+def test_5xx_is_retried(stub):
+    base_url, state = stub(error_every=2)
+    gateway = make_gateway(base_url)
+    gateway.complete(model="stub", messages=MESSAGES)
+    gateway.complete(model="stub", messages=MESSAGES)
+    assert state.errors == 1
+    assert gateway.counters["errors"] == 1
+    assert gateway.counters["retries"] == 1
+
+def test_5xx_is_raised_once_retries_run_out(stub):
+    base_url, state = stub(error_every=1)
+    gateway = make_gateway(base_url, max_retries=1)
+    with pytest.raises(groq.InternalServerError):
+        gateway.complete(model="stub", messages=MESSAGES)
+    assert state.errors == 2
+    assert gateway.limiter.in_flight == 0
+
+def test_persistent_429_raises_llm_unavailable(stub):
+    base_url, state = stub(rate_limit_every=1)
+    gateway = make_gateway(base_url, max_retries=1)
+    with pytest.raises(LLMUnavailable) as raised:
+        gateway.complete(model="stub", messages=MESSAGES)
+    assert raised.value.retry_after == pytest.approx(0.2)
+    assert state.rate_limited == 2
+
+def test_stream_is_retried_and_releases_its_slot(stub):
+    base_url, state = stub(rate_limit_every=2)
+    gateway = make_gateway(base_url)
+    gateway.complete(model="stub", messages=MESSAGES)
+    text = "".join(gateway.stream(model="stub", messages=MESSAGES))
+    assert "Section 8" in text
+    assert state.rate_limited == 1
+    assert gateway.counters["throttled"] == 1
+    assert gateway.limiter.in_flight == 0
+
+def test_limiter_backs_off_on_429_and_recovers(stub):
+    base_url, state = stub(rate_limit_every=1)
+    limiter = AdaptiveLimiter(initial=8, maximum=8, spike_factor=1000, cooldown=0)
+    gateway = make_gateway(base_url, limiter=limiter, max_retries=0)
+    for _ in range(3):
+        with pytest.raises(LLMUnavailable):
+            gateway.complete(model="stub", messages=MESSAGES)
+    assert limiter.limit < 3
+    assert limiter.counters["decreases"] == 3
+
+    state.rate_limit_every = 0
+    for _ in range(100):
+        gateway.complete(model="stub", messages=MESSAGES)
+        if limiter.limit == limiter.maximum:
+            break
+    assert limiter.limit == limiter.maximum
+    assert limiter.counters["increases"] > 0
+
+def test_llm_unavailable_becomes_a_503(stub):
+    import rag_api
+
+    base_url, _ = stub(rate_limit_every=1)
+    gateway = make_gateway(base_url, max_retries=0)
+    with pytest.raises(LLMUnavailable) as raised:
+        gateway.complete(model="stub", messages=MESSAGES)
+    with rag_api.app.test_request_context():
+        response = rag_api.llm_unavailable_response(raised.value)
+    assert response.status_code == 503
+    # Whole seconds, rounded up so a client never retries straight away
+    assert response.headers["Retry-After"] == "1"
+    assert response.get_json()["success"] is False
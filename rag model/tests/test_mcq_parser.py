@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+import quiz_generation
+from mcq_parser import MCQStreamParser, parse_questions, resolve_answer
+
+def question(n, **fields):
+    return dict({"text": f"Question {n}?", "options": ["A) One", "B) Two", "C) Three", "D) Four"],
+                 "correctAnswer": "B) Two", "subtopic": "Loops"}, **fields)
+
+def completion(*items):
+    return json.dumps(list(items), indent=2)
+
+def texts(questions):
+    return [q["text"] for q in questions]
+
+def test_questions_split_across_chunks_are_parsed_once_complete():
+    content = "```json\n" + completion(question(1), question(2)) + "\n```"
+    parser = MCQStreamParser()
+    completed = []
+    for i in range(0, len(content), 7):
+        completed.extend(parser.feed(content[i:i + 7]))
+    assert texts(completed) == ["Question 1?", "Question 2?"]
+    assert parser.valid == 2 and parser.invalid == 0
+    assert not parser.truncated
+
+def test_each_question_is_returned_by_the_feed_that_closes_it():
+    content = completion(question(1), question(2))
+    cut = content.index("}") + 1
+    parser = MCQStreamParser()
+    assert texts(parser.feed(content[:cut - 1])) == []
+    assert texts(parser.feed(content[cut - 1:cut])) == ["Question 1?"]
+    assert texts(parser.feed(content[cut:])) == ["Question 2?"]
+
+def test_truncated_completion_keeps_finished_questions():
+    content = completion(question(1), question(2), question(3))
+    cut = content.index('"Question 3?"') + 5
+    parser = MCQStreamParser()
+    assert texts(parser.feed(content[:cut])) == ["Question 1?", "Question 2?"]
+    assert parser.truncated
+
+def test_braces_and_quotes_inside_strings_do_not_end_an_object():
+    tricky = question(1, text='What does "{x}" print in f"{x}}}"?')
+    assert texts(parse_questions(completion(tricky))) == ['What does "{x}" print in f"{x}}}"?']
+
+def test_malformed_object_is_dropped_and_its_neighbours_kept():
+    content = ('[' + json.dumps(question(1)) + ',\n{"text": "Broken?", "options": [A, B]},\n'
+               + json.dumps(question(3)) + ']')
+    parser = MCQStreamParser()
+    assert texts(parser.feed(content)) == ["Question 1?", "Question 3?"]
+    assert parser.invalid == 1
+    assert parser.errors[0].startswith("invalid JSON")
+
+def test_trailing_commas_are_tolerated():
+    raw = json.dumps(question(1))[:-1] + ",}"
+    raw = raw.replace('"D) Four"]', '"D) Four",]')
+    assert texts(parse_questions("[" + raw + "]")) == ["Question 1?"]
+
+@pytest.mark.parametrize("item, reason", [
+    (question(1, text=" "), "missing text"),
+    (question(1, options=["A) One", "B) Two", "C) Three"]), "options must be a list of 4"),
+    (question(1, options=["A) One", "", "C) Three", "D) Four"]), "empty option"),
+    (question(1, correctAnswer="E) Five"), "correctAnswer does not match an option"),
+    (question(1, subtopic=""), "missing subtopic"),
+])
+def test_invalid_questions_are_rejected_with_a_reason(item, reason):
+    parser = MCQStreamParser()
+    assert parser.feed(completion(item)) == []
+    assert parser.errors == [reason]
+
+def test_missing_subtopic_falls_back_to_the_default():
+    [parsed] = parse_questions(completion(question(1, subtopic=None)), default_subtopic="Recursion")
+    assert parsed["subtopic"] == "Recursion"
+
+@pytest.mark.parametrize("answer", ["B) Two", "B", "b)", "(B)", "Two", "b. two"])
+def test_answer_forms_resolve_to_the_option(answer):
+    assert resolve_answer(answer, ["A) One", "B) Two", "C) Three", "D) Four"]) == "B) Two"
+
+def test_options_given_as_an_object_are_labelled():
+    [parsed] = parse_questions(completion(question(1, options={"A": "One", "B": "Two", "C": "Three", "D": "Four"},
+                                                   correctAnswer="B")))
+    assert parsed["options"] == ["A) One", "B) Two", "C) Three", "D) Four"]
+    assert parsed["correctAnswer"] == "B) Two"
+
+def test_salvage_keeps_questions_from_truncated_and_failing_shards(monkeypatch):
+    truncated = completion(question(1), question(2), question(3))
+    truncated = truncated[:truncated.index('"Question 3?"')]
+
+    def failing():
+        yield completion(question(4))[:-1]
+        raise RuntimeError("connection reset")
+
+    def top_up():
+        yield completion(question(5), question(6))
+
+    streams = [lambda: iter([truncated]), failing, top_up]
+
+    def fake_stream(model, prompt, count):
+        return streams.pop(0)()
+
+    monkeypatch.setattr(quiz_generation, "_stream", fake_stream)
+    monkeypatch.setattr(quiz_generation, "CONCURRENCY", 1)  # shards start in order
+    shards = [{"subtopic": "Loops", "count": 3, "chunks": []}, {"subtopic": "Loops", "count": 1, "chunks": []}]
+    questions, stats = quiz_generation.generate_questions(shards, 4, "Python", "python.pdf", "easy", "recall", "stub")
+    assert texts(questions) == ["Question 1?", "Question 2?", "Question 4?", "Question 5?"]
+    assert stats["salvaged_shards"] == 2
+    assert stats["failed_shards"] == 0
+    assert stats["top_up_rounds"] == 1
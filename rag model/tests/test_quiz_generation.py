@@ -0,0 +1,20 @@
+import quiz_generation
+from quiz_generation import plan_shards, assign_contexts
+
+def test_plan_shards_splits_into_shard_sized_pieces():
+    shards = plan_shards(12, "loops")
+    assert sum(shard["count"] for shard in shards) == 12
+    assert all(0 < shard["count"] <= quiz_generation.SHARD_SIZE for shard in shards)
+
+def test_plan_shards_spreads_over_subtopics():
+    shards = plan_shards(3, subtopics=["a", "b", "c", "d"])
+    assert [shard["subtopic"] for shard in shards] == ["a", "b", "c"]
+
+def test_plan_shards_without_questions_is_empty():
+    assert plan_shards(0, "loops") == []
+    assert plan_shards(-3, "loops") == []
+
+def test_assign_contexts_on_no_shards_does_not_retrieve():
+    def retrieve_many(queries, k):
+        raise AssertionError("nothing to retrieve")
+    assert assign_contexts([], "topic", "doc.pdf", retrieve_many) == []
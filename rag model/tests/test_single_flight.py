@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+def test_followers_share_the_leaders_result():
+    group = SingleFlight()
+    flight, leader = group.join("generate-answer", "key")
+    assert leader
+    results = []
+    followers = []
+    for _ in range(3):
+        follower, is_leader = group.join("generate-answer", "key")
+        assert not is_leader and follower is flight
+        thread = threading.Thread(target=lambda f=follower: results.append(f.wait(timeout=5)))
+        thread.start()
+        followers.append(thread)
+    flight.resolve(("body", 200, []))
+    for thread in followers:
+        thread.join()
+    assert results == [("result", ("body", 200, []))] * 3
+    stats = group.stats()
+    assert stats["endpoints"]["generate-answer"]["flights"] == 1
+    assert stats["upstream_calls_saved"] == 3
+    assert stats["in_flight"] == 0
+    # The flight is over: the next request computes again
+    assert group.join("generate-answer", "key")[1]
+
+def test_leader_error_is_raised_in_every_follower():
+    group = SingleFlight()
+    flight, _ = group.join("generate-quiz", "key")
+    follower, _ = group.join("generate-quiz", "key")
+    flight.fail(RuntimeError("groq down"))
+    with pytest.raises(RuntimeError, match="groq down"):
+        follower.wait(timeout=5)
+    assert group.stats()["endpoints"]["generate-quiz"]["errors"] == 1
+
+def test_stream_is_replayed_to_late_subscribers():
+    group = SingleFlight()
+    flight, _ = group.join("generate-answer", "key")
+    release = threading.Event()
+
+    def events():
+        yield "sources"
+        release.wait(5)
+        yield "token"
+        yield "done"
+
+    leader_events = flight.stream(events())
+    follower, _ = group.join("generate-answer", "key")
+    kind, follower_events = follower.wait(timeout=5)
+    assert kind == "stream"
+    release.set()
+    assert list(leader_events) == ["sources", "token", "done"]
+    assert list(follower_events) == ["sources", "token", "done"]
+
+def test_stream_error_propagates_to_subscribers():
+    group = SingleFlight()
+    flight, _ = group.join("generate-answer", "key")
+
+    def events():
+        yield "sources"
+        raise ValueError("stream broke")
+
+    subscription = flight.stream(events())
+    assert next(subscription) == "sources"
+    with pytest.raises(ValueError, match="stream broke"):
+        next(subscription)
+
+def test_pending_follower_keeps_the_stream_alive():
+    group = SingleFlight()
+    flight, _ = group.join("generate-answer", "key")
+    release = threading.Event()
+
+    def events():
+        yield "sources"
+        release.wait(5)
+        yield "done"
+
+    leader_events = flight.stream(events())
+    # Joined but not subscribed yet when the leader's client goes away
+    follower, _ = group.join("generate-answer", "key")
+    assert next(leader_events) == "sources"
+    leader_events.close()
+    assert not flight.cancelled
+    kind, follower_events = follower.wait(timeout=5)
+    release.set()
+    assert kind == "stream"
+    assert list(follower_events) == ["sources", "done"]
+    assert group.stats()["endpoints"]["generate-answer"]["cancelled"] == 0
+
+def test_stream_is_cancelled_when_every_subscriber_leaves():
+    group = SingleFlight()
+    flight, _ = group.join("generate-answer", "key")
+    closed = threading.Event()
+    release = threading.Event()
+
+    def events():
+        try:
+            yield "sources"
+            release.wait(5)
+            yield "token"
+            yield "done"
+        finally:
+            closed.set()
+
+    subscription = flight.stream(events())
+    assert next(subscription) == "sources"
+    subscription.close()
+    assert flight.cancelled
+    # A new request must not replay the cancelled stream
+    assert group.join("generate-answer", "key")[1]
+    release.set()
+    # The upstream generator is closed once the pump sees the cancellation
+    assert closed.wait(5)
+    assert group.stats()["endpoints"]["generate-answer"]["cancelled"] == 1
+
+def test_follower_gives_up_on_a_stuck_leader():
+    group = SingleFlight()
+    group.join("generate-quiz", "key")
+    follower, _ = group.join("generate-quiz", "key")
+    started = time.perf_counter()
+    assert follower.wait(timeout=0.1) is None
+    assert time.perf_counter() - started < 2
+    stats = group.stats()
+    assert stats["endpoints"]["generate-quiz"]["recomputed"] == 1
+    assert stats["upstream_calls_saved"] == 0
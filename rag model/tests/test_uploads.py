@@ -0,0 +1,54 @@
+import io
+import threading
+
+import pytest
+
+import uploads
+from uploads import UploadError
+
+class SlowStream:
+    """A request body that hands out its first block, then waits to be released"""
+
+    def __init__(self, data):
+        self.blocks = [data[:4], data[4:]]
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def read(self, size):
+        if not self.blocks:
+            return b""
+        if len(self.blocks) == 1:
+            self.started.set()
+            self.release.wait(5)
+        return self.blocks.pop(0)
+
+@pytest.fixture(autouse=True)
+def upload_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(uploads, "UPLOAD_TMP_DIR", str(tmp_path))
+
+def test_chunks_append_and_resume_from_the_received_offset():
+    session = uploads.create_session("notes.pdf", 10)
+    upload_id = session["upload_id"]
+    assert uploads.append_chunk(upload_id, 0, io.BytesIO(b"hello"), 5)["received"] == 5
+    with pytest.raises(UploadError) as raised:
+        uploads.append_chunk(upload_id, 0, io.BytesIO(b"hello"), 5)
+    assert raised.value.status == 409
+    assert raised.value.details["received"] == 5
+    assert uploads.append_chunk(upload_id, 5, io.BytesIO(b"world"), 5)["received"] == 10
+
+def test_retry_while_the_first_attempt_is_writing_gets_a_409():
+    upload_id = uploads.create_session("notes.pdf", 8)["upload_id"]
+    slow = SlowStream(b"abcdefgh")
+    results = {}
+    first = threading.Thread(target=lambda: results.update(first=uploads.append_chunk(upload_id, 0, slow, 8)))
+    first.start()
+    assert slow.started.wait(5)
+    with pytest.raises(UploadError) as raised:
+        uploads.append_chunk(upload_id, 0, io.BytesIO(b"abcdefgh"), 8)
+    assert raised.value.status == 409
+    slow.release.set()
+    first.join(5)
+    assert results["first"]["received"] == 8
+    _, part_path = uploads._session_paths(upload_id)
+    with open(part_path, "rb") as f:
+        assert f.read() == b"abcdefgh"
@@ -0,0 +1,258 @@
+"""
+Per-stage latency tracing and Prometheus metrics for the RAG API.
+
+A request gets a Trace (rag_api's before_request hook) and code on its path
+times its stages with
+
+    with tracing.stage("vector_search"):
+        ...
+
+Stages: model_load, vector_store_open, pregenerated_lookup, retrieval
+(embed_query, vector_search, lexical_search and fetch_chunks inside it),
+context_packing, cache_lookup, prompt_build, llm (llm_first_token for
+streams), parse_output, cache_store. A stage entered several times in one
+request, or by parallel quiz shards, adds up.
+
+When the request finishes its stage times go to:
+- the response, under "debug", if the client asked for it (?debug=1,
+  X-RAG-Debug: 1 or "debug": true in the JSON body)
+- a structured log, one JSON line per request, with RAG_TRACE_LOG=true
+  (stdout, or the file RAG_TRACE_LOG_PATH)
+- histograms per endpoint and stage, served with cache, queue and LLM token
+  counters by /api/rag/metrics in Prometheus text format (RAG_METRICS)
+
+With metrics and the log off and no debug flag, no Trace is created and
+stage() returns a shared no-op context manager: one ContextVar lookup.
+Metrics are kept per process: with several gunicorn workers, each scrape
+reports the worker that answered it, which is what Prometheus' rate() and
+histogram_quantile() over repeated scrapes average out.
+
+Cold start is tracked as seconds from process start to "imported" (rag_api
+loaded), "ready" (model and indexes warm) and "first_query" (the first
+request that retrieved and succeeded): logged once each, shown by
+/api/rag/health and exported as rag_startup_seconds.
+"""
+
+import os
+import sys
+import json
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import nullcontext
+from datetime import datetime, timezone
+
+METRICS_ENABLED = os.getenv("RAG_METRICS", "true").lower() != "false"
+TRACE_LOG = os.getenv("RAG_TRACE_LOG", "false").lower() != "false"
+TRACE_LOG_PATH = os.getenv("RAG_TRACE_LOG_PATH")
+# Seconds; wide enough for a 1ms cache hit and a 60s quiz
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Endpoint label for stages timed outside a request (warm-up, ingestion jobs)
+BACKGROUND = "background"
+
+_NOOP = nullcontext()
+_current = contextvars.ContextVar("rag_trace", default=None)
+
+class Histogram:
+    """Cumulative-bucket histogram per label tuple, rendered in Prometheus text format"""
+
+    def __init__(self, name, help_text, label_names, buckets=BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for labels, (counts, total, count) in sorted(series.items()):
+            base = _labels(self.label_names, labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{base},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{base}}} {total:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {count}")
+        return lines
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+STAGE_SECONDS = Histogram("rag_stage_duration_seconds", "Time spent in each stage of a request",
+                          ("endpoint", "stage"))
+REQUEST_SECONDS = Histogram("rag_request_duration_seconds", "Request latency (streams: until the last event)",
+                            ("endpoint", "status"))
+
+class Trace:
+    """Stage timings of one request"""
+
+    def __init__(self, endpoint, debug=False):
+        self.endpoint = endpoint
+        self.debug = debug
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.finished = False
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def timings(self):
+        """Stage times in ms, plus the time so far as total_ms"""
+        with self._lock:
+            timings = {f"{name}_ms": round(seconds * 1000, 2) for name, seconds in self.stages.items()}
+        timings["total_ms"] = round((time.perf_counter() - self.started) * 1000, 2)
+        return timings
+
+    def finish(self, status):
+        """Record the request once; streams call this when the last event has been sent"""
+        if self.finished:
+            return
+        self.finished = True
+        total = time.perf_counter() - self.started
+        if "first_query" not in _startup and status < 400 and "retrieval" in self.stages:
+            mark_startup("first_query")
+        if METRICS_ENABLED:
+            with self._lock:
+                stages = list(self.stages.items())
+            for name, seconds in stages:
+                STAGE_SECONDS.observe((self.endpoint, name), seconds)
+            REQUEST_SECONDS.observe((self.endpoint, str(status)), total)
+        if TRACE_LOG:
+            _log({"ts": datetime.now(timezone.utc).isoformat(), "endpoint": self.endpoint,
+                  "status": status, **self.timings()})
+
+class _Stage:
+    __slots__ = ("trace", "name", "started")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        if self.trace is not None:
+            self.trace.add(self.name, elapsed)
+        else:
+            STAGE_SECONDS.observe((BACKGROUND, self.name), elapsed)
+        return False
+
+_log_lock = threading.Lock()
+
+def _log(record):
+    line = json.dumps(record, default=str)
+    with _log_lock:
+        if TRACE_LOG_PATH:
+            with open(TRACE_LOG_PATH, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+        else:
+            print(f"[TRACE] {line}", file=sys.stdout, flush=True)
+
+def begin(endpoint, debug=False):
+    """Start tracing the current request; returns the Trace, or None when nothing would use it"""
+    trace = Trace(endpoint, debug) if (METRICS_ENABLED or TRACE_LOG or debug) else None
+    _current.set(trace)
+    return trace
+
+def current():
+    return _current.get()
+
+def end(status):
+    """Finish the current request's trace and detach it from this thread/greenlet"""
+    trace = _current.get()
+    if trace is not None:
+        trace.finish(status)
+        _current.set(None)
+
+def _process_start():
+    """Wall-clock time this process started (from /proc on Linux, else when tracing was imported)"""
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the command name; starttime is field 22 of the full line
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return time.time()
+
+# serve.py passes its own start time to the gunicorn workers it forks
+PROCESS_START = float(os.getenv("RAG_PROCESS_START") or _process_start())
+_startup = {}
+
+def mark_startup(event):
+    """Record the first time the process reaches a startup milestone"""
+    if event in _startup:
+        return
+    seconds = round(time.time() - PROCESS_START, 3)
+    if _startup.setdefault(event, seconds) == seconds:
+        print(f"[TRACE] Process start to {event}: {seconds}s")
+
+def startup_times():
+    """Seconds from process start to each milestone reached so far"""
+    return dict(_startup)
+
+def request_debug(endpoint):
+    """The client asked for timings after the request started (e.g. "debug": true in its body)"""
+    trace = _current.get()
+    if trace is None:
+        trace = begin(endpoint, debug=True)
+    trace.debug = True
+
+def stage(name):
+    """Context manager timing a stage of the current request (or a background stage)"""
+    trace = _current.get()
+    if trace is not None:
+        return _Stage(trace, name)
+    if METRICS_ENABLED:
+        return _Stage(None, name)
+    return _NOOP
+
+def debug_timings():
+    """The current request's timings if the client asked for them, else None"""
+    trace = _current.get()
+    return trace.timings() if trace is not None and trace.debug else None
+
+def render_metrics(gauges=()):
+    """
+    Prometheus text exposition: the stage and request histograms plus
+    gauges, an iterable of (name, help, type, [(labels dict, value)]).
+    """
+    lines = REQUEST_SECONDS.render() + STAGE_SECONDS.render()
+    gauges = list(gauges) + [("rag_startup_seconds", "Seconds from process start to each startup milestone",
+                               "gauge", [({"event": event}, value) for event, value in _startup.items()])]
+    for name, help_text, metric_type, samples in gauges:
+        samples = [(labels, value) for labels, value in samples if value is not None]
+        if not samples:
+            continue
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+        for labels, value in samples:
+            label_text = _labels(labels.keys(), labels.values())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,311 @@
+"""
+Streaming and resumable uploads for the RAG API.
+
+Multipart uploads: UploadRequest makes Werkzeug write every file part
+straight into a HashingUpload, a temp file in pdfs/.uploads that hashes the
+bytes as they arrive and rejects the request with 413 the moment it passes
+the size limit. Nothing is buffered in memory, and a rejected or abandoned
+upload never leaves a file behind (Request.close() discards it).
+
+Resumable uploads, for textbooks too large or connections too flaky for one
+request:
+    POST /api/rag/uploads {filename, size, sha256 (optional)} -> upload_id
+    PUT  /api/rag/uploads/<id>?offset=N  (raw bytes, N = bytes received so far)
+    GET  /api/rag/uploads/<id>           -> received, to resume after a failure
+    POST /api/rag/uploads/<id>/complete
+Session state is the part file itself plus a small JSON file, so uploads
+resume across server restarts. A request writing or completing an upload
+holds an flock on its part file, so a retried chunk arriving while the first
+attempt is still streaming gets a 409 instead of writing alongside it. Sessions idle for RAG_UPLOAD_SESSION_TTL_HOURS
+are removed.
+
+Either way, finalize() de-duplicates by content hash against the document
+catalog (an identical file already uploaded under any name is returned
+instead of being stored again) and moves the temp file into place with an
+atomic rename. It holds an O_EXCL lockfile on the content hash while doing
+so, so concurrent uploads of the same file in different worker processes
+store it once.
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from contextlib import contextmanager
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+from document_catalog import DOCUMENT_DIR, get_document_catalog
+
+try:
+    import fcntl
+except ImportError:  # Windows, where serve.py runs a single process
+    fcntl = None
+
+UPLOAD_TMP_DIR = os.path.join(DOCUMENT_DIR, '.uploads')
+MAX_FILE_SIZE = int(float(os.getenv("RAG_MAX_FILE_SIZE_MB", "16")) * 1024 * 1024)
+MAX_RESUMABLE_SIZE = int(float(os.getenv("RAG_MAX_RESUMABLE_SIZE_MB", "512")) * 1024 * 1024)
+# Chunks are single requests, so they stay under the request size limit (MAX_FILE_SIZE)
+CHUNK_SIZE = min(int(float(os.getenv("RAG_UPLOAD_CHUNK_SIZE_MB", "8")) * 1024 * 1024), MAX_FILE_SIZE)
+SESSION_TTL = float(os.getenv("RAG_UPLOAD_SESSION_TTL_HOURS", "24")) * 3600
+READ_BLOCK = 1024 * 1024
+# A hash lock older than this was left behind by a crashed worker
+HASH_LOCK_STALE_SECONDS = 60
+
+class UploadError(Exception):
+    """A resumable upload request that can't be applied; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+class HashingUpload:
+    """Writable temp file that hashes and size-checks everything written to it"""
+
+    def __init__(self, limit=MAX_FILE_SIZE, directory=UPLOAD_TMP_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{uuid.uuid4().hex}.tmp")
+        self.limit = limit
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._file = open(self.path, 'w+b')
+        self._committed = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.limit and self.size > self.limit:
+            self.discard()
+            raise RequestEntityTooLarge(f"File too large. Maximum size is {self.limit / (1024 * 1024):g}MB")
+        self._digest.update(data)
+        return self._file.write(data)
+
+    @property
+    def sha256(self):
+        return self._digest.hexdigest()
+
+    def commit(self, destination):
+        """Atomically move the finished file to destination"""
+        self._file.close()
+        os.replace(self.path, destination)
+        self._committed = True
+
+    def discard(self):
+        """Close and delete the temp file unless it was committed"""
+        if not self._file.closed:
+            self._file.close()
+        if not self._committed:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self._committed = True  # nothing left to discard
+
+    def __getattr__(self, name):
+        # read/seek/flush etc. for Werkzeug's parser and FileStorage
+        return getattr(self._file, name)
+
+class UploadRequest(Request):
+    """Flask request class that streams uploaded files into HashingUploads"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        stream = HashingUpload()
+        self.__dict__.setdefault("_hashing_uploads", []).append(stream)
+        return stream
+
+    def close(self):
+        super().close()
+        for stream in self.__dict__.get("_hashing_uploads", ()):
+            stream.discard()
+
+@contextmanager
+def _hash_lock(content_hash):
+    """Lock one content hash across threads and processes with an O_EXCL lockfile"""
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    path = os.path.join(UPLOAD_TMP_DIR, f"{content_hash}.lock")
+    while True:
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > HASH_LOCK_STALE_SECONDS:
+                    os.remove(path)
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def finalize(filename, commit, content_hash, destination_dir=DOCUMENT_DIR):
+    """
+    Store an uploaded file unless an identical one already exists.
+    commit(path) moves the finished upload to path. Returns the existing
+    document's name if the content is a duplicate (whatever its ingest
+    status), else None after storing it.
+    """
+    with _hash_lock(content_hash):
+        existing = get_document_catalog().find_by_hash(content_hash)
+        if existing is not None:
+            return existing
+        commit(os.path.join(destination_dir, filename))
+        return None
+
+# -- resumable sessions ---------------------------------------------------------
+
+def _session_paths(upload_id):
+    if not upload_id or not all(c in "0123456789abcdef" for c in upload_id):
+        raise UploadError("Unknown upload", 404)
+    base = os.path.join(UPLOAD_TMP_DIR, upload_id)
+    return base + ".json", base + ".part"
+
+def _load_session(upload_id):
+    meta_path, part_path = _session_paths(upload_id)
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            session = json.load(f)
+    except (FileNotFoundError, ValueError):
+        raise UploadError("Unknown upload", 404)
+    try:
+        session["received"] = os.path.getsize(part_path)
+    except FileNotFoundError:
+        session["received"] = 0
+    return session
+
+def _remove_session(upload_id):
+    for path in _session_paths(upload_id):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+_busy_uploads = set()
+_busy_lock = threading.Lock()
+
+@contextmanager
+def _exclusive(upload_id, part_file):
+    """Hold an upload's part file; UploadError 409 if another request holds it"""
+    if fcntl is not None:
+        try:
+            fcntl.flock(part_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadError("Another request is writing this upload", 409,
+                              received=os.fstat(part_file.fileno()).st_size)
+        try:
+            yield
+        finally:
+            fcntl.flock(part_file, fcntl.LOCK_UN)
+        return
+    with _busy_lock:
+        if upload_id in _busy_uploads:
+            raise UploadError("Another request is writing this upload", 409,
+                              received=os.fstat(part_file.fileno()).st_size)
+        _busy_uploads.add(upload_id)
+    try:
+        yield
+    finally:
+        with _busy_lock:
+            _busy_uploads.discard(upload_id)
+
+def expire_sessions(now=None):
+    """Drop sessions (and stray temp files) idle for longer than SESSION_TTL"""
+    now = now or time.time()
+    try:
+        entries = list(os.scandir(UPLOAD_TMP_DIR))
+    except FileNotFoundError:
+        return 0
+    removed = 0
+    for entry in entries:
+        try:
+            if now - entry.stat().st_mtime > SESSION_TTL:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+def create_session(filename, size, sha256=None):
+    if size <= 0:
+        raise UploadError("size must be positive")
+    if size > MAX_RESUMABLE_SIZE:
+        raise UploadError(f"File too large. Maximum size is {MAX_RESUMABLE_SIZE / (1024 * 1024):g}MB", 413)
+    expire_sessions()
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    upload_id = uuid.uuid4().hex
+    meta_path, part_path = _session_paths(upload_id)
+    session = {"upload_id": upload_id, "filename": filename, "size": size,
+               "sha256": (sha256 or "").lower() or None, "created_at": time.time()}
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(session, f)
+    open(part_path, 'wb').close()
+    return dict(session, received=0, chunk_size=CHUNK_SIZE)
+
+def session_status(upload_id):
+    return dict(_load_session(upload_id), chunk_size=CHUNK_SIZE)
+
+def append_chunk(upload_id, offset, stream, content_length):
+    """
+    Append the request body at offset, which must equal the bytes received
+    so far (a retried chunk answers 409 with the offset to resume from).
+    """
+    session = _load_session(upload_id)
+    _, part_path = _session_paths(upload_id)
+    written = 0
+    try:
+        f = open(part_path, 'r+b')
+    except FileNotFoundError:
+        raise UploadError("Unknown upload", 404)
+    with f, _exclusive(upload_id, f):
+        # Checked under the lock: a concurrent attempt may have moved the offset on
+        session["received"] = os.fstat(f.fileno()).st_size
+        if offset != session["received"]:
+            raise UploadError("Offset does not match the bytes received", 409, received=session["received"])
+        if content_length is not None and offset + content_length > session["size"]:
+            raise UploadError("Chunk runs past the declared size", 413, received=session["received"])
+        f.seek(offset)
+        try:
+            while True:
+                block = stream.read(READ_BLOCK)
+                if not block:
+                    break
+                if offset + written + len(block) > session["size"]:
+                    raise UploadError("Chunk runs past the declared size", 413)
+                f.write(block)
+                written += len(block)
+        finally:
+            # Keep only whole writes; a broken connection resumes from what reached the disk
+            f.truncate(offset + written)
+    return dict(session, received=offset + written)
+
+def complete_session(upload_id):
+    """
+    Verify a fully received upload and hand it to finalize().
+    Returns (filename, duplicate_of, session).
+    """
+    session = _load_session(upload_id)
+    _, part_path = _session_paths(upload_id)
+    try:
+        f = open(part_path, 'rb')
+    except FileNotFoundError:
+        raise UploadError("Unknown upload", 404)
+    with f, _exclusive(upload_id, f):
+        session["received"] = os.fstat(f.fileno()).st_size
+        if session["received"] != session["size"]:
+            raise UploadError("Upload is incomplete", 409, received=session["received"])
+        digest = hashlib.sha256()
+        for block in iter(lambda: f.read(READ_BLOCK), b''):
+            digest.update(block)
+        content_hash = digest.hexdigest()
+        if session["sha256"] and session["sha256"] != content_hash:
+            _remove_session(upload_id)
+            raise UploadError("Content hash does not match the declared sha256", 422)
+        duplicate_of = finalize(session["filename"], lambda path: os.replace(part_path, path), content_hash)
+        _remove_session(upload_id)
+    return session["filename"], duplicate_of, dict(session, sha256=content_hash)
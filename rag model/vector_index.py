@@ -0,0 +1,353 @@
+"""
+Compact memory-mapped vector index per document, the alternative retrieval
+backend to Chroma (RAG_VECTOR_BACKEND=mmap).
+
+Chroma keeps a per-process copy of every collection it has touched (HNSW
+graph plus float32 vectors), so each API worker's memory grows with the
+corpus. Here a document's vectors sit in one contiguous .npy file opened
+with np.load(mmap_mode="r"): every worker maps the same pages and the OS page
+cache holds them once. Vectors are stored as int8 with a float32 scale per
+vector (RAG_VECTOR_DTYPE=int8, a quarter of the size) or as float32.
+
+Search is exact, vectorized NumPy over the whole matrix for small documents;
+documents with RAG_VECTOR_IVF_MIN vectors or more also get an IVF partition
+(k-means centroids, vectors stored grouped by their nearest centroid) and
+only the RAG_VECTOR_IVF_PROBES nearest partitions are scanned.
+
+Distances are squared L2 like Chroma's default space, and an index answers
+collection.query() / collection.get() with Chroma-shaped results, so
+retrieve.py uses it wherever it would use the document's collection.
+Chroma stays the store of record: ingest_pdfs writes both, and builds this
+index from the collection for documents indexed before it existed.
+
+On disk, in chroma_db/vectors/:
+- <collection name>.json: format, dtype, counts and the data directory in use
+- <collection name>-<build>/: vectors.npy, scales.npy (int8), norms.npy,
+  ids.npy, offsets.npy and chunks.bin (chunk texts, then their metadata as
+  JSON, at the byte offsets in offsets.npy), centroids.npy and lists.npy (IVF)
+A rebuild writes a new data directory and then swaps the .json pointer, so
+readers never see a half-written index and keep their old mapping until done.
+"""
+
+import os
+import json
+import mmap
+import time
+import uuid
+import shutil
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Inside chroma_db so it is copied and deleted together with the Chroma store
+VECTOR_DIR = os.path.join(os.path.dirname(__file__), 'chroma_db', 'vectors')
+INDEX_VERSION = 1
+VECTOR_DTYPE = os.getenv("RAG_VECTOR_DTYPE", "int8")
+# Documents with at least this many vectors get an IVF partition
+IVF_MIN_VECTORS = int(os.getenv("RAG_VECTOR_IVF_MIN", "20000"))
+IVF_PROBES = int(os.getenv("RAG_VECTOR_IVF_PROBES", "16"))
+IVF_TRAIN_ITERATIONS = 10
+# Rows scored per NumPy call during a brute-force scan (bounds temporary memory)
+SCAN_BLOCK = 8192
+# Indexes kept mapped in memory
+MAX_LOADED = int(os.getenv("RAG_VECTOR_CACHE_SIZE", "64"))
+
+def quantize(vectors):
+    """int8 vectors and the float32 scale of each (vector ~= q * scale)"""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.rint(vectors / scales[:, None]).clip(-127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+def _squared_distances(vectors, norms, centroids):
+    """Squared L2 distances between rows and centroids without materializing differences"""
+    return norms[:, None] - 2.0 * (vectors @ centroids.T) + (centroids * centroids).sum(axis=1)[None, :]
+
+def train_ivf(vectors, lists, seed=0):
+    """
+    k-means centroids (lists x dim) from a sample of the vectors and the
+    partition of every vector. Returns (centroids, assignment).
+    """
+    rng = np.random.default_rng(seed)
+    count = len(vectors)
+    sample = vectors[np.sort(rng.choice(count, min(count, lists * 64), replace=False))]
+    sample_norms = (sample * sample).sum(axis=1)
+    centroids = sample[rng.choice(len(sample), lists, replace=False)].copy()
+    for _ in range(IVF_TRAIN_ITERATIONS):
+        assignment = _squared_distances(sample, sample_norms, centroids).argmin(axis=1)
+        sizes = np.bincount(assignment, minlength=lists)
+        empty = sizes == 0
+        # Per-partition sums in one pass over the sample sorted by partition
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        sums = np.zeros_like(centroids)
+        sums[~empty] = np.add.reduceat(sample[np.argsort(assignment, kind="stable")], starts[~empty], axis=0)
+        centroids = sums / np.maximum(sizes, 1)[:, None]
+        # Restart empty partitions from random sample points
+        centroids[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+    norms = (vectors * vectors).sum(axis=1)
+    assignment = np.concatenate([
+        _squared_distances(vectors[i:i + SCAN_BLOCK], norms[i:i + SCAN_BLOCK], centroids).argmin(axis=1)
+        for i in range(0, count, SCAN_BLOCK)
+    ])
+    return centroids.astype(np.float32), assignment
+
+def _top_k(distances, rows, k):
+    """(rows, distances) of the k smallest distances, nearest first"""
+    if len(distances) > k:
+        keep = np.argpartition(distances, k - 1)[:k]
+        distances, rows = distances[keep], rows[keep]
+    order = np.argsort(distances, kind="stable")
+    return rows[order], distances[order]
+
+# Arrays of an index, stored as <name>.npy; centroids and lists only with IVF, scales only for int8
+ARRAY_NAMES = ("vectors", "scales", "norms", "ids", "offsets", "centroids", "lists")
+
+class VectorIndex:
+    def __init__(self, info, arrays, chunks):
+        """
+        info: the index's info dict; arrays: ARRAY_NAMES -> NumPy arrays (memory-mapped
+        files, or views into index_snapshot's buffer); chunks: bytes-like texts and metadata
+        """
+        self.info = info
+        self.dtype = info["dtype"]
+        self.vectors = arrays["vectors"]
+        self.scales = arrays.get("scales") if self.dtype == "int8" else None
+        self.norms = arrays["norms"]
+        self.ids = arrays["ids"]
+        self.offsets = arrays["offsets"]
+        self.centroids = np.array(arrays["centroids"]) if info["lists"] else None
+        self.lists = np.array(arrays["lists"]) if info["lists"] else None
+        self._row_of = None
+        self._chunks = chunks
+
+    @classmethod
+    def open(cls, directory, info):
+        """Map an index written by write()"""
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+                  for name in ARRAY_NAMES if os.path.exists(os.path.join(directory, f"{name}.npy"))}
+        with open(os.path.join(directory, "chunks.bin"), 'rb') as f:
+            # mmap refuses empty files
+            chunks = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if info["count"] else b""
+        return cls(info, arrays, chunks)
+
+    @staticmethod
+    def write(directory, ids, embeddings, texts, metadatas, dtype=VECTOR_DTYPE, ivf_min=None):
+        """Write a complete index into a new directory; returns its info dict"""
+        info, arrays, chunks = VectorIndex.build(ids, embeddings, texts, metadatas, dtype, ivf_min)
+        os.makedirs(directory)
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, f"{name}.npy"), array)
+        with open(os.path.join(directory, "chunks.bin"), 'wb') as f:
+            f.write(chunks)
+        return info
+
+    @staticmethod
+    def build(ids, embeddings, texts, metadatas, dtype=VECTOR_DTYPE, ivf_min=None):
+        """(info, arrays, chunks) of an index over the given rows, in memory"""
+        ivf_min = IVF_MIN_VECTORS if ivf_min is None else ivf_min
+        if dtype not in ("int8", "float32"):
+            raise ValueError("dtype must be int8 or float32")
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        count, dim = vectors.shape
+        lists = 0
+        order = np.arange(count)
+        if count >= ivf_min and count >= 2:
+            lists = max(2, int(np.sqrt(count)))
+            centroids, assignment = train_ivf(vectors, lists)
+            order = np.argsort(assignment, kind="stable")
+            list_offsets = np.searchsorted(assignment[order], np.arange(lists + 1)).astype(np.int64)
+        vectors = vectors[order]
+
+        arrays = {}
+        if dtype == "int8":
+            quantized, scales = quantize(vectors)
+            arrays["vectors"] = quantized
+            arrays["scales"] = scales
+            # Norms of what is stored, so distances stay consistent with the scan
+            stored = quantized.astype(np.float32) * scales[:, None]
+        else:
+            arrays["vectors"] = vectors
+            stored = vectors
+        arrays["norms"] = (stored * stored).sum(axis=1).astype(np.float32)
+        arrays["ids"] = np.array([ids[i] for i in order], dtype="S")
+        if lists:
+            arrays["centroids"] = centroids
+            arrays["lists"] = list_offsets
+
+        blobs = [(texts[i] or "").encode("utf-8") for i in order]
+        blobs += [json.dumps(metadatas[i] or {}).encode("utf-8") for i in order]
+        offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+        np.cumsum([len(blob) for blob in blobs], out=offsets[1:])
+        arrays["offsets"] = offsets
+        info = {"version": INDEX_VERSION, "dtype": dtype, "dim": int(dim), "count": int(count),
+                "lists": lists, "built_at": time.time()}
+        return info, arrays, b"".join(blobs)
+
+    def count(self):
+        return self.info["count"]
+
+    def _blob(self, i):
+        return bytes(self._chunks[int(self.offsets[i]):int(self.offsets[i + 1])])
+
+    def text(self, row):
+        return self._blob(row).decode("utf-8")
+
+    def metadata(self, row):
+        return json.loads(self._blob(self.info["count"] + row))
+
+    def _scan(self, queries, query_norms, start, end):
+        """Squared L2 distances (rows x queries) of stored rows start..end"""
+        block = self.vectors[start:end]
+        if self.scales is not None:
+            dots = (block.astype(np.float32) @ queries.T) * self.scales[start:end, None]
+        else:
+            dots = block @ queries.T
+        return self.norms[start:end, None] - 2.0 * dots + query_norms[None, :]
+
+    def search(self, queries, k):
+        """Per query, (rows, squared L2 distances) of its k nearest stored vectors"""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.info["dim"])
+        query_norms = (queries * queries).sum(axis=1)
+        count = self.info["count"]
+        k = min(k, count)
+        if k <= 0:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in queries]
+
+        if self.lists is None:
+            candidates = [([], []) for _ in queries]
+            for start in range(0, count, SCAN_BLOCK):
+                end = min(start + SCAN_BLOCK, count)
+                distances = self._scan(queries, query_norms, start, end)
+                for q in range(len(queries)):
+                    rows, best = _top_k(distances[:, q], np.arange(start, end), k)
+                    candidates[q][0].append(rows)
+                    candidates[q][1].append(best)
+            return [_top_k(np.concatenate(best), np.concatenate(rows), k) for rows, best in candidates]
+
+        # IVF: scan only the partitions nearest to each query
+        probes = min(IVF_PROBES, len(self.centroids))
+        centroid_distances = _squared_distances(queries, query_norms, self.centroids)
+        results = []
+        for q in range(len(queries)):
+            nearest = np.argpartition(centroid_distances[q], probes - 1)[:probes]
+            rows, distances = [], []
+            for partition in nearest:
+                start, end = int(self.lists[partition]), int(self.lists[partition + 1])
+                if start < end:
+                    rows.append(np.arange(start, end))
+                    distances.append(self._scan(queries[q:q + 1], query_norms[q:q + 1], start, end)[:, 0])
+            if not rows:
+                results.append((np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)))
+                continue
+            results.append(_top_k(np.concatenate(distances), np.concatenate(rows), k))
+        return results
+
+    # -- Chroma collection interface used by retrieve.py ------------------------
+
+    def query(self, query_embeddings, n_results=10, where=None, include=("documents", "metadatas", "distances")):
+        if where:
+            raise ValueError("metadata filters are not supported by the mmap vector index")
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for rows, distances in self.search(query_embeddings, n_results):
+            result["ids"].append([self.ids[row].decode("ascii") for row in rows])
+            result["documents"].append([self.text(row) for row in rows])
+            result["metadatas"].append([self.metadata(row) for row in rows])
+            result["distances"].append([max(0.0, float(d)) for d in distances])
+        return result
+
+    def get(self, ids, include=("documents", "metadatas")):
+        if self._row_of is None:
+            self._row_of = {row_id.decode("ascii"): row for row, row_id in enumerate(self.ids)}
+        rows = [self._row_of[row_id] for row_id in ids if row_id in self._row_of]
+        return {"ids": [self.ids[row].decode("ascii") for row in rows],
+                "documents": [self.text(row) for row in rows],
+                "metadatas": [self.metadata(row) for row in rows]}
+
+def pointer_path(name):
+    """Pointer file for a collection name (retrieve.collection_name_for)"""
+    return os.path.join(VECTOR_DIR, f"{name}.json")
+
+def _read_pointer(name):
+    try:
+        with open(pointer_path(name), 'r', encoding='utf-8') as f:
+            info = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return info if info.get("version") == INDEX_VERSION else None
+
+def save_index(name, ids, embeddings, texts, metadatas, dtype=VECTOR_DTYPE):
+    """Build a document's index and switch readers to it; returns its info"""
+    os.makedirs(VECTOR_DIR, exist_ok=True)
+    data_dir = f"{name}-{uuid.uuid4().hex[:12]}"
+    info = VectorIndex.write(os.path.join(VECTOR_DIR, data_dir), ids, embeddings, texts, metadatas, dtype)
+    info["data"] = data_dir
+    previous = _read_pointer(name)
+    tmp_path = pointer_path(name) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    os.replace(tmp_path, pointer_path(name))
+    if previous and previous.get("data") != data_dir:
+        # Processes still mapping the old files keep them until they reload
+        shutil.rmtree(os.path.join(VECTOR_DIR, previous["data"]), ignore_errors=True)
+    return info
+
+def remove_index(name):
+    info = _read_pointer(name)
+    try:
+        os.remove(pointer_path(name))
+    except FileNotFoundError:
+        pass
+    if info and info.get("data"):
+        shutil.rmtree(os.path.join(VECTOR_DIR, info["data"]), ignore_errors=True)
+
+def has_index(name):
+    return os.path.exists(pointer_path(name))
+
+def indexed_names():
+    """Collection names that have a vector index on disk"""
+    try:
+        return {entry.name[:-5] for entry in os.scandir(VECTOR_DIR) if entry.name.endswith(".json")}
+    except FileNotFoundError:
+        return set()
+
+def disk_bytes(name):
+    """Size of a document's index files"""
+    info = _read_pointer(name)
+    if not info:
+        return 0
+    directory = os.path.join(VECTOR_DIR, info["data"])
+    return sum(entry.stat().st_size for entry in os.scandir(directory))
+
+# name -> (pointer signature, VectorIndex), most recently used last
+_loaded = OrderedDict()
+_loaded_lock = threading.Lock()
+
+def load_index(name):
+    """
+    The document's index, or None if it has none. Mapped once per process
+    and remapped when the pointer file changes (a rebuild).
+    """
+    try:
+        stat = os.stat(pointer_path(name))
+    except FileNotFoundError:
+        return None
+    signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    with _loaded_lock:
+        cached = _loaded.get(name)
+        if cached is not None and cached[0] == signature:
+            _loaded.move_to_end(name)
+            return cached[1]
+    info = _read_pointer(name)
+    if info is None:
+        return None
+    try:
+        index = VectorIndex.open(os.path.join(VECTOR_DIR, info["data"]), info)
+    except Exception as e:
+        print(f"[RETRIEVE] Could not load vector index {name}: {e}")
+        return None
+    with _loaded_lock:
+        _loaded[name] = (signature, index)
+        _loaded.move_to_end(name)
+        while len(_loaded) > MAX_LOADED:
+            _loaded.popitem(last=False)
+    return index
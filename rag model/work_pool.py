@@ -0,0 +1,81 @@
+"""
+Bounded pool for CPU-bound request work (query embedding, PDF parsing).
+
+Request handlers mostly wait on the network (Groq), so under the production
+server (serve.py) they run as gevent greenlets or in a large thread pool. The
+CPU-heavy parts are handed to this pool instead, which keeps their concurrency
+at RAG_CPU_WORKERS no matter how many requests are in flight. Under gevent the
+pool uses real OS threads, so a running embedding never blocks the event loop.
+
+Background ingestion gets a pool of its own from new_pool() (ingest_jobs.py),
+so a long ingest never holds the threads requests wait on.
+"""
+
+import os
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+CPU_WORKERS = int(os.getenv("RAG_CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _gevent_active():
+    try:
+        from gevent import monkey
+        return monkey.is_module_patched("socket")
+    except ImportError:
+        return False
+
+def new_pool(workers, name):
+    """A pool of workers real OS threads (gevent's ThreadPool when gevent is active)"""
+    if _gevent_active():
+        from gevent.threadpool import ThreadPool
+        return ThreadPool(workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = new_pool(CPU_WORKERS, "rag-cpu")
+        return _pool
+
+def run_blocking(fn, *args, **kwargs):
+    """
+    Run fn(*args, **kwargs) on the bounded CPU pool and wait for its result.
+    Runs in a copy of the caller's context, so the request's trace (tracing.py) sees its stages.
+    """
+    return run_in(_get_pool(), fn, *args, **kwargs)
+
+def run_in(pool, fn, *args, **kwargs):
+    """run_blocking on a pool from new_pool()"""
+    context = contextvars.copy_context()
+    if isinstance(pool, ThreadPoolExecutor):
+        return pool.submit(context.run, fn, *args, **kwargs).result()
+    return pool.apply(context.run, (fn,) + args, kwargs)
+
+def queue_depth():
+    """Tasks waiting for a CPU worker (None until the pool exists)"""
+    pool = _pool
+    if pool is None:
+        return None
+    # Neither pool type exposes its backlog publicly
+    if isinstance(pool, ThreadPoolExecutor):
+        return pool._work_queue.qsize()
+    task_queue = getattr(pool, "task_queue", None)
+    return task_queue.qsize() if task_queue is not None else None
+
+def shutdown():
+    """Stop the pool, letting queued work finish (called on graceful worker exit)"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is None:
+        return
+    if isinstance(pool, ThreadPoolExecutor):
+        pool.shutdown(wait=True)
+    else:
+        pool.join()
+        pool.kill()